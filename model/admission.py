@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+
+# Lower value is served first
+PRIORITIES = {'interactive': 0, 'bulk': 1}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; ``reason`` is rate_limited, queue_full or queue_timeout"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f'Request rejected: {reason}')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Spend one token; returns 0 if allowed, else seconds until a token is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets per (client, priority); the least recently seen buckets are evicted past ``max_clients``"""
+
+    def __init__(self, rates, max_clients=10000):
+        # priority -> (tokens per second, burst); a rate <= 0 means unlimited
+        self.rates = rates
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client, priority):
+        rate, burst = self.rates.get(priority, (0, 0))
+        if rate <= 0:
+            return
+        now = time.monotonic()
+        key = (client, priority)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, max(burst, 1), now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+        if wait:
+            raise AdmissionRejected('rate_limited', max(1, math.ceil(wait)))
+
+
+class _Waiter:
+    __slots__ = ('priority', 'wake', 'granted', 'cancelled')
+
+    def __init__(self, priority, wake):
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+    """Bounded, prioritized admission in front of upstream calls.
+
+    At most ``max_concurrent`` requests hold a slot; bulk requests may hold at
+    most ``bulk_share`` of them so interactive traffic always has headroom.
+    Up to ``max_queue`` more wait, interactive first, each for at most
+    ``max_wait[priority]`` seconds. Anything beyond that is rejected at once
+    with a Retry-After estimated from recent slot hold times. Works from
+    threads (``slot``) and from an asyncio loop (``slot_async``).
+    """
+
+    def __init__(self, max_concurrent, max_queue, max_wait, bulk_share=0.5, limiter=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.bulk_limit = max(1, int(max_concurrent * bulk_share))
+        self.limiter = limiter
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._active_bulk = 0
+        self._queued = 0
+        self._hold_time = 1.0
+        self.admitted = 0
+        self.rejected = {}
+
+    def _can_run(self, priority):
+        if self._active >= self.max_concurrent:
+            return False
+        return priority == PRIORITIES['interactive'] or self._active_bulk < self.bulk_limit
+
+    def _take_slot(self, priority):
+        self._active += 1
+        if priority != PRIORITIES['interactive']:
+            self._active_bulk += 1
+        self.admitted += 1
+
+    def _reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return AdmissionRejected(reason, self._retry_after())
+
+    def _retry_after(self):
+        return max(1, math.ceil(self._hold_time * (self._queued + 1) / self.max_concurrent))
+
+    def _enqueue(self, priority, wake):
+        """Take a slot now (returns None) or queue a waiter; raises when the queue is full"""
+        with self._lock:
+            # Drops abandoned waiters at the head so they can't block a free slot
+            self._grant_waiters()
+            ahead = self._waiters and self._waiters[0][0] <= priority
+            if not ahead and self._can_run(priority):
+                self._take_slot(priority)
+                return None
+            if self._queued >= self.max_queue:
+                raise self._reject('queue_full')
+            waiter = _Waiter(priority, wake)
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+            self._queued += 1
+            return waiter
+
+    def _grant_waiters(self):
+        while self._waiters:
+            waiter = self._waiters[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_run(waiter.priority):
+                return
+            heapq.heappop(self._waiters)
+            self._queued -= 1
+            self._take_slot(waiter.priority)
+            waiter.granted = True
+            waiter.wake()
+
+    def _abandon(self, waiter):
+        """Withdraw a waiter that gave up; returns True if it had been granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._queued -= 1
+            return False
+
+    def release(self, priority, held=None):
+        with self._lock:
+            self._active -= 1
+            if priority != PRIORITIES['interactive']:
+                self._active_bulk -= 1
+            if held is not None:
+                self._hold_time += 0.2 * (held - self._hold_time)
+            self._grant_waiters()
+
+    def check_rate(self, client, priority_name):
+        """Spend one of the client's rate-limit tokens, raising when it has none"""
+        if self.limiter is None:
+            return
+        try:
+            self.limiter.check(client, priority_name)
+        except AdmissionRejected:
+            with self._lock:
+                self.rejected['rate_limited'] = self.rejected.get('rate_limited', 0) + 1
+            raise
+
+    def acquire(self, priority_name):
+        priority = PRIORITIES.get(priority_name, PRIORITIES['interactive'])
+        granted = threading.Event()
+        waiter = self._enqueue(priority, granted.set)
+        if waiter is not None and not granted.wait(self.max_wait.get(priority_name, 0)):
+            if not self._abandon(waiter):
+                with self._lock:
+                    raise self._reject('queue_timeout')
+        return priority
+
+    async def acquire_async(self, priority_name):
+        priority = PRIORITIES.get(priority_name, PRIORITIES['interactive'])
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        waiter = self._enqueue(priority, wake)
+        if waiter is None:
+            return priority
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait.get(priority_name, 0))
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                with self._lock:
+                    raise self._reject('queue_timeout')
+        except asyncio.CancelledError:
+            # The caller went away; hand back a slot granted in the meantime
+            if self._abandon(waiter):
+                self.release(priority)
+            raise
+        return priority
+
+    @contextmanager
+    def slot(self, priority_name='interactive'):
+        priority = self.acquire(priority_name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(priority, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def slot_async(self, priority_name='interactive'):
+        priority = await self.acquire_async(priority_name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(priority, time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'activeBulk': self._active_bulk,
+                'queued': self._queued,
+                'maxConcurrent': self.max_concurrent,
+                'maxQueue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'avgHoldSeconds': round(self._hold_time, 3)
+            }
@@ -0,0 +1,493 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+MAX_OPTION_KEYS = 64
+OTHER_OPTION = '__other__'
+
+
+class IngestConflict(Exception):
+    """An idempotency key was reused for a different batch"""
+
+
+class Welford:
+    """Running count, mean and variance in O(1) per value"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """Fold in another partition's statistics (Chan et al. pairwise update)"""
+        count = self.count + other.count
+        if count:
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['mean'], data['m2'])
+
+
+class QuantileSketch:
+    """Log-bucketed quantile sketch with bounded relative error (DDSketch-style).
+
+    Each positive value lands in bucket ``ceil(log_gamma(x))``; any quantile is
+    answered within ``relative_accuracy`` of the true value, inserts are O(1)
+    and the state is a small dict of bucket counts.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {'relativeAccuracy': self.relative_accuracy, 'zeros': self.zeros, 'count': self.count,
+                'buckets': {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relativeAccuracy'])
+        sketch.zeros = data['zeros']
+        sketch.count = data['count']
+        sketch.buckets = {int(k): v for k, v in data['buckets'].items()}
+        return sketch
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+class QuestionAggregate:
+    def __init__(self, question_type=None):
+        self.type = question_type
+        self.responses = 0
+        self.options = {}
+        self.rating = Welford()
+
+    def add(self, value):
+        self.responses += 1
+        if self.type == 'text':
+            return
+        if self.type in (None, 'rating-scale'):
+            number = _number(value)
+            if number is not None:
+                self.rating.add(number)
+                if self.type == 'rating-scale':
+                    return
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            self._count_option(str(item), 1)
+
+    def _count_option(self, key, count):
+        if key not in self.options and len(self.options) >= MAX_OPTION_KEYS:
+            key = OTHER_OPTION
+        self.options[key] = self.options.get(key, 0) + count
+
+    def merge(self, other):
+        self.type = self.type or other.type
+        self.responses += other.responses
+        for key, count in other.options.items():
+            self._count_option(key, count)
+        self.rating.merge(other.rating)
+        return self
+
+    def snapshot(self, question_id):
+        snapshot = {
+            'questionId': question_id,
+            'type': self.type,
+            'responseCount': self.responses
+        }
+        if self.options and self.type != 'rating-scale':
+            snapshot['optionCounts'] = dict(self.options)
+        if self.rating.count:
+            snapshot['averageRating'] = round(self.rating.mean, 3)
+            snapshot['ratingVariance'] = round(self.rating.variance, 3)
+        return snapshot
+
+    def to_dict(self):
+        return {'type': self.type, 'responses': self.responses, 'options': self.options,
+                'rating': self.rating.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls(data['type'])
+        aggregate.responses = data['responses']
+        aggregate.options = dict(data['options'])
+        aggregate.rating = Welford.from_dict(data['rating'])
+        return aggregate
+
+
+class SurveyAggregate:
+    """Running per-survey analytics, updated in O(1) per response"""
+
+    def __init__(self):
+        self.total = 0
+        self.by_day = {}
+        self.duration = Welford()
+        self.duration_sketch = QuantileSketch()
+        self.questions = {}
+        self.updated_at = None
+
+    def set_question_types(self, questions):
+        for question in questions:
+            question_id = str(question.get('_id') or question.get('id') or question.get('questionId'))
+            aggregate = self.questions.setdefault(question_id, QuestionAggregate())
+            aggregate.type = question.get('type') or aggregate.type
+
+    def add(self, response):
+        self.total += 1
+        metadata = response.get('metadata') or {}
+        submitted = response.get('createdAt') or metadata.get('submitTime') or datetime.now().isoformat()
+        day = str(submitted)[:10]
+        self.by_day[day] = self.by_day.get(day, 0) + 1
+
+        duration = _number(metadata.get('duration', response.get('duration')))
+        if duration is not None and duration >= 0:
+            self.duration.add(duration)
+            self.duration_sketch.add(duration)
+
+        for answer in response.get('answers') or []:
+            value = answer.get('value')
+            if value is None or value == '':
+                continue
+            question_id = str(answer.get('questionId'))
+            aggregate = self.questions.get(question_id)
+            if aggregate is None:
+                aggregate = self.questions[question_id] = QuestionAggregate()
+            aggregate.add(value)
+
+    def merge(self, other):
+        """Fold in the same survey's aggregate from another worker"""
+        self.total += other.total
+        for day, count in other.by_day.items():
+            self.by_day[day] = self.by_day.get(day, 0) + count
+        self.duration.merge(other.duration)
+        self.duration_sketch.merge(other.duration_sketch)
+        for question_id, aggregate in other.questions.items():
+            if question_id in self.questions:
+                self.questions[question_id].merge(aggregate)
+            else:
+                self.questions[question_id] = QuestionAggregate.from_dict(aggregate.to_dict())
+        if other.updated_at and (self.updated_at is None or other.updated_at > self.updated_at):
+            self.updated_at = other.updated_at
+        return self
+
+    def snapshot(self, survey_id):
+        quantiles = {}
+        if self.duration_sketch.count:
+            quantiles = {name: round(self.duration_sketch.quantile(q), 2)
+                         for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))}
+        return {
+            'surveyId': survey_id,
+            'totalResponses': self.total,
+            'averageDuration': round(self.duration.mean) if self.duration.count else 0,
+            'durationQuantiles': quantiles,
+            'responsesByDay': dict(sorted(self.by_day.items())),
+            'questionAnalytics': [aggregate.snapshot(question_id)
+                                  for question_id, aggregate in self.questions.items()],
+            'updatedAt': self.updated_at
+        }
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'byDay': self.by_day,
+            'duration': self.duration.to_dict(),
+            'durationSketch': self.duration_sketch.to_dict(),
+            'questions': {question_id: aggregate.to_dict() for question_id, aggregate in self.questions.items()},
+            'updatedAt': self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.total = data['total']
+        aggregate.by_day = dict(data['byDay'])
+        aggregate.duration = Welford.from_dict(data['duration'])
+        aggregate.duration_sketch = QuantileSketch.from_dict(data['durationSketch'])
+        aggregate.questions = {question_id: QuestionAggregate.from_dict(question)
+                               for question_id, question in data['questions'].items()}
+        aggregate.updated_at = data.get('updatedAt')
+        return aggregate
+
+
+def batch_fingerprint(responses, questions=None):
+    return hashlib.sha256(json.dumps([responses, questions], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IngestKeys:
+    """Idempotency keys of applied ingest batches, shared by every worker through one SQLite file.
+
+    A key is claimed before its batch is counted, so a retried batch (the
+    same key) is applied once however many workers the retries reach.
+    Keys expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, db_path=':memory:', ttl=86400):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        if db_path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ingest_keys '
+            '(key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+        self._db.commit()
+
+    def claim(self, key, fingerprint):
+        """True when ``key`` is new, False for a retry of the same batch; raises IngestConflict otherwise"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM ingest_keys WHERE created_at < ?', (now - self.ttl,))
+            claimed = self._db.execute('INSERT OR IGNORE INTO ingest_keys VALUES (?, ?, ?)',
+                                       (key, fingerprint, now)).rowcount == 1
+            if claimed:
+                return True
+            row = self._db.execute('SELECT fingerprint FROM ingest_keys WHERE key = ?', (key,)).fetchone()
+        if row is not None and row[0] != fingerprint:
+            raise IngestConflict(key)
+        return False
+
+    def release(self, key):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM ingest_keys WHERE key = ?', (key,))
+
+
+class AnalyticsStore:
+    """Per-survey aggregates with periodic atomic JSON checkpoints, one file per worker.
+
+    With ``checkpoint_path`` set, each worker process counts its own ingests
+    and writes them to ``<checkpoint_path>.worker-<id>`` at most every
+    ``checkpoint_interval`` seconds after an ingest, plus on ``checkpoint()``;
+    ``id`` is ``worker_id`` or the process id. Reads merge the live state of
+    this worker with the latest checkpoint of every other one (and a
+    pre-existing single-file checkpoint at ``checkpoint_path``), so another
+    worker's recent ingests show up once it checkpoints. State is (re)loaded
+    on first use in each process, so a store created before a fork is safe.
+    Ingest idempotency keys live in ``<checkpoint_path>.keys`` so that every
+    worker sees them.
+    """
+
+    def __init__(self, checkpoint_path=None, checkpoint_interval=30.0, worker_id=None, key_ttl=86400):
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.worker_id = worker_id
+        self.key_ttl = key_ttl
+        self._surveys = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._last_checkpoint = time.monotonic()
+        self._pid = None
+        self._keys = None
+        self._peers = {}
+
+    def _worker_path(self):
+        return f'{self.checkpoint_path}.worker-{self.worker_id or os.getpid()}'
+
+    def _ensure_process(self):
+        """Start this process from its own checkpoint; called with ``_lock`` held"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._keys = None
+        self._dirty = False
+        self._surveys = {}
+        if self.checkpoint_path:
+            state = self._read(self._worker_path())
+            self._surveys = {survey_id: SurveyAggregate.from_dict(data) for survey_id, data in state.items()}
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f).get('surveys', {})
+        except FileNotFoundError:
+            return {}
+
+    def _peer_states(self):
+        """Saved surveys of every other worker, re-read only when a checkpoint file changes"""
+        if not self.checkpoint_path:
+            return []
+        own = self._worker_path()
+        paths = [path for path in glob.glob(f'{glob.escape(self.checkpoint_path)}.worker-*')
+                 if path != own and not path.endswith('.tmp')]
+        if os.path.exists(self.checkpoint_path):
+            paths.append(self.checkpoint_path)
+        states = []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                cached = self._peers.get(path)
+                if cached is None or cached[0] != mtime:
+                    cached = self._peers[path] = (mtime, self._read(path))
+            except (OSError, ValueError) as e:
+                print(f"Analytics checkpoint read error ({path}): {str(e)}")
+                continue
+            states.append(cached[1])
+        return states
+
+    def _ingest_keys(self):
+        if self._keys is None:
+            db_path = f'{self.checkpoint_path}.keys' if self.checkpoint_path else ':memory:'
+            self._keys = IngestKeys(db_path, self.key_ttl)
+        return self._keys
+
+    def ingest(self, survey_id, responses, questions=None, idempotency_key=None):
+        """Count a batch; returns (totalResponses, applied).
+
+        A batch whose ``idempotency_key`` was already applied is not counted
+        again (``applied`` is False); reusing a key for a different batch
+        raises IngestConflict.
+        """
+        key = None
+        if idempotency_key:
+            with self._lock:
+                self._ensure_process()
+                keys = self._ingest_keys()
+            key = f'{survey_id}:{idempotency_key}'
+            if not keys.claim(key, batch_fingerprint(responses, questions)):
+                return self.total(survey_id), False
+
+        try:
+            with self._lock:
+                self._ensure_process()
+                aggregate = self._surveys.get(survey_id)
+                if aggregate is None:
+                    aggregate = self._surveys[survey_id] = SurveyAggregate()
+                if questions:
+                    aggregate.set_question_types(questions)
+                for response in responses:
+                    aggregate.add(response)
+                aggregate.updated_at = datetime.now().isoformat()
+                self._dirty = True
+        except Exception:
+            if key is not None:
+                keys.release(key)
+            raise
+
+        if self.checkpoint_path and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        return self.total(survey_id), True
+
+    def total(self, survey_id):
+        with self._lock:
+            self._ensure_process()
+            aggregate = self._surveys.get(survey_id)
+            total = aggregate.total if aggregate is not None else 0
+        return total + sum(state[survey_id]['total'] for state in self._peer_states() if survey_id in state)
+
+    def snapshot(self, survey_id):
+        peers = [state[survey_id] for state in self._peer_states() if survey_id in state]
+        with self._lock:
+            self._ensure_process()
+            aggregate = self._surveys.get(survey_id)
+            if not peers:
+                return aggregate.snapshot(survey_id) if aggregate is not None else None
+            merged = SurveyAggregate.from_dict(aggregate.to_dict()) if aggregate is not None else SurveyAggregate()
+        for data in peers:
+            merged.merge(SurveyAggregate.from_dict(data))
+        return merged.snapshot(survey_id)
+
+    def checkpoint(self):
+        """Write this worker's aggregates to its checkpoint file atomically (temp file + rename)"""
+        if not self.checkpoint_path:
+            return False
+        with self._lock:
+            self._ensure_process()
+            if not self._dirty:
+                return False
+            state = json.dumps({
+                'version': 1,
+                'savedAt': datetime.now().isoformat(),
+                'surveys': {survey_id: aggregate.to_dict() for survey_id, aggregate in self._surveys.items()}
+            })
+            self._dirty = False
+            self._last_checkpoint = time.monotonic()
+
+        path = self._worker_path()
+        temp_path = f'{path}.tmp'
+        with self._write_lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(state)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        return True
+
+    def stats(self):
+        return {
+            'surveys': len(self._surveys),
+            'persistent': bool(self.checkpoint_path)
+        }
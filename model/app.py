@@ -1,12 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import requests
+import asyncio
+import atexit
 import json
 import os
 import random
+import re
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
+import metrics
+from admission import PRIORITIES, AdmissionController, AdmissionRejected, RateLimiter
+from analytics import AnalyticsStore, IngestConflict
+from budget import TokenBudget, TokenLedger, no_usage, usage_summary
+from cache import ResultCache, requirements_key
+from hedging import AsyncHedgedUpstream, Backend, HedgedUpstream, load_backends
+from jobs import JobConflict, JobQueueFull, JobRunner, JobStore, public_job, resolve_webhook
+from questionbank import QuestionBank, text_hash
+from singleflight import SingleFlight
+from spam import SpamDetector
+from rewrite import RuleEngine, load_rules
+from sentiment import SentimentAnalyzer, SentimentModel, load_lexicon
+from suggestions import SuggestionCatalog
+from streaming import QuestionStreamParser, format_ndjson, format_sse, iter_ndjson
+from templates import TemplatePacks
+from translation import LLMTranslator, SurveyTranslator, TranslationMemory
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError
+
 
 load_dotenv()
 
@@ -16,178 +40,162 @@ CORS(app)
 
 AI_API_URL = os.getenv('AI_API_URL', 'https://api.openai.com/v1/chat/completions')
 AI_API_KEY = os.getenv('AI_API_KEY')
-MAX_RETRIES = 3
-REQUEST_TIMEOUT = 30
+MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 3))
+REQUEST_TIMEOUT = int(os.getenv('AI_REQUEST_TIMEOUT', 30))
+CONNECT_TIMEOUT = float(os.getenv('AI_CONNECT_TIMEOUT', 3.05))
+POOL_SIZE = int(os.getenv('AI_POOL_SIZE', 20))
+# JSON list of OpenAI-compatible backends; when set it replaces AI_API_URL/AI_API_KEY
+AI_BACKENDS = load_backends(os.getenv('AI_BACKENDS'))
+AI_HEDGE_PERCENTILE = float(os.getenv('AI_HEDGE_PERCENTILE', 0.95))
+AI_HEDGE_INITIAL_DELAY = float(os.getenv('AI_HEDGE_INITIAL_DELAY', 2))
+AI_HEDGE_MIN_DELAY = float(os.getenv('AI_HEDGE_MIN_DELAY', 0.05))
+AI_HEDGE_MAX_DELAY = float(os.getenv('AI_HEDGE_MAX_DELAY', 10))
+AI_HEDGE_MAX_HEDGES = int(os.getenv('AI_HEDGE_MAX_HEDGES', 1))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('AI_CIRCUIT_RESET_TIMEOUT', 30))
+CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 3600))
+CACHE_SIZE = int(os.getenv('AI_CACHE_SIZE', 1024))
+CACHE_DB = os.getenv('AI_CACHE_DB')
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 32))
+IMPROVE_RULES_FILE = os.getenv('IMPROVE_RULES_FILE')
+SENTIMENT_LEXICON = os.getenv('SENTIMENT_LEXICON')
+SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', 5000))
+SPAM_MAX_RESPONSES = int(os.getenv('SPAM_MAX_RESPONSES', 200000))
+SPAM_DUPLICATE_WINDOW = float(os.getenv('SPAM_DUPLICATE_WINDOW', 3600))
+ANALYTICS_CHECKPOINT_PATH = os.getenv('ANALYTICS_CHECKPOINT_PATH')
+ANALYTICS_CHECKPOINT_INTERVAL = float(os.getenv('ANALYTICS_CHECKPOINT_INTERVAL', 30))
+ANALYTICS_MAX_BATCH = int(os.getenv('ANALYTICS_MAX_BATCH', 10000))
+ANALYTICS_WORKER_ID = os.getenv('ANALYTICS_WORKER_ID')
+ANALYTICS_IDEMPOTENCY_TTL = float(os.getenv('ANALYTICS_IDEMPOTENCY_TTL', 86400))
+SUGGESTIONS_FILE = os.getenv('SUGGESTIONS_FILE')
+TEMPLATES_DIR = os.getenv('TEMPLATES_DIR')
+TEMPLATES_RELOAD_INTERVAL = float(os.getenv('TEMPLATES_RELOAD_INTERVAL', 2))
+SUGGESTIONS_MAX_AGE = int(os.getenv('SUGGESTIONS_MAX_AGE', 300))
+QUESTION_BANK_PATH = os.getenv('QUESTION_BANK_PATH')
+QUESTION_BANK_SAVE_INTERVAL = float(os.getenv('QUESTION_BANK_SAVE_INTERVAL', 300))
+RETRIEVAL_FIRST = os.getenv('RETRIEVAL_FIRST', 'false').lower() == 'true'
+RETRIEVAL_MIN_RELEVANCE = float(os.getenv('RETRIEVAL_MIN_RELEVANCE', 0.5))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', 100))
+MAX_SURVEY_QUESTIONS = int(os.getenv('MAX_SURVEY_QUESTIONS', 50))
+AI_MAX_TOKENS_FLOOR = int(os.getenv('AI_MAX_TOKENS_FLOOR', 256))
+AI_MAX_TOKENS_CAP = int(os.getenv('AI_MAX_TOKENS_CAP', 4096))
+AI_TOKEN_MARGIN = float(os.getenv('AI_TOKEN_MARGIN', 1.25))
+TENANT_HEADER = os.getenv('TENANT_HEADER', 'X-Tenant-ID')
+USAGE_MAX_TENANTS = int(os.getenv('USAGE_MAX_TENANTS', 10000))
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', POOL_SIZE))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 100))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 5))
+ADMISSION_BULK_MAX_WAIT = float(os.getenv('ADMISSION_BULK_MAX_WAIT', 1))
+ADMISSION_BULK_SHARE = float(os.getenv('ADMISSION_BULK_SHARE', 0.5))
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', 0))
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', 20))
+ADMISSION_BULK_RATE = float(os.getenv('ADMISSION_BULK_RATE', 0))
+ADMISSION_BULK_BURST = int(os.getenv('ADMISSION_BULK_BURST', 5))
+PRIORITY_HEADER = os.getenv('PRIORITY_HEADER', 'X-Request-Priority')
+JOBS_DB = os.getenv('JOBS_DB', 'jobs.db')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 1000))
+JOB_TTL = int(os.getenv('JOB_TTL', 86400))
+JOB_LEASE = float(os.getenv('JOB_LEASE', 300))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_WEBHOOK_SECRET = os.getenv('JOB_WEBHOOK_SECRET')
+JOB_WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv('JOB_WEBHOOK_ALLOWED_HOSTS', '').split(',')
+                             if host.strip()}
+IDEMPOTENCY_HEADER = os.getenv('IDEMPOTENCY_HEADER', 'Idempotency-Key')
+TRANSLATOR = os.getenv('TRANSLATOR', 'llm').lower()
+TRANSLATION_DB = os.getenv('TRANSLATION_DB')
+TRANSLATION_MEMORY_SIZE = int(os.getenv('TRANSLATION_MEMORY_SIZE', 50000))
+TRANSLATION_BATCH_SIZE = int(os.getenv('TRANSLATION_BATCH_SIZE', 200))
+TRANSLATE_MAX_STRINGS = int(os.getenv('TRANSLATE_MAX_STRINGS', 5000))
 
 
 DEMO_MODE = os.getenv('DEMO_MODE', 'true').lower() == 'true'
 
+# Static instructions go in the system message so every request shares the
+# same prompt prefix (eligible for upstream prompt caching); only the
+# per-request fields follow in the user message
+SURVEY_SYSTEM_PROMPT = (
+    'You are an expert survey designer. Reply with ONLY a JSON object of the form '
+    '{"questions": [{"type": "multiple-choice", "text": "Question text", "required": true, '
+    '"options": ["Option 1", "Option 2", "Option 3"], "order": 0}]}. '
+    'Use only the requested question types. Give multiple-choice questions 3-5 realistic options '
+    'and omit "options" for other types. Make about half the questions required. '
+    'Write questions and options in the requested language.'
+)
+
+def valid_survey_reply(ai_response):
+    """Whether a chat completion body's content is a JSON object with a questions list"""
+    try:
+        reply = json.loads(ai_response['choices'][0]['message']['content'])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+    return isinstance(reply, dict) and isinstance(reply.get('questions'), list)
+
+def build_upstream():
+    """A single upstream client, or a hedged client over AI_BACKENDS when configured"""
+    def client(url, api_key):
+        return UpstreamClient(
+            url,
+            api_key,
+            timeout=REQUEST_TIMEOUT,
+            connect_timeout=CONNECT_TIMEOUT,
+            max_retries=MAX_RETRIES,
+            pool_size=POOL_SIZE,
+            breaker=CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        )
+
+    if not AI_BACKENDS:
+        return client(AI_API_URL, AI_API_KEY)
+    backends = [Backend(config['name'], client(config['url'], config['api_key']), config['weight'], config['model'])
+                for config in AI_BACKENDS]
+    return HedgedUpstream(backends, pool_size=POOL_SIZE, **hedge_options())
+
+def hedge_options():
+    return {
+        'percentile': AI_HEDGE_PERCENTILE,
+        'initial_delay': AI_HEDGE_INITIAL_DELAY,
+        'min_delay': AI_HEDGE_MIN_DELAY,
+        'max_delay': AI_HEDGE_MAX_DELAY,
+        'max_hedges': AI_HEDGE_MAX_HEDGES
+    }
+
+def routing_stats(client):
+    """Per-backend latency, error and hedging stats, when generation is hedged"""
+    return client.stats() if isinstance(client, (HedgedUpstream, AsyncHedgedUpstream)) else None
+
 class SurveyAIService:
-    def __init__(self):
-        self.question_templates = {
-            'feedback': {
-                'multiple-choice': [
-                    "How would you rate your overall experience?",
-                    "Which aspect needs the most improvement?",
-                    "How likely are you to recommend us to others?",
-                    "What is your primary reason for using our service?"
-                ],
-                'text': [
-                    "What specific improvements would you suggest?",
-                    "Please describe your experience in detail",
-                    "What do you like most about our service?",
-                    "Any additional comments or suggestions?"
-                ],
-                'rating-scale': [
-                    "Rate your satisfaction with our service",
-                    "How would you rate the quality of our product?",
-                    "Rate the friendliness of our staff",
-                    "How would you rate our response time?"
-                ],
-                'yes-no': [
-                    "Would you use our service again?",
-                    "Did we meet your expectations?",
-                    "Would you recommend us to a friend?",
-                    "Was the service provided as promised?"
-                ]
-            },
-            'research': {
-                'multiple-choice': [
-                    "What is your age group?",
-                    "What is your highest level of education?",
-                    "Which best describes your occupation?",
-                    "How often do you use this type of product/service?"
-                ],
-                'text': [
-                    "Describe your typical daily routine",
-                    "What challenges do you face in this area?",
-                    "How do you currently solve this problem?",
-                    "What would an ideal solution look like?"
-                ],
-                'rating-scale': [
-                    "How important is this issue to you?",
-                    "Rate your current satisfaction level",
-                    "How urgent is finding a solution?",
-                    "Rate your expertise in this area"
-                ],
-                'yes-no': [
-                    "Have you experienced this problem before?",
-                    "Are you actively looking for solutions?",
-                    "Would you pay for a solution?",
-                    "Do you have access to alternatives?"
-                ]
-            },
-            'evaluation': {
-                'multiple-choice': [
-                    "How would you rate the overall performance?",
-                    "Which area showed the most improvement?",
-                    "What was the biggest challenge faced?",
-                    "Which resource was most valuable?"
-                ],
-                'text': [
-                    "What were the key achievements?",
-                    "Describe areas that need improvement",
-                    "What strategies worked best?",
-                    "What would you do differently next time?"
-                ],
-                'rating-scale': [
-                    "Rate the effectiveness of the approach",
-                    "How well were objectives met?",
-                    "Rate the quality of execution",
-                    "How satisfied are you with the results?"
-                ],
-                'yes-no': [
-                    "Were the objectives clearly defined?",
-                    "Did you have adequate resources?",
-                    "Would you use this approach again?",
-                    "Were stakeholders satisfied with outcomes?"
-                ]
-            },
-            'marketing': {
-                'multiple-choice': [
-                    "How did you first hear about us?",
-                    "What influenced your purchase decision?",
-                    "Which marketing channel do you prefer?",
-                    "What type of content interests you most?"
-                ],
-                'text': [
-                    "Describe your ideal customer experience",
-                    "What messaging resonates with you?",
-                    "How can we better communicate our value?",
-                    "What would make you choose us over competitors?"
-                ],
-                'rating-scale': [
-                    "Rate the effectiveness of our advertising",
-                    "How clear is our brand message?",
-                    "Rate your brand awareness before today",
-                    "How appealing are our promotional offers?"
-                ],
-                'yes-no': [
-                    "Do you follow us on social media?",
-                    "Have you seen our recent advertising?",
-                    "Would you sign up for our newsletter?",
-                    "Are you interested in exclusive offers?"
-                ]
-            }
-        }
-        
-        self.option_templates = {
-            'satisfaction': ['Very Dissatisfied', 'Dissatisfied', 'Neutral', 'Satisfied', 'Very Satisfied'],
-            'frequency': ['Never', 'Rarely', 'Sometimes', 'Often', 'Always'],
-            'likelihood': ['Very Unlikely', 'Unlikely', 'Neutral', 'Likely', 'Very Likely'],
-            'agreement': ['Strongly Disagree', 'Disagree', 'Neutral', 'Agree', 'Strongly Agree'],
-            'age_group': ['18-25', '26-35', '36-45', '46-55', '56-65', '65+'],
-            'education': ['High School', 'Some College', "Bachelor's Degree", "Master's Degree", 'Doctorate'],
-            'experience': ['Beginner', 'Intermediate', 'Advanced', 'Expert'],
-            'importance': ['Not Important', 'Slightly Important', 'Moderately Important', 'Important', 'Very Important']
-        }
+    def __init__(self, upstream=None, cache=None, bank=None, budget=None):
+        self.upstream = upstream or build_upstream()
+        self.cache = cache or ResultCache(max_entries=CACHE_SIZE, ttl=CACHE_TTL, db_path=CACHE_DB)
+        self.inflight = SingleFlight()
+        self.budget = budget or TokenBudget(margin=AI_TOKEN_MARGIN, floor=AI_MAX_TOKENS_FLOOR, cap=AI_MAX_TOKENS_CAP)
+
+        self.bank = bank if bank is not None else QuestionBank(QUESTION_BANK_PATH, QUESTION_BANK_SAVE_INTERVAL)
+        # Packs index their questions into the bank when first loaded and on every reload
+        self.templates = TemplatePacks(TEMPLATES_DIR, reload_interval=TEMPLATES_RELOAD_INTERVAL,
+                                       on_load=self._index_pack)
+        self.rewriter = RuleEngine(load_rules(IMPROVE_RULES_FILE))
+        self.suggestions = SuggestionCatalog.load(SUGGESTIONS_FILE)
+        self.translator = SurveyTranslator(
+            TranslationMemory(TRANSLATION_MEMORY_SIZE, TRANSLATION_DB),
+            LLMTranslator(self.upstream) if TRANSLATOR == 'llm' else None,
+            self.templates,
+            max_batch=TRANSLATION_BATCH_SIZE
+        )
 
     def generate_questions_demo(self, requirements):
         """Generate demo questions without calling external AI API"""
         try:
             category = requirements.get('category', 'feedback')
-            target_audience = requirements.get('targetAudience', 'general')
+            language = requirements.get('language', 'en')
             num_questions = int(requirements.get('numberOfQuestions', 8))
             question_types = requirements.get('questionTypes', ['multiple-choice', 'text'])
             
-            questions = []
-            templates = self.question_templates.get(category, self.question_templates['feedback'])
-
-            type_cycle = question_types * ((num_questions // len(question_types)) + 1)
-            
-            for i in range(num_questions):
-                question_type = type_cycle[i]
-                
-                if question_type in templates:
-                    question_templates = templates[question_type]
-                    if question_templates:
-                        question_text = random.choice(question_templates)
-                        
-                        question = {
-                            'type': question_type,
-                            'text': question_text,
-                            'required': i < num_questions // 2,  
-                            'order': i
-                        }
-                        
-
-                        if question_type == 'multiple-choice':
-                            if 'satisfaction' in question_text.lower() or 'rate' in question_text.lower():
-                                question['options'] = self.option_templates['satisfaction']
-                            elif 'likely' in question_text.lower() or 'recommend' in question_text.lower():
-                                question['options'] = self.option_templates['likelihood']
-                            elif 'age' in question_text.lower():
-                                question['options'] = self.option_templates['age_group']
-                            elif 'education' in question_text.lower():
-                                question['options'] = self.option_templates['education']
-                            elif 'experience' in question_text.lower() or 'expertise' in question_text.lower():
-                                question['options'] = self.option_templates['experience']
-                            elif 'important' in question_text.lower():
-                                question['options'] = self.option_templates['importance']
-                            else:
-                                question['options'] = self.option_templates['agreement']
-                        
-                        questions.append(question)
+            questions = self.templates.sample(
+                language, category, question_types, num_questions, self._demo_rng(requirements)
+            )
             
             return {
                 'success': True,
@@ -203,128 +211,438 @@ class SurveyAIService:
                 'message': f'Failed to generate demo questions: {str(e)}'
             }
 
-    def generate_questions_ai(self, requirements):
-        """Generate questions using external AI API"""
+    def generate_surveys_demo(self, requirements, count):
+        """Generate ``count`` demo surveys for the same requirements in one call"""
         try:
-            prompt = self._build_ai_prompt(requirements)
+            category = requirements.get('category', 'feedback')
+            language = requirements.get('language', 'en')
+            num_questions = int(requirements.get('numberOfQuestions', 8))
+            question_types = requirements.get('questionTypes', ['multiple-choice', 'text'])
             
-
-            headers = {
-                'Authorization': f'Bearer {AI_API_KEY}',
-                'Content-Type': 'application/json'
-            }
+            surveys = self.templates.sample_many(
+                language, category, question_types, num_questions, count, self._demo_rng(requirements)
+            )
             
-            payload = {
-                'model': 'gpt-3.5-turbo',
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': 'You are an expert survey designer. Generate survey questions in JSON format.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ],
-                'max_tokens': 1500,
-                'temperature': 0.7
+            return {
+                'success': True,
+                'surveys': surveys,
+                'generated_at': datetime.now().isoformat(),
+                'method': 'demo_template'
             }
             
-            response = requests.post(
-                AI_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=REQUEST_TIMEOUT
-            )
+        except Exception as e:
+            print(f"Demo bulk generation error: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Failed to generate demo surveys: {str(e)}'
+            }
+
+    def _demo_rng(self, requirements):
+        """Seeded RNG when the requirements carry a 'seed', else the shared module RNG"""
+        seed = requirements.get('seed')
+        return random.Random(seed) if seed is not None else random
+
+    def generate_questions_ai(self, requirements):
+        """Generate questions using external AI API"""
+        try:
+            payload = self._build_ai_payload(requirements)
             
-            if response.status_code == 200:
-                ai_response = response.json()
-                content = ai_response['choices'][0]['message']['content']
-                questions_data = json.loads(content)
+            ai_response = self.upstream.post_json(payload, validate=valid_survey_reply)
+            return self._ai_result(ai_response, requirements, payload)
                 
-                return {
-                    'success': True,
-                    'questions': questions_data.get('questions', []),
-                    'generated_at': datetime.now().isoformat(),
-                    'method': 'ai_api'
-                }
-            else:
-                print(f"AI API error: {response.status_code} - {response.text}")
-                return self.generate_questions_demo(requirements)
+        except Exception as e:
+            self._record_fallback(e)
+            return self.generate_questions_demo(requirements)
+
+    async def generate_questions_ai_async(self, requirements, upstream):
+        """Async variant of generate_questions_ai used by the ASGI serving mode"""
+        try:
+            payload = self._build_ai_payload(requirements)
+            
+            ai_response = await upstream.post_json(payload, validate=valid_survey_reply)
+            # Indexing the reply into the question bank takes its lock and may write a segment
+            return await asyncio.to_thread(self._ai_result, ai_response, requirements, payload)
                 
         except Exception as e:
-            print(f"AI API error: {str(e)}")
+            self._record_fallback(e)
             return self.generate_questions_demo(requirements)
 
-    def _build_ai_prompt(self, requirements):
-        """Build prompt for AI API"""
-        title = requirements.get('title', '')
-        description = requirements.get('description', '')
+    def _record_fallback(self, error):
+        if isinstance(error, CircuitOpenError):
+            print("AI API circuit open, serving demo questions")
+        else:
+            print(f"AI API error: {str(error)}")
+        metrics.DEMO_FALLBACKS.inc(reason=fallback_reason(error))
+
+    def _ai_result(self, ai_response, requirements, payload):
+        metrics.record_usage(ai_response.get('usage'))
+        choice = ai_response['choices'][0]
+        content = choice['message']['content']
+        prompt = ''.join(message['content'] for message in payload['messages'])
+        usage = usage_summary(ai_response.get('usage'), prompt, content, payload['max_tokens'])
+        self.budget.observe(requirements, usage['completionTokens'], choice.get('finish_reason'))
+        # A reply cut off at max_tokens fails to parse here and falls back to demo
+        questions_data = json.loads(content)
+        questions = questions_data.get('questions', [])
+        self.bank.add_questions(questions, requirements.get('category'), language=requirements.get('language', 'en'))
+        
+        return {
+            'success': True,
+            'questions': questions,
+            'generated_at': datetime.now().isoformat(),
+            'method': 'ai_api',
+            'usage': usage
+        }
+
+    def generate_questions_cached(self, requirements, gate=None):
+        """Generate questions using the AI API, serving repeat requirements from cache.
+
+        ``gate`` returns a context manager held around the upstream call, e.g.
+        an admission slot. Only the caller that makes the call enters it;
+        callers coalesced onto that call wait without holding one.
+        """
+        key = requirements_key(requirements)
+        cached = self._cached_result(key)
+        if cached is not None:
+            return cached
+        led = []
+
+        def generate():
+            led.append(True)
+            with gate() if gate is not None else nullcontext():
+                return self._store_result(key, self.generate_questions_ai(requirements))
+
+        # Identical requirements already being generated share that upstream call
+        result = self.inflight.do(key, generate)
+        return self._coalesced_result(result, led)
+
+    async def generate_questions_cached_async(self, requirements, upstream, gate=None):
+        """Async variant of generate_questions_cached used by the ASGI serving mode; ``gate`` is an async context"""
+        key = requirements_key(requirements)
+        # The cache may be SQLite-backed, so its reads and writes stay off the event loop
+        cached = await asyncio.to_thread(self._cached_result, key)
+        if cached is not None:
+            return cached
+
+        led = []
+
+        async def generate():
+            led.append(True)
+            async with gate() if gate is not None else nullcontext():
+                result = await self.generate_questions_ai_async(requirements, upstream)
+                return await asyncio.to_thread(self._store_result, key, result)
+
+        result = await self.inflight.do_async(key, generate)
+        return self._coalesced_result(result, led)
+
+    def _coalesced_result(self, result, led):
+        result = dict(result)
+        # Only the caller that ran the upstream call is charged for its tokens
+        if not led and 'usage' in result:
+            result['usage'] = no_usage('coalesced')
+        return result
+
+    def has_cached(self, requirements):
+        return self.cache.contains(requirements_key(requirements))
+
+    def _cached_result(self, key):
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        return {
+            'success': True,
+            'questions': cached['questions'],
+            'generated_at': cached['generated_at'],
+            'method': 'ai_api_cache_hit',
+            'usage': no_usage('cache')
+        }
+
+    def _store_result(self, key, result):
+        # Only cache real AI output; demo fallbacks must not outlive an outage
+        if result.get('method') == 'ai_api':
+            self.cache.set(key, {
+                'questions': result['questions'],
+                'generated_at': result['generated_at']
+            })
+            result['method'] = 'ai_api_cache_miss'
+        return result
+
+    def _index_pack(self, language, category, entries):
+        for question_type, questions in entries.items():
+            for text, options in questions:
+                self.bank.add(text, question_type, category, list(options) if options else None, source='template',
+                              language=language)
+
+    def retrieve_questions(self, requirements):
+        """Question-bank hits in the survey's language and category relevant enough to reuse, up to numberOfQuestions"""
+        num_questions = int(requirements.get('numberOfQuestions', 8))
+        question_types = requirements.get('questionTypes', ['multiple-choice', 'text'])
+        language = requirements.get('language', 'en')
         category = requirements.get('category', 'feedback')
-        target_audience = requirements.get('targetAudience', 'general')
+        self.templates.preload(language, category)
+        hits = self.bank.search(requirements.get('title', ''), limit=num_questions, question_types=question_types,
+                                category=category, language=language)
+
+        questions = []
+        for hit in hits:
+            if hit['relevance'] < RETRIEVAL_MIN_RELEVANCE:
+                break
+            question = {
+                'type': hit['type'],
+                'text': hit['text'],
+                'required': len(questions) < num_questions // 2,
+                'order': len(questions)
+            }
+            if hit.get('options'):
+                question['options'] = list(hit['options'])
+            questions.append(question)
+        return questions
+
+    def generate_questions_retrieval(self, requirements, use_ai=True, gate=None):
+        """Assemble the survey from the question bank first, generating only the remaining slots"""
+        retrieved = self.retrieve_questions(requirements)
+        remaining = self._remaining_requirements(requirements, retrieved)
+        generated = None
+        if remaining is not None and use_ai:
+            generated = self.generate_questions_cached(remaining, gate)
+        return self._merge_retrieved(requirements, retrieved, generated)
+
+    async def generate_questions_retrieval_async(self, requirements, upstream, use_ai=True, gate=None):
+        """Async variant of generate_questions_retrieval used by the ASGI serving mode"""
+        # BM25 scoring and lazy pack loads are CPU and disk work
+        retrieved = await asyncio.to_thread(self.retrieve_questions, requirements)
+        remaining = self._remaining_requirements(requirements, retrieved)
+        generated = None
+        if remaining is not None and use_ai:
+            generated = await self.generate_questions_cached_async(remaining, upstream, gate)
+        return self._merge_retrieved(requirements, retrieved, generated)
+
+    def _remaining_requirements(self, requirements, retrieved):
+        remaining = int(requirements.get('numberOfQuestions', 8)) - len(retrieved)
+        if remaining <= 0:
+            return None
+        return dict(requirements, numberOfQuestions=remaining,
+                    existingQuestions=[question['text'] for question in retrieved])
+
+    def _merge_retrieved(self, requirements, retrieved, generated):
+        """Retrieved questions, then unseen generated ones, then unused templates until the survey is full"""
+        if generated is not None and not generated['success']:
+            return generated
+
+        num_questions = int(requirements.get('numberOfQuestions', 8))
+        questions = list(retrieved)
+        seen = {text_hash(question['text']) for question in retrieved}
+        method = 'question_bank' if generated is None else f"question_bank+{generated['method']}"
+        for question in (generated or {}).get('questions', []):
+            if len(questions) >= num_questions:
+                break
+            if not isinstance(question, dict) or not isinstance(question.get('text'), str):
+                continue
+            fingerprint = text_hash(question['text'])
+            if fingerprint not in seen:
+                seen.add(fingerprint)
+                # Generated questions may be shared with the cache, so copy before renumbering
+                questions.append(dict(question, order=len(questions)))
+
+        if len(questions) < num_questions:
+            # Generation repeated bank questions (or was skipped in demo mode)
+            filled = self.templates.sample_unique(
+                requirements.get('language', 'en'),
+                requirements.get('category', 'feedback'),
+                requirements.get('questionTypes', ['multiple-choice', 'text']),
+                num_questions - len(questions),
+                lambda text: text_hash(text) in seen,
+                self._demo_rng(requirements)
+            )
+            for question in filled:
+                questions.append(dict(question, order=len(questions)))
+            if filled and not method.endswith('demo_template'):
+                method += '+demo_template'
+
+        result = {
+            'success': True,
+            'questions': questions,
+            'generated_at': datetime.now().isoformat(),
+            'method': method,
+            'retrieved': len(retrieved)
+        }
+        if generated is not None and 'usage' in generated:
+            result['usage'] = generated['usage']
+        return result
+
+    def stream_questions(self, requirements, use_ai=True, on_usage=None):
+        """Yield (event, data) pairs, emitting each question as soon as it is complete.
+
+        ``on_usage(usage)`` is called once for a stream that reached upstream,
+        even when the consumer stops reading part way: those tokens were spent.
+        """
+        emitted = []
+        method = 'demo_template'
+        usage = None
+
+        if use_ai:
+            key = requirements_key(requirements)
+            cached = self.cache.get(key)
+            if cached is not None:
+                emitted = list(cached['questions'])
+                method = 'ai_api_cache_hit'
+                usage = no_usage('cache')
+                if on_usage is not None:
+                    on_usage(usage)
+                for question in emitted:
+                    yield 'question', question
+            else:
+                payload = self._build_ai_payload(requirements)
+                streamed, upstream_usage = [], {}
+                try:
+                    parser = QuestionStreamParser()
+                    for delta in self.upstream.stream_chat(payload, usage=upstream_usage):
+                        streamed.append(delta)
+                        for question in self._collect_streamed(parser.feed(delta), emitted):
+                            yield 'question', question
+                    method = self._finish_stream(key, emitted, requirements)
+                except Exception as e:
+                    self._record_fallback(e)
+                finally:
+                    usage = self._stream_usage(requirements, payload, streamed, upstream_usage, method, on_usage)
+
+        yield from self._stream_tail(requirements, emitted, method, usage)
+
+    async def stream_questions_async(self, requirements, upstream, use_ai=True, on_usage=None):
+        """Async variant of stream_questions used by the ASGI serving mode"""
+        emitted = []
+        method = 'demo_template'
+        usage = None
+
+        if use_ai:
+            key = requirements_key(requirements)
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                emitted = list(cached['questions'])
+                method = 'ai_api_cache_hit'
+                usage = no_usage('cache')
+                if on_usage is not None:
+                    on_usage(usage)
+                for question in emitted:
+                    yield 'question', question
+            else:
+                payload = self._build_ai_payload(requirements)
+                streamed, upstream_usage = [], {}
+                try:
+                    parser = QuestionStreamParser()
+                    async for delta in upstream.stream_chat(payload, usage=upstream_usage):
+                        streamed.append(delta)
+                        for question in self._collect_streamed(parser.feed(delta), emitted):
+                            yield 'question', question
+                    method = await asyncio.to_thread(self._finish_stream, key, emitted, requirements)
+                except Exception as e:
+                    self._record_fallback(e)
+                finally:
+                    usage = self._stream_usage(requirements, payload, streamed, upstream_usage, method, on_usage)
+
+        for event in self._stream_tail(requirements, emitted, method, usage):
+            yield event
+
+    def _stream_usage(self, requirements, payload, streamed, upstream_usage, method, on_usage):
+        """Usage of a streamed reply: the upstream's final usage chunk, else an estimate of what arrived"""
+        if not streamed and not upstream_usage:
+            return None
+        metrics.record_usage(upstream_usage)
+        prompt = ''.join(message['content'] for message in payload['messages'])
+        usage = usage_summary(upstream_usage, prompt, ''.join(streamed), payload['max_tokens'])
+        if method == 'ai_api_cache_miss':
+            # Only complete replies say anything about how long replies run
+            self.budget.observe(requirements, usage['completionTokens'])
+        if on_usage is not None:
+            on_usage(usage)
+        return usage
+
+    def _collect_streamed(self, questions, emitted):
+        for question in questions:
+            question.setdefault('order', len(emitted))
+            emitted.append(question)
+        return questions
+
+    def _finish_stream(self, key, emitted, requirements):
+        if not emitted:
+            print("AI API stream returned no questions, streaming demo questions")
+            metrics.DEMO_FALLBACKS.inc(reason='empty_stream')
+            return 'demo_template'
+        self.bank.add_questions(emitted, requirements.get('category'), language=requirements.get('language', 'en'))
+        self.cache.set(key, {
+            'questions': emitted,
+            'generated_at': datetime.now().isoformat()
+        })
+        return 'ai_api_cache_miss'
+
+    def _stream_tail(self, requirements, emitted, method, usage=None):
+        num_questions = int(requirements.get('numberOfQuestions', 8))
+
+        if method == 'demo_template' and len(emitted) < num_questions:
+            # Top up whatever the upstream managed to send before failing
+            demo = self.generate_questions_demo(dict(requirements, numberOfQuestions=num_questions - len(emitted)))
+            if not demo['success'] and not emitted:
+                yield 'error', {'message': demo['message']}
+                return
+            if emitted:
+                method = 'ai_api_partial'
+            for question in demo.get('questions', []):
+                question['order'] = len(emitted)
+                emitted.append(question)
+                yield 'question', question
+
+        done = {
+            'success': True,
+            'count': len(emitted),
+            'generated_at': datetime.now().isoformat(),
+            'method': method
+        }
+        if usage is not None:
+            done['usage'] = usage
+        yield 'done', done
+
+    def _build_ai_payload(self, requirements):
+        """Build chat completion payload for AI API"""
+        return {
+            'model': 'gpt-3.5-turbo',
+            'messages': [
+                {
+                    'role': 'system',
+                    'content': SURVEY_SYSTEM_PROMPT
+                },
+                {
+                    'role': 'user',
+                    'content': self._build_ai_prompt(requirements)
+                }
+            ],
+            'max_tokens': self.budget.max_tokens(requirements),
+            'temperature': 0.7
+        }
+
+    def _build_ai_prompt(self, requirements):
+        """Build the per-request part of the prompt"""
         num_questions = requirements.get('numberOfQuestions', 8)
         question_types = requirements.get('questionTypes', ['multiple-choice', 'text'])
-        
-        prompt = f"""
-Create a survey with {num_questions} questions for:
-Title: {title}
-Description: {description}
-Category: {category}
-Target Audience: {target_audience}
-Question Types: {', '.join(question_types)}
-
-Return ONLY a JSON object in this exact format:
-{{
-  "questions": [
-    {{
-      "type": "multiple-choice",
-      "text": "Question text here",
-      "required": true,
-      "options": ["Option 1", "Option 2", "Option 3"],
-      "order": 0
-    }}
-  ]
-}}
-
-Use these question types: {', '.join(question_types)}
-Make questions relevant to {category} for {target_audience}.
-For multiple-choice, provide 3-5 realistic options.
-Make about half the questions required.
-"""
+        existing = requirements.get('existingQuestions') or []
+
+        prompt = (
+            f"Create a survey with {num_questions} questions.\n"
+            f"Question Types: {', '.join(question_types)}\n"
+            f"Title: {requirements.get('title', '')}\n"
+            f"Description: {requirements.get('description', '')}\n"
+            f"Category: {requirements.get('category', 'feedback')}\n"
+            f"Target Audience: {requirements.get('targetAudience', 'general')}\n"
+            f"Language: {requirements.get('language', 'en')}\n"
+        )
+        if existing:
+            prompt += 'Do not repeat any of these questions, which the survey already has:\n'
+            prompt += ''.join(f'- {text}\n' for text in existing)
         return prompt
 
     def improve_questions_demo(self, questions, goals):
         """Demo question improvement"""
         try:
-            improved = []
-            
-            for question in questions:
-                improved_question = question.copy()
-                
-
-                if 'clarity' in goals:
-                    text = improved_question['text']
-                    if not text.endswith('?'):
-                        improved_question['text'] = text + '?'
-                    
-
-                    text = improved_question['text']
-                    text = text.replace('utilize', 'use')
-                    text = text.replace('facilitate', 'help')
-                    improved_question['text'] = text
-                
-                if 'engagement' in goals:
-                    text = improved_question['text']
-                    if text.startswith('Please'):
-                        improved_question['text'] = text.replace('Please ', '', 1)
-                
-                improved.append({
-                    'original': question['text'],
-                    'improved': improved_question['text'],
-                    'type': improved_question['type'],
-                    'changes': 'Improved clarity and engagement',
-                    'options': improved_question.get('options', [])
-                })
+            improved = [self.improve_question(question, goals) for question in questions]
             
             return {
                 'success': True,
@@ -338,77 +656,370 @@ Make about half the questions required.
                 'message': f'Failed to improve questions: {str(e)}'
             }
 
+    def improve_question(self, question, goals):
+        """Rewrite one question's text with every rule for ``goals`` in a single pass"""
+        text, fired = self.rewriter.apply(question['text'], goals)
+        return {
+            'original': question['text'],
+            'improved': text,
+            'type': question['type'],
+            'changes': '; '.join(rule['description'] for rule in fired) or 'No changes needed',
+            'rulesFired': [rule['name'] for rule in fired],
+            'options': question.get('options', [])
+        }
+
+    def stream_improved_questions(self, records, goals):
+        """Yield (event, data) pairs improving questions one at a time from ``records``
+
+        ``records`` yields (index, question) pairs as produced by ``iter_ndjson``;
+        a bad record becomes an 'error' event without stopping the stream.
+        """
+        tally = self.new_improvement_tally()
+        for index, question in records:
+            yield self.improve_record(index, question, goals, tally)
+        yield 'done', self.improvement_summary(tally)
+
+    def new_improvement_tally(self):
+        return {'count': 0, 'failed': 0, 'rulesFired': {}}
+
+    def improve_record(self, index, question, goals, tally):
+        """Improve one streamed record into a (event, data) pair, updating ``tally``"""
+        try:
+            if not isinstance(question, dict):
+                raise ValueError('Question must be an object')
+            improved = self.improve_question(question, goals)
+        except Exception as e:
+            tally['failed'] += 1
+            return 'error', {'index': index, 'message': f'Failed to improve question: {str(e)}'}
+        tally['count'] += 1
+        for name in improved['rulesFired']:
+            tally['rulesFired'][name] = tally['rulesFired'].get(name, 0) + 1
+        return 'question', {'index': index, 'question': improved}
+
+    def improvement_summary(self, tally):
+        return dict(tally, success=True, method='demo_improvement')
+
     def get_suggestions_demo(self, category, target_audience=None):
         """Get demo survey suggestions"""
         try:
-            suggestions_db = {
-                'feedback': [
-                    {
-                        'title': 'Customer Satisfaction Survey',
-                        'description': 'Measure customer satisfaction and identify improvement areas',
-                        'keyAreas': ['Service Quality', 'Product Features', 'Support Experience'],
-                        'expectedInsights': ['Satisfaction levels', 'Pain points', 'Improvement priorities'],
-                        'recommendedQuestions': 10
-                    },
-                    {
-                        'title': 'Employee Feedback Survey',
-                        'description': 'Gather employee feedback on workplace experience',
-                        'keyAreas': ['Work Environment', 'Management', 'Career Development'],
-                        'expectedInsights': ['Employee satisfaction', 'Retention factors', 'Culture assessment'],
-                        'recommendedQuestions': 12
-                    }
-                ],
-                'research': [
-                    {
-                        'title': 'Market Research Survey',
-                        'description': 'Understand market trends and consumer behavior',
-                        'keyAreas': ['Demographics', 'Preferences', 'Purchase Behavior'],
-                        'expectedInsights': ['Market segments', 'Consumer needs', 'Competitive landscape'],
-                        'recommendedQuestions': 15
-                    },
-                    {
-                        'title': 'Product Development Research',
-                        'description': 'Collect insights for new product development',
-                        'keyAreas': ['Feature Preferences', 'Pricing Sensitivity', 'Usage Patterns'],
-                        'expectedInsights': ['Feature priorities', 'Price points', 'User workflows'],
-                        'recommendedQuestions': 12
-                    }
-                ],
-                'evaluation': [
-                    {
-                        'title': 'Training Program Evaluation',
-                        'description': 'Assess effectiveness of training programs',
-                        'keyAreas': ['Content Quality', 'Delivery Method', 'Learning Outcomes'],
-                        'expectedInsights': ['Program effectiveness', 'Improvement areas', 'ROI assessment'],
-                        'recommendedQuestions': 10
-                    }
-                ],
-                'marketing': [
-                    {
-                        'title': 'Brand Awareness Survey',
-                        'description': 'Measure brand recognition and perception',
-                        'keyAreas': ['Brand Recognition', 'Brand Association', 'Purchase Intent'],
-                        'expectedInsights': ['Brand strength', 'Market position', 'Campaign effectiveness'],
-                        'recommendedQuestions': 8
-                    }
-                ]
-            }
-            
-            category_suggestions = suggestions_db.get(category, suggestions_db['feedback'])
-            
             return {
                 'success': True,
-                'suggestions': category_suggestions[:3]  
+                'suggestions': self.suggestions.lookup(category, target_audience)
             }
-            
+
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Failed to get suggestions: {str(e)}'
             }
 
+def fallback_reason(error):
+    """Short label for why an AI generation fell back to the demo templates"""
+    if isinstance(error, UpstreamError):
+        return error.reason
+    if isinstance(error, json.JSONDecodeError):
+        return 'json_parse'
+    return 'bad_response'
+
 # Initialize AI service
 ai_service = SurveyAIService()
+sentiment_analyzer = SentimentAnalyzer(SentimentModel(load_lexicon(SENTIMENT_LEXICON)))
+spam_detector = SpamDetector(duplicate_window=SPAM_DUPLICATE_WINDOW)
+token_ledger = TokenLedger(USAGE_MAX_TENANTS)
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    {'interactive': ADMISSION_MAX_WAIT, 'bulk': ADMISSION_BULK_MAX_WAIT},
+    bulk_share=ADMISSION_BULK_SHARE,
+    limiter=RateLimiter({
+        'interactive': (ADMISSION_RATE, ADMISSION_BURST),
+        'bulk': (ADMISSION_BULK_RATE, ADMISSION_BULK_BURST)
+    })
+)
+analytics_store = AnalyticsStore(ANALYTICS_CHECKPOINT_PATH, ANALYTICS_CHECKPOINT_INTERVAL, ANALYTICS_WORKER_ID,
+                                 ANALYTICS_IDEMPOTENCY_TTL)
+atexit.register(analytics_store.checkpoint)
+atexit.register(ai_service.bank.save)
+
+metrics.REGISTRY.callback('counter', 'survey_cache_hits_total', 'Result cache hits',
+                          lambda: ai_service.cache.hits)
+metrics.REGISTRY.callback('counter', 'survey_cache_misses_total', 'Result cache misses',
+                          lambda: ai_service.cache.misses)
+metrics.REGISTRY.callback('counter', 'survey_coalesced_requests_total',
+                          'Generation requests served by joining an identical in-flight call',
+                          lambda: ai_service.inflight.deduplicated)
+metrics.REGISTRY.callback('gauge', 'survey_admission_queued', 'Generation requests waiting for an upstream slot',
+                          lambda: admission.stats()['queued'])
+metrics.REGISTRY.callback('gauge', 'survey_admission_active', 'Generation requests holding an upstream slot',
+                          lambda: admission.stats()['active'])
+metrics.REGISTRY.callback('gauge', 'survey_upstream_circuit_open', 'Whether the upstream circuit breaker is open',
+                          lambda: int(ai_service.upstream.breaker.state == CircuitBreaker.OPEN))
+
+REQUIRED_SURVEY_FIELDS = ['title', 'description', 'category', 'targetAudience']
+
+def validate_survey_requirements(data):
+    """Return an error message for invalid generation requirements, or None"""
+    if not data:
+        return 'No data provided'
+    if not isinstance(data, dict):
+        return 'Requirements must be an object'
+    for field in REQUIRED_SURVEY_FIELDS:
+        if not data.get(field):
+            return f'Missing required field: {field}'
+    if not isinstance(data.get('language', 'en'), str):
+        return 'language must be a language code string'
+    # The form posts the count as a string, so digit strings are accepted too
+    count = data.get('numberOfQuestions', 8)
+    if isinstance(count, str) and count.strip().isdecimal():
+        count = int(count)
+    if isinstance(count, bool) or not isinstance(count, int) or not 1 <= count <= MAX_SURVEY_QUESTIONS:
+        return f'numberOfQuestions must be an integer between 1 and {MAX_SURVEY_QUESTIONS}'
+    question_types = data.get('questionTypes')
+    if question_types is not None and not (isinstance(question_types, list) and question_types
+                                           and all(isinstance(t, str) for t in question_types)):
+        return 'questionTypes must be a non-empty array of strings'
+    seed = data.get('seed')
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, (int, str)) or len(str(seed)) > 64):
+        return 'seed must be an integer or a string of at most 64 characters'
+    return None
+
+def use_demo_generation():
+    """Choose generation method based on demo mode or API availability"""
+    if AI_BACKENDS:
+        return DEMO_MODE
+    return DEMO_MODE or not AI_API_KEY or AI_API_KEY == 'demo-key-replace-with-real'
+
+def generate_survey_questions(data, gate=None):
+    if data.get('retrievalFirst', RETRIEVAL_FIRST):
+        return ai_service.generate_questions_retrieval(data, use_ai=not use_demo_generation(), gate=gate)
+    if use_demo_generation():
+        return ai_service.generate_questions_demo(data)
+    return ai_service.generate_questions_cached(data, gate)
+
+def tenant_id(req):
+    """Tenant that generation tokens are charged to, from the tenant header"""
+    return (req.headers.get(TENANT_HEADER) or 'anonymous')[:128]
+
+def record_token_usage(tenant, result):
+    usage = result.get('usage')
+    if usage:
+        token_ledger.record(tenant, usage)
+
+def client_id(req):
+    """Rate-limit identity: the tenant header when present, else the peer address"""
+    return (req.headers.get(TENANT_HEADER) or req.remote_addr or 'anonymous')[:128]
+
+def request_priority(req, default='interactive'):
+    priority = (req.headers.get(PRIORITY_HEADER) or default).lower()
+    return priority if priority in PRIORITIES else default
+
+def allows_degraded(data):
+    """Whether the caller opted into demo questions instead of a 429 when shed"""
+    return isinstance(data, dict) and bool(data.get('allowDegraded'))
+
+def needs_upstream(data):
+    return not use_demo_generation() and not ai_service.has_cached(data)
+
+def record_rejection(rejected, priority):
+    metrics.ADMISSION_REJECTED.inc(reason=rejected.reason, priority=priority)
+
+def degraded_result(data, rejected):
+    metrics.DEMO_FALLBACKS.inc(reason='shed')
+    return dict(ai_service.generate_questions_demo(data), degraded=rejected.reason)
+
+def rejection_body(rejected):
+    return {
+        'success': False,
+        'message': 'Service is saturated, retry later',
+        'reason': rejected.reason,
+        'retryAfter': rejected.retry_after
+    }
+
+def rejection_response(rejected):
+    response = jsonify(rejection_body(rejected))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+def admitted_generation(data, priority):
+    """generate_survey_questions, queued for an upstream slot only by the call that goes upstream"""
+    return generate_survey_questions(data, gate=lambda: admission.slot(priority))
+
+def usage_report(args):
+    """Token totals for one tenant (?tenant=), or for all tenants"""
+    tenant = args.get('tenant')
+    if tenant:
+        usage = token_ledger.snapshot(tenant)
+        return {'success': True, 'tenant': tenant, 'usage': usage} if usage is not None else None
+    return {
+        'success': True,
+        'totals': token_ledger.totals(),
+        'tenants': token_ledger.snapshot(),
+        'budget': ai_service.budget.stats()
+    }
+
+def run_generation_job(payload, tenant):
+    """Job handler: bulk-priority generation that waits out load shedding rather than failing"""
+    # Give up well before the lease expires so another worker never re-runs a live job
+    deadline = time.monotonic() + JOB_LEASE / 2
+    while True:
+        try:
+            result = admitted_generation(payload, 'bulk')
+            break
+        except AdmissionRejected as e:
+            if time.monotonic() + e.retry_after > deadline:
+                return dict(rejection_body(e), message=f'Shed under load ({e.reason})')
+            time.sleep(e.retry_after)
+    record_token_usage(tenant or 'anonymous', result)
+    return result
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def job_runner():
+    """The process's job runner, created and started on first use.
+
+    Nothing starts at import time, so tools and tests that import this module
+    (and the Flask reloader's parent process) don't spawn workers or open the
+    jobs database.
+    """
+    global _job_runner
+    if _job_runner is None:
+        with _job_runner_lock:
+            if _job_runner is None:
+                store = JobStore(JOBS_DB, ttl=JOB_TTL, lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS)
+                runner = JobRunner(store, {'generate-survey': run_generation_job}, workers=JOB_WORKERS,
+                                   webhook_secret=JOB_WEBHOOK_SECRET, resolve_url=resolve_webhook_url)
+                runner.start()
+                _job_runner = runner
+    return _job_runner
+
+def job_stats():
+    """Job counts by status, or None while the runner hasn't started"""
+    return _job_runner.store.stats() if _job_runner is not None else None
+
+metrics.REGISTRY.callback('gauge', 'survey_jobs_queued', 'Background jobs waiting for a worker',
+                          lambda: (job_stats() or {}).get('queued', 0))
+
+def resolve_webhook_url(url):
+    return resolve_webhook(url, JOB_WEBHOOK_ALLOWED_HOSTS)
+
+def validate_webhook_url(url):
+    """Return an error message for an unusable webhook URL, or None"""
+    if not isinstance(url, str):
+        return 'webhookUrl must be a string'
+    if len(url) > 2048:
+        return 'webhookUrl is too long'
+    return resolve_webhook_url(url)[1]
+
+def submit_generation_job(data, tenant, idempotency_key=None):
+    """Queue a generation job; returns (body, status_code)"""
+    error = validate_survey_requirements(data)
+    webhook_url = data.get('webhookUrl') if isinstance(data, dict) else None
+    if not error and webhook_url is not None:
+        error = validate_webhook_url(webhook_url)
+    if error:
+        return {'success': False, 'message': error}, 400
+
+    payload = {key: value for key, value in data.items() if key != 'webhookUrl'}
+    # A retried submission joins the job already running for it instead of queueing another
+    if idempotency_key:
+        dedupe_key = f'{tenant}:key:{idempotency_key[:200]}'
+    else:
+        # Same survey with a different webhook is a different job: both callers must be notified
+        dedupe_key = f'{tenant}:req:{requirements_key(payload)}:{webhook_url or ""}'
+    runner = job_runner()
+    try:
+        job_id, created = runner.submit('generate-survey', payload, tenant=tenant, dedupe_key=dedupe_key,
+                                        reuse_finished=bool(idempotency_key), webhook_url=webhook_url,
+                                        max_pending=JOB_MAX_PENDING)
+    except JobQueueFull:
+        return {'success': False, 'message': 'Job queue is full, retry later'}, 429
+    except JobConflict:
+        return {'success': False, 'message': f'{IDEMPOTENCY_HEADER} was already used with a different request'}, 422
+    return {
+        'success': True,
+        'jobId': job_id,
+        'deduplicated': not created,
+        'status': runner.store.get(job_id)['status'],
+        'statusUrl': f'/jobs/{job_id}'
+    }, 202
+
+def job_report(job_id):
+    job = job_runner().store.get(job_id)
+    return {'success': True, 'job': public_job(job)} if job is not None else None
+
+def requested_stream_format(req=request):
+    """Return 'sse' or 'ndjson' if the client asked for a streamed response"""
+    stream = req.args.get('stream', '').lower()
+    if stream in ('sse', 'ndjson'):
+        return stream
+    accept = req.headers.get('Accept', '')
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def stream_encoding(stream_format):
+    """Return the (formatter, mimetype) pair for a stream format"""
+    if stream_format == 'sse':
+        return format_sse, 'text/event-stream'
+    return format_ndjson, 'application/x-ndjson'
+
+def encode_stream_event(formatter, event, payload):
+    if event == 'question':
+        payload = {'question': payload}
+    return formatter(event, payload)
+
+def stream_survey_questions(data, stream_format, priority='interactive', tenant='anonymous'):
+    formatter, mimetype = stream_encoding(stream_format)
+
+    def generate():
+        # The slot is taken when the body starts and held until the stream ends
+        use_ai = not use_demo_generation()
+        try:
+            with admission.slot(priority) if needs_upstream(data) else nullcontext():
+                for event, payload in ai_service.stream_questions(
+                        data, use_ai=use_ai, on_usage=lambda usage: token_ledger.record(tenant, usage)):
+                    yield encode_stream_event(formatter, event, payload)
+        except AdmissionRejected as e:
+            record_rejection(e, priority)
+            if not allows_degraded(data):
+                yield formatter('error', rejection_body(e))
+                return
+            metrics.DEMO_FALLBACKS.inc(reason='shed')
+            for event, payload in ai_service.stream_questions(data, use_ai=False):
+                yield encode_stream_event(formatter, event, payload)
+
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=STREAM_HEADERS)
+
+def metric_route(req):
+    return req.url_rule.rule if req.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = metric_route(request)
+    g.metrics_started = metrics.request_started(g.metrics_route)
+
+@app.after_request
+def finish_request_metrics(response):
+    if 'metrics_started' in g:
+        metrics.request_finished(g.metrics_route, request.method, response.status_code, g.pop('metrics_started'))
+    return response
+
+@app.teardown_request
+def abort_request_metrics(error):
+    # after_request is skipped when a view raises; still release the in-flight slot
+    if 'metrics_started' in g:
+        metrics.request_finished(g.metrics_route, request.method, 500, g.pop('metrics_started'))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -418,7 +1029,16 @@ def health_check():
         'service': 'AI Survey Generator',
         'version': '1.0.0',
         'timestamp': datetime.now().isoformat(),
-        'demo_mode': DEMO_MODE
+        'demo_mode': DEMO_MODE,
+        'upstream': ai_service.upstream.breaker.snapshot(),
+        'routing': routing_stats(ai_service.upstream),
+        'cache': ai_service.cache.stats(),
+        'coalescing': ai_service.inflight.stats(),
+        'questionBank': ai_service.bank.stats(),
+        'templates': ai_service.templates.stats(),
+        'admission': admission.stats(),
+        'jobs': job_stats(),
+        'translation': ai_service.translator.stats()
     })
 
 @app.route('/generate-survey', methods=['POST'])
@@ -427,26 +1047,26 @@ def generate_survey():
     try:
         data = request.get_json()
         
-        if not data:
+        error = validate_survey_requirements(data)
+        if error:
             return jsonify({
                 'success': False,
-                'message': 'No data provided'
+                'message': error
             }), 400
         
-        # Validate required fields
-        required_fields = ['title', 'description', 'category', 'targetAudience']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({
-                    'success': False,
-                    'message': f'Missing required field: {field}'
-                }), 400
-        
-        # Choose generation method based on demo mode or API availability
-        if DEMO_MODE or not AI_API_KEY or AI_API_KEY == 'demo-key-replace-with-real':
-            result = ai_service.generate_questions_demo(data)
-        else:
-            result = ai_service.generate_questions_ai(data)
+        priority = request_priority(request)
+        try:
+            admission.check_rate(client_id(request), priority)
+            stream_format = requested_stream_format()
+            if stream_format:
+                return stream_survey_questions(data, stream_format, priority, tenant_id(request))
+            result = admitted_generation(data, priority)
+        except AdmissionRejected as e:
+            record_rejection(e, priority)
+            if not allows_degraded(data):
+                return rejection_response(e)
+            result = degraded_result(data, e)
+        record_token_usage(tenant_id(request), result)
         
         if result['success']:
             return jsonify(result)
@@ -460,10 +1080,174 @@ def generate_survey():
             'message': 'Internal server error'
         }), 500
 
+@app.route('/jobs/generate-survey', methods=['POST'])
+def create_generation_job():
+    """Queue survey generation in the background; poll GET /jobs/<id> or pass webhookUrl"""
+    try:
+        body, status = submit_generation_job(request.get_json(silent=True), tenant_id(request),
+                                             request.headers.get(IDEMPOTENCY_HEADER))
+        response = jsonify(body)
+        response.status_code = status
+        if status == 202:
+            response.headers['Location'] = body['statusUrl']
+        return response
+    except Exception as e:
+        print(f"Create job error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a background job, with its result once finished"""
+    report = job_report(job_id)
+    if report is None:
+        return jsonify({
+            'success': False,
+            'message': 'Job not found'
+        }), 404
+    return jsonify(report)
+
+@app.route('/usage', methods=['GET'])
+def get_usage():
+    """Aggregated upstream token usage per tenant"""
+    report = usage_report(request.args)
+    if report is None:
+        return jsonify({
+            'success': False,
+            'message': 'No usage recorded for this tenant'
+        }), 404
+    return jsonify(report)
+
+def generate_batch_item(item, degrade):
+    """Batch items are bulk traffic: queued behind interactive requests and shed first"""
+    try:
+        return admitted_generation(item, 'bulk')
+    except AdmissionRejected as e:
+        record_rejection(e, 'bulk')
+        if degrade:
+            return degraded_result(item, e)
+        return dict(rejection_body(e), message=f'Shed under load ({e.reason})')
+
+def batch_concurrency(data, count):
+    """Parallel items for a batch, capped at the bulk share of admission slots.
+
+    Items are bulk traffic, so more workers than bulk slots would only queue
+    against each other and be shed after ADMISSION_BULK_MAX_WAIT.
+    """
+    concurrency = BATCH_CONCURRENCY
+    if isinstance(data, dict) and data.get('concurrency') is not None:
+        concurrency = data['concurrency']
+    return max(1, min(concurrency, BATCH_MAX_CONCURRENCY, admission.bulk_limit, count))
+
+def validate_batch_concurrency(data):
+    """Return an error message for an invalid batch ``concurrency``, or None"""
+    if not isinstance(data, dict) or data.get('concurrency') is None:
+        return None
+    concurrency = data['concurrency']
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int) \
+            or not 1 <= concurrency <= BATCH_MAX_CONCURRENCY:
+        return f'concurrency must be an integer between 1 and {BATCH_MAX_CONCURRENCY}'
+    return None
+
+@app.route('/generate-survey/batch', methods=['POST'])
+def generate_survey_batch():
+    """Generate several surveys concurrently, reporting per-item results"""
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('requirements') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'A non-empty requirements array is required'
+            }), 400
+        
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'message': f'Batch size exceeds limit of {BATCH_MAX_ITEMS}'
+            }), 400
+        
+        error = validate_batch_concurrency(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+        
+        concurrency = batch_concurrency(data, len(items))
+        
+        try:
+            admission.check_rate(client_id(request), 'bulk')
+        except AdmissionRejected as e:
+            record_rejection(e, 'bulk')
+            return rejection_response(e)
+        
+        degrade = allows_degraded(data)
+        tenant = tenant_id(request)
+        results = []
+        failures = []
+        pending = {}
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for index, item in enumerate(items):
+                error = validate_survey_requirements(item)
+                if error:
+                    failures.append({'index': index, 'message': error})
+                else:
+                    pending[index] = executor.submit(generate_batch_item, item, degrade or allows_degraded(item))
+            
+            for index, future in pending.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Batch item {index} error: {str(e)}")
+                    result = {'success': False, 'message': 'Internal server error'}
+                record_token_usage(tenant, result)
+                
+                if result['success']:
+                    results.append(dict(result, index=index))
+                else:
+                    failure = {'index': index, 'message': result.get('message')}
+                    if 'retryAfter' in result:
+                        failure['retryAfter'] = result['retryAfter']
+                    failures.append(failure)
+        
+        failures.sort(key=lambda f: f['index'])
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'failures': failures,
+            'total': len(items),
+            'succeeded': len(results),
+            'failed': len(failures)
+        })
+            
+    except Exception as e:
+        print(f"Generate survey batch error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+def improvement_goals(req):
+    """Goals for a streamed improvement request, from ?goals=clarity,engagement"""
+    goals = [goal.strip() for goal in req.args.get('goals', 'clarity').split(',')]
+    return [goal for goal in goals if goal]
+
+def is_ndjson_request(req):
+    return req.mimetype == 'application/x-ndjson'
+
 @app.route('/improve-questions', methods=['POST'])
 def improve_questions():
     """Improve existing survey questions"""
     try:
+        if is_ndjson_request(request):
+            return stream_improved_questions(improvement_goals(request))
+        
         data = request.get_json()
         
         questions = data.get('questions', [])
@@ -490,33 +1274,353 @@ def improve_questions():
             'message': 'Internal server error'
         }), 500
 
+def stream_improved_questions(goals):
+    """Improve an NDJSON body line by line without buffering it"""
+    def generate():
+        records = iter_ndjson(request.stream)
+        for event, payload in ai_service.stream_improved_questions(records, goals):
+            yield format_ndjson(event, payload)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+
+def suggestions_response(req, response_class):
+    """Serve the catalog's prebuilt body for a lookup, answering 304 when the ETag matches"""
+    category = req.args.get('category')
+    if not category:
+        return None
+    body, etag = ai_service.suggestions.response_for(category, req.args.get('targetAudience'))
+    if req.if_none_match.contains(etag):
+        response = response_class(status=304)
+    else:
+        response = response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={SUGGESTIONS_MAX_AGE}'
+    return response
+
 @app.route('/suggestions', methods=['GET'])
 def get_suggestions():
     """Get survey suggestions based on category"""
     try:
-        category = request.args.get('category')
-        target_audience = request.args.get('targetAudience')
-        
-        if not category:
+        response = suggestions_response(request, Response)
+        if response is None:
             return jsonify({
                 'success': False,
                 'message': 'Category parameter is required'
             }), 400
+
+        return response
+
+    except Exception as e:
+        print(f"Get suggestions error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+def validate_search_request(args):
+    """Return an error message for invalid search parameters, or None"""
+    if not args.get('q', '').strip():
+        return 'Query parameter q is required'
+    try:
+        limit = int(args.get('limit', 10))
+    except ValueError:
+        return 'limit must be an integer'
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return f'limit must be between 1 and {SEARCH_MAX_LIMIT}'
+    return None
+
+def search_question_bank(args):
+    ai_service.templates.preload(args.get('language'), args.get('category'))
+    results = ai_service.bank.search(
+        args.get('q'),
+        limit=int(args.get('limit', 10)),
+        question_types=args.getlist('type') or None,
+        category=args.get('category'),
+        language=args.get('language')
+    )
+    return {
+        'success': True,
+        'results': results,
+        'count': len(results),
+        'indexed': len(ai_service.bank)
+    }
+
+@app.route('/search-questions', methods=['GET'])
+def search_questions():
+    """Search previously generated and template questions (BM25)"""
+    try:
+        error = validate_search_request(request.args)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        return jsonify(search_question_bank(request.args))
+
+    except Exception as e:
+        print(f"Search questions error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+LANGUAGE_CODE = re.compile(r'[a-z]{2,3}(-[a-z0-9]{2,8})?')
+
+def validate_question_list(questions):
+    if not isinstance(questions, list) or not questions:
+        return 'questions must be a non-empty array'
+    for question in questions:
+        if not isinstance(question, dict) or not isinstance(question.get('text'), str) or not question['text']:
+            return 'Each question needs a text string'
+        options = question.get('options')
+        if options is not None and (not isinstance(options, list)
+                                    or not all(isinstance(option, str) for option in options)):
+            return 'options must be an array of strings'
+    return None
+
+def validate_translate_request(data):
+    """Return an error message for an invalid translation request, or None"""
+    if not isinstance(data, dict):
+        return 'No data provided'
+    target = data.get('targetLanguage')
+    source = data.get('sourceLanguage', 'en')
+    for field, code in (('targetLanguage', target), ('sourceLanguage', source)):
+        if not isinstance(code, str) or not LANGUAGE_CODE.fullmatch(code):
+            return f'{field} must be a language code such as "hi" or "or"'
+    if source == target:
+        return 'sourceLanguage and targetLanguage must differ'
+    if 'surveys' in data:
+        surveys = data['surveys']
+        if not isinstance(surveys, list) or not surveys or not all(isinstance(s, dict) for s in surveys):
+            return 'surveys must be a non-empty array of objects with questions'
+        question_lists = [survey.get('questions') for survey in surveys]
+    else:
+        question_lists = [data.get('questions')]
+    for questions in question_lists:
+        error = validate_question_list(questions)
+        if error:
+            return error
+    strings = sum(1 + len(question.get('options') or ()) for questions in question_lists for question in questions)
+    if strings > TRANSLATE_MAX_STRINGS:
+        return f'Request has {strings} strings, more than the limit of {TRANSLATE_MAX_STRINGS}'
+    return None
+
+def translation_job(data):
+    """(question lists, source, target, use_backend) for a validated translation request"""
+    surveys = [survey['questions'] for survey in data['surveys']] if 'surveys' in data else [data['questions']]
+    use_backend = TRANSLATOR == 'llm' and not use_demo_generation()
+    return surveys, data.get('sourceLanguage', 'en'), data['targetLanguage'], use_backend
+
+def translation_response(data, result):
+    stats = result['stats']
+    metrics.TRANSLATED_STRINGS.inc(stats['fromMemory'], origin='memory')
+    metrics.TRANSLATED_STRINGS.inc(stats['translated'], origin='backend')
+    metrics.TRANSLATED_STRINGS.inc(stats['untranslated'], origin='untranslated')
+    body = {
+        'success': True,
+        'sourceLanguage': data.get('sourceLanguage', 'en'),
+        'targetLanguage': data['targetLanguage'],
+        'untranslated': result['untranslated'],
+        'stats': stats
+    }
+    if 'surveys' in data:
+        body['surveys'] = [dict(survey, questions=questions)
+                           for survey, questions in zip(data['surveys'], result['surveys'])]
+    else:
+        body['questions'] = result['surveys'][0]
+    return body
+
+@app.route('/translate-survey', methods=['POST'])
+def translate_survey():
+    """Translate questions and options through the translation memory, batching misses"""
+    try:
+        data = request.get_json(silent=True)
+        error = validate_translate_request(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        surveys, source, target, use_backend = translation_job(data)
+        result = ai_service.translator.translate(surveys, source, target, use_backend=use_backend)
+        return jsonify(translation_response(data, result))
+
+    except Exception as e:
+        print(f"Translate survey error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/analyze/sentiment', methods=['POST'])
+def analyze_sentiment():
+    """Score free-text answers and aggregate sentiment per question"""
+    try:
+        if is_ndjson_request(request):
+            return stream_sentiment()
         
-        result = ai_service.get_suggestions_demo(category, target_audience)
+        data = request.get_json(silent=True)
+        answers = data.get('answers') if isinstance(data, dict) else data
         
-        if result['success']:
-            return jsonify(result)
-        else:
-            return jsonify(result), 500
+        if not isinstance(answers, list) or not answers:
+            return jsonify({
+                'success': False,
+                'message': 'A non-empty answers array is required'
+            }), 400
+        
+        return jsonify(sentiment_analyzer.analyze(answers))
             
     except Exception as e:
-        print(f"Get suggestions error: {str(e)}")
+        print(f"Analyze sentiment error: {str(e)}")
         return jsonify({
             'success': False,
             'message': 'Internal server error'
         }), 500
 
+def stream_sentiment():
+    """Score an NDJSON body of answers in fixed-size batches without buffering it"""
+    def generate():
+        records = iter_ndjson(request.stream)
+        for event, payload in sentiment_analyzer.stream(records, SENTIMENT_BATCH_SIZE):
+            yield format_ndjson(event, payload)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+
+def validate_responses(responses):
+    """Return an error message unless every response, and every answer in it, is an object, or None"""
+    for response in responses:
+        if not isinstance(response, dict):
+            return 'Each response must be an object'
+        answers = response.get('answers')
+        if answers and not (isinstance(answers, list) and all(isinstance(answer, dict) for answer in answers)):
+            return 'Each response\'s answers must be an array of objects'
+        if response.get('metadata') and not isinstance(response['metadata'], dict):
+            return 'Each response\'s metadata must be an object'
+    return None
+
+def validate_questions(questions):
+    if questions is not None and not (isinstance(questions, list) and all(isinstance(q, dict) for q in questions)):
+        return 'Questions must be an array of objects'
+    return None
+
+def validate_spam_request(data):
+    """Return an error message for an invalid spam analysis request, or None"""
+    if not isinstance(data, dict):
+        return 'No data provided'
+    responses = data.get('responses')
+    if not isinstance(responses, list) or not responses:
+        return 'A non-empty responses array is required'
+    if len(responses) > SPAM_MAX_RESPONSES:
+        return f'Batch size exceeds limit of {SPAM_MAX_RESPONSES}'
+    error = validate_responses(responses) or validate_questions(data.get('questions'))
+    if error:
+        return error
+    if any(q.get('options') is not None and not isinstance(q['options'], list) for q in data.get('questions') or []):
+        return 'Question options must be an array'
+    threshold = data.get('threshold')
+    if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, (int, float))
+                                  or not 0 <= threshold <= 1):
+        return 'threshold must be a number between 0 and 1'
+    return None
+
+def detect_spam(data):
+    detector = spam_detector
+    if data.get('threshold') is not None:
+        detector = SpamDetector(spam_threshold=data['threshold'], duplicate_window=SPAM_DUPLICATE_WINDOW)
+    return detector.analyze(data['responses'], data.get('questions'))
+
+@app.route('/analyze/spam', methods=['POST'])
+def analyze_spam():
+    """Score a batch of survey responses for straight-lining, speeding and duplicates"""
+    try:
+        data = request.get_json(silent=True)
+        
+        error = validate_spam_request(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+        
+        return jsonify(detect_spam(data))
+            
+    except Exception as e:
+        print(f"Analyze spam error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+def validate_ingest_request(data):
+    """Return an error message for an invalid analytics ingest request, or None"""
+    if not isinstance(data, dict):
+        return 'No data provided'
+    if not data.get('surveyId'):
+        return 'Missing required field: surveyId'
+    responses = data.get('responses')
+    if not isinstance(responses, list) or not responses:
+        return 'A non-empty responses array is required'
+    if len(responses) > ANALYTICS_MAX_BATCH:
+        return f'Batch size exceeds limit of {ANALYTICS_MAX_BATCH}'
+    # Checked up front: a bad record found mid-ingest would leave the batch half-applied
+    return validate_responses(responses) or validate_questions(data.get('questions'))
+
+def ingest_responses(data, idempotency_key=None):
+    """Count a batch once per idempotency key; returns (body, status)"""
+    survey_id = str(data['surveyId'])
+    try:
+        total, applied = analytics_store.ingest(survey_id, data['responses'], data.get('questions'),
+                                                idempotency_key[:200] if idempotency_key else None)
+    except IngestConflict:
+        return {'success': False, 'message': f'{IDEMPOTENCY_HEADER} was already used with a different batch'}, 422
+    return {
+        'success': True,
+        'surveyId': survey_id,
+        'ingested': len(data['responses']) if applied else 0,
+        'deduplicated': not applied,
+        'totalResponses': total
+    }, 200
+
+@app.route('/analytics/ingest', methods=['POST'])
+def analytics_ingest():
+    """Fold new responses into the running per-survey aggregates"""
+    try:
+        data = request.get_json(silent=True)
+        
+        error = validate_ingest_request(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+        
+        body, status = ingest_responses(data, request.headers.get(IDEMPOTENCY_HEADER))
+        return jsonify(body), status
+            
+    except Exception as e:
+        print(f"Analytics ingest error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/analytics/<survey_id>', methods=['GET'])
+def get_analytics(survey_id):
+    """Return the current analytics snapshot for a survey"""
+    snapshot = analytics_store.snapshot(survey_id)
+    if snapshot is None:
+        return jsonify({
+            'success': False,
+            'message': 'No analytics for this survey'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'analytics': snapshot
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -539,4 +1643,7 @@ if __name__ == '__main__':
     print(f"🔧 Demo mode: {DEMO_MODE}")
     print(f"🌐 API URL: http://localhost:{port}")
     
+    # With the reloader, only the child process that serves requests runs jobs
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_runner()
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,578 @@
+"""asyncio-native serving mode for the AI survey service.
+
+Serves the same routes as ``app.py`` on Quart, with upstream calls made through
+``AsyncUpstreamClient`` so a waiting generation holds a coroutine instead of a
+worker thread. Run it with ``python asgi.py`` (graceful shutdown on SIGTERM /
+SIGINT), or under any ASGI server, e.g. ``hypercorn asgi:app --workers 4``.
+"""
+import asyncio
+import os
+import signal
+from contextlib import nullcontext
+from datetime import datetime
+
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+
+import metrics
+from admission import AdmissionRejected
+from app import (
+    AI_API_KEY, AI_API_URL, BATCH_MAX_ITEMS, CONNECT_TIMEOUT, DEMO_MODE, IDEMPOTENCY_HEADER, MAX_RETRIES,
+    REQUEST_TIMEOUT, RETRIEVAL_FIRST, SENTIMENT_BATCH_SIZE, STREAM_HEADERS, admission, ai_service,
+    allows_degraded, analytics_store, batch_concurrency, client_id, degraded_result, detect_spam,
+    encode_stream_event, hedge_options, improvement_goals, ingest_responses, is_ndjson_request, job_report,
+    job_runner, job_stats, metric_route, needs_upstream, record_rejection, record_token_usage, rejection_body,
+    request_priority, requested_stream_format, routing_stats, search_question_bank, sentiment_analyzer,
+    stream_encoding, submit_generation_job, suggestions_response, tenant_id, token_ledger, translation_job,
+    translation_response, usage_report, use_demo_generation, validate_batch_concurrency,
+    validate_ingest_request, validate_search_request, validate_spam_request, validate_survey_requirements,
+    validate_translate_request
+)
+from hedging import AsyncHedgedUpstream, HedgedUpstream
+from sentiment import SentimentAggregate
+from streaming import aiter_ndjson, format_ndjson
+from upstream import AsyncUpstreamClient
+
+
+ASYNC_POOL_SIZE = int(os.getenv('AI_ASYNC_POOL_SIZE', 100))
+SHUTDOWN_GRACE_PERIOD = float(os.getenv('SHUTDOWN_GRACE_PERIOD', 30))
+
+app = cors(Quart(__name__))
+
+# Created inside the serving loop; shares the sync client's breaker so /health
+# and both serving modes agree on upstream state
+upstream = None
+
+
+@app.before_serving
+async def open_upstream():
+    global upstream
+
+    def client(url, api_key, breaker):
+        return AsyncUpstreamClient(
+            url,
+            api_key,
+            timeout=REQUEST_TIMEOUT,
+            connect_timeout=CONNECT_TIMEOUT,
+            max_retries=MAX_RETRIES,
+            pool_size=ASYNC_POOL_SIZE,
+            breaker=breaker
+        )
+
+    if isinstance(ai_service.upstream, HedgedUpstream):
+        # Same backends, breakers and latency stats as the sync client
+        upstream = AsyncHedgedUpstream(
+            [backend.with_client(client(backend.client.url, backend.client.api_key, backend.client.breaker))
+             for backend in ai_service.upstream.backends],
+            **hedge_options()
+        )
+    else:
+        upstream = client(AI_API_URL, AI_API_KEY, ai_service.upstream.breaker)
+    job_runner()
+
+@app.after_serving
+async def close_upstream():
+    if upstream is not None:
+        await upstream.aclose()
+    await asyncio.to_thread(analytics_store.checkpoint)
+    await asyncio.to_thread(ai_service.bank.save)
+
+async def generate_survey_questions(data, gate=None):
+    if data.get('retrievalFirst', RETRIEVAL_FIRST):
+        return await ai_service.generate_questions_retrieval_async(data, upstream, use_ai=not use_demo_generation(),
+                                                                   gate=gate)
+    if use_demo_generation():
+        return ai_service.generate_questions_demo(data)
+    return await ai_service.generate_questions_cached_async(data, upstream, gate)
+
+async def admitted_generation(data, priority):
+    return await generate_survey_questions(data, gate=lambda: admission.slot_async(priority))
+
+def rejection_response(rejected):
+    return jsonify(rejection_body(rejected)), 429, {'Retry-After': str(rejected.retry_after)}
+
+def stream_survey_questions(data, stream_format, priority='interactive', tenant='anonymous'):
+    formatter, mimetype = stream_encoding(stream_format)
+
+    async def generate():
+        use_ai = not use_demo_generation()
+        try:
+            async with admission.slot_async(priority) if needs_upstream(data) else nullcontext():
+                async for event, payload in ai_service.stream_questions_async(
+                        data, upstream, use_ai=use_ai, on_usage=lambda usage: token_ledger.record(tenant, usage)):
+                    yield encode_stream_event(formatter, event, payload)
+        except AdmissionRejected as e:
+            record_rejection(e, priority)
+            if not allows_degraded(data):
+                yield formatter('error', rejection_body(e))
+                return
+            metrics.DEMO_FALLBACKS.inc(reason='shed')
+            async for event, payload in ai_service.stream_questions_async(data, upstream, use_ai=False):
+                yield encode_stream_event(formatter, event, payload)
+
+    return Response(generate(), mimetype=mimetype, headers=STREAM_HEADERS)
+
+@app.before_request
+async def start_request_metrics():
+    g.metrics_route = metric_route(request)
+    g.metrics_started = metrics.request_started(g.metrics_route)
+
+@app.after_request
+async def finish_request_metrics(response):
+    if 'metrics_started' in g:
+        metrics.request_finished(g.metrics_route, request.method, response.status_code, g.pop('metrics_started'))
+    return response
+
+@app.teardown_request
+async def abort_request_metrics(error):
+    if 'metrics_started' in g:
+        metrics.request_finished(g.metrics_route, request.method, 500, g.pop('metrics_started'))
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'healthy',
+        'service': 'AI Survey Generator',
+        'version': '1.0.0',
+        'timestamp': datetime.now().isoformat(),
+        'demo_mode': DEMO_MODE,
+        'serving': 'asgi',
+        'upstream': ai_service.upstream.breaker.snapshot(),
+        'routing': routing_stats(upstream),
+        'cache': ai_service.cache.stats(),
+        'coalescing': ai_service.inflight.stats(),
+        'questionBank': ai_service.bank.stats(),
+        'templates': ai_service.templates.stats(),
+        'admission': admission.stats(),
+        'jobs': job_stats(),
+        'translation': ai_service.translator.stats()
+    })
+
+@app.route('/generate-survey', methods=['POST'])
+async def generate_survey():
+    """Generate survey questions using AI"""
+    try:
+        data = await request.get_json()
+
+        error = validate_survey_requirements(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        priority = request_priority(request)
+        try:
+            admission.check_rate(client_id(request), priority)
+            stream_format = requested_stream_format(request)
+            if stream_format:
+                return stream_survey_questions(data, stream_format, priority, tenant_id(request))
+            result = await admitted_generation(data, priority)
+        except AdmissionRejected as e:
+            record_rejection(e, priority)
+            if not allows_degraded(data):
+                return rejection_response(e)
+            result = degraded_result(data, e)
+        record_token_usage(tenant_id(request), result)
+
+        if result['success']:
+            return jsonify(result)
+        else:
+            return jsonify(result), 500
+
+    except Exception as e:
+        print(f"Generate survey error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/jobs/generate-survey', methods=['POST'])
+async def create_generation_job():
+    """Queue survey generation in the background; poll GET /jobs/<id> or pass webhookUrl"""
+    try:
+        body, status = submit_generation_job(await request.get_json(silent=True), tenant_id(request),
+                                             request.headers.get(IDEMPOTENCY_HEADER))
+        headers = {'Location': body['statusUrl']} if status == 202 else {}
+        return jsonify(body), status, headers
+    except Exception as e:
+        print(f"Create job error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """Status of a background job, with its result once finished"""
+    report = job_report(job_id)
+    if report is None:
+        return jsonify({
+            'success': False,
+            'message': 'Job not found'
+        }), 404
+    return jsonify(report)
+
+@app.route('/usage', methods=['GET'])
+async def get_usage():
+    """Aggregated upstream token usage per tenant"""
+    report = usage_report(request.args)
+    if report is None:
+        return jsonify({
+            'success': False,
+            'message': 'No usage recorded for this tenant'
+        }), 404
+    return jsonify(report)
+
+@app.route('/generate-survey/batch', methods=['POST'])
+async def generate_survey_batch():
+    """Generate several surveys concurrently, reporting per-item results"""
+    try:
+        data = await request.get_json(silent=True) or {}
+        items = data.get('requirements') if isinstance(data, dict) else data
+
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'A non-empty requirements array is required'
+            }), 400
+
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'message': f'Batch size exceeds limit of {BATCH_MAX_ITEMS}'
+            }), 400
+
+        error = validate_batch_concurrency(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        semaphore = asyncio.Semaphore(batch_concurrency(data, len(items)))
+
+        try:
+            admission.check_rate(client_id(request), 'bulk')
+        except AdmissionRejected as e:
+            record_rejection(e, 'bulk')
+            return rejection_response(e)
+
+        degrade = allows_degraded(data)
+
+        async def run(item):
+            async with semaphore:
+                try:
+                    return await admitted_generation(item, 'bulk')
+                except AdmissionRejected as e:
+                    record_rejection(e, 'bulk')
+                    if degrade or allows_degraded(item):
+                        return degraded_result(item, e)
+                    return dict(rejection_body(e), message=f'Shed under load ({e.reason})')
+
+        tenant = tenant_id(request)
+        results = []
+        failures = []
+        pending = {}
+
+        for index, item in enumerate(items):
+            error = validate_survey_requirements(item)
+            if error:
+                failures.append({'index': index, 'message': error})
+            else:
+                pending[index] = run(item)
+
+        outcomes = await asyncio.gather(*pending.values(), return_exceptions=True)
+        for index, result in zip(pending, outcomes):
+            if isinstance(result, Exception):
+                print(f"Batch item {index} error: {str(result)}")
+                result = {'success': False, 'message': 'Internal server error'}
+            record_token_usage(tenant, result)
+
+            if result['success']:
+                results.append(dict(result, index=index))
+            else:
+                failure = {'index': index, 'message': result.get('message')}
+                if 'retryAfter' in result:
+                    failure['retryAfter'] = result['retryAfter']
+                failures.append(failure)
+
+        failures.sort(key=lambda f: f['index'])
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'failures': failures,
+            'total': len(items),
+            'succeeded': len(results),
+            'failed': len(failures)
+        })
+
+    except Exception as e:
+        print(f"Generate survey batch error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/improve-questions', methods=['POST'])
+async def improve_questions():
+    """Improve existing survey questions"""
+    try:
+        if is_ndjson_request(request):
+            return stream_improved_questions(improvement_goals(request))
+
+        data = await request.get_json()
+
+        questions = data.get('questions', [])
+        goals = data.get('improvementGoals', ['clarity'])
+
+        if not questions:
+            return jsonify({
+                'success': False,
+                'message': 'Questions array is required'
+            }), 400
+
+        result = ai_service.improve_questions_demo(questions, goals)
+
+        if result['success']:
+            return jsonify(result)
+        else:
+            return jsonify(result), 500
+
+    except Exception as e:
+        print(f"Improve questions error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+def stream_improved_questions(goals):
+    """Improve an NDJSON body line by line without buffering it"""
+    body = request.body
+
+    async def generate():
+        tally = ai_service.new_improvement_tally()
+        async for index, question in aiter_ndjson(body):
+            yield format_ndjson(*ai_service.improve_record(index, question, goals, tally))
+        yield format_ndjson('done', ai_service.improvement_summary(tally))
+
+    return Response(generate(), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+
+@app.route('/suggestions', methods=['GET'])
+async def get_suggestions():
+    """Get survey suggestions based on category"""
+    try:
+        response = suggestions_response(request, Response)
+        if response is None:
+            return jsonify({
+                'success': False,
+                'message': 'Category parameter is required'
+            }), 400
+
+        return response
+
+    except Exception as e:
+        print(f"Get suggestions error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/search-questions', methods=['GET'])
+async def search_questions():
+    """Search previously generated and template questions (BM25)"""
+    try:
+        error = validate_search_request(request.args)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        return jsonify(await asyncio.to_thread(search_question_bank, request.args))
+
+    except Exception as e:
+        print(f"Search questions error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/translate-survey', methods=['POST'])
+async def translate_survey():
+    """Translate questions and options through the translation memory, batching misses"""
+    try:
+        data = await request.get_json(silent=True)
+        error = validate_translate_request(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        surveys, source, target, use_backend = translation_job(data)
+        result = await ai_service.translator.translate_async(surveys, source, target, upstream,
+                                                             use_backend=use_backend)
+        return jsonify(translation_response(data, result))
+
+    except Exception as e:
+        print(f"Translate survey error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/analyze/sentiment', methods=['POST'])
+async def analyze_sentiment():
+    """Score free-text answers and aggregate sentiment per question"""
+    try:
+        if is_ndjson_request(request):
+            return stream_sentiment()
+
+        data = await request.get_json(silent=True)
+        answers = data.get('answers') if isinstance(data, dict) else data
+
+        if not isinstance(answers, list) or not answers:
+            return jsonify({
+                'success': False,
+                'message': 'A non-empty answers array is required'
+            }), 400
+
+        return jsonify(sentiment_analyzer.analyze(answers))
+
+    except Exception as e:
+        print(f"Analyze sentiment error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+def stream_sentiment():
+    """Score an NDJSON body of answers in fixed-size batches without buffering it"""
+    body = request.body
+
+    async def generate():
+        aggregate = SentimentAggregate()
+        batch = []
+        count = 0
+        async for record in aiter_ndjson(body):
+            batch.append(record)
+            if len(batch) >= SENTIMENT_BATCH_SIZE:
+                for event in sentiment_analyzer.score_records(batch, aggregate):
+                    yield format_ndjson(*event)
+                count += len(batch)
+                batch = []
+        if batch:
+            for event in sentiment_analyzer.score_records(batch, aggregate):
+                yield format_ndjson(*event)
+            count += len(batch)
+        yield format_ndjson('done', sentiment_analyzer.summary(aggregate, count))
+
+    return Response(generate(), mimetype='application/x-ndjson', headers=STREAM_HEADERS)
+
+@app.route('/analyze/spam', methods=['POST'])
+async def analyze_spam():
+    """Score a batch of survey responses for straight-lining, speeding and duplicates"""
+    try:
+        data = await request.get_json(silent=True)
+
+        error = validate_spam_request(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        # Large batches are CPU-bound; keep the event loop free for other requests
+        return jsonify(await asyncio.to_thread(detect_spam, data))
+
+    except Exception as e:
+        print(f"Analyze spam error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/analytics/ingest', methods=['POST'])
+async def analytics_ingest():
+    """Fold new responses into the running per-survey aggregates"""
+    try:
+        data = await request.get_json(silent=True)
+
+        error = validate_ingest_request(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        body, status = await asyncio.to_thread(ingest_responses, data, request.headers.get(IDEMPOTENCY_HEADER))
+        return jsonify(body), status
+
+    except Exception as e:
+        print(f"Analytics ingest error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/analytics/<survey_id>', methods=['GET'])
+async def get_analytics(survey_id):
+    """Return the current analytics snapshot for a survey"""
+    snapshot = await asyncio.to_thread(analytics_store.snapshot, survey_id)
+    if snapshot is None:
+        return jsonify({
+            'success': False,
+            'message': 'No analytics for this survey'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'analytics': snapshot
+    })
+
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({
+        'success': False,
+        'message': 'Endpoint not found'
+    }), 404
+
+@app.errorhandler(500)
+async def internal_error(error):
+    return jsonify({
+        'success': False,
+        'message': 'Internal server error'
+    }), 500
+
+async def serve(port):
+    """Serve with Hypercorn until SIGINT/SIGTERM, then drain in-flight requests"""
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f'0.0.0.0:{port}']
+    config.graceful_timeout = SHUTDOWN_GRACE_PERIOD
+
+    shutdown = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown.set)
+
+    await hypercorn_serve(app, config, shutdown_trigger=shutdown.wait)
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5001))
+
+    print(f"🤖 AI Survey Service (ASGI) starting on port {port}")
+    print(f"🔧 Demo mode: {DEMO_MODE}")
+    print(f"🌐 API URL: http://localhost:{port}")
+
+    asyncio.run(serve(port))
@@ -0,0 +1,190 @@
+"""Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+Point the service at it with ``AI_API_URL=http://127.0.0.1:<port>/v1/chat/completions``.
+Latency, error rate, malformed-JSON rate and streaming chunking are configurable
+so the AI path can be benchmarked reproducibly without a real provider.
+
+    python -m bench.fake_llm --port 8089 --latency 0.8 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+QUESTION_COUNT = re.compile(r'Create a survey with (\d+) questions')
+
+
+class FakeLLMConfig:
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, malformed_rate=0.0,
+                 chunk_size=24, chunk_delay=0.01, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def roll(self):
+        """Return (delay, fail, malformed) for one request"""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            return delay, self.rng.random() < self.error_rate, self.rng.random() < self.malformed_rate
+
+
+def fake_questions(count):
+    types = ('multiple-choice', 'text', 'rating-scale', 'yes-no')
+    questions = []
+    for i in range(count):
+        question = {
+            'type': types[i % len(types)],
+            'text': f'Benchmark question {i + 1}?',
+            'required': i < count // 2,
+            'order': i
+        }
+        if question['type'] == 'multiple-choice':
+            question['options'] = ['Option A', 'Option B', 'Option C', 'Option D']
+        questions.append(question)
+    return questions
+
+
+def fake_translations(request):
+    """Reply to a batched translation prompt by tagging each string with the target language"""
+    return {'translations': [f"[{request.get('target')}] {text}" for text in request['strings']]}
+
+
+def build_content(payload, malformed):
+    messages = payload.get('messages', [])
+    prompt = ' '.join(m.get('content', '') for m in messages)
+    try:
+        request = json.loads(messages[-1]['content'])
+    except (IndexError, KeyError, ValueError):
+        request = None
+    if isinstance(request, dict) and isinstance(request.get('strings'), list):
+        content = json.dumps(fake_translations(request), ensure_ascii=False)
+    else:
+        match = QUESTION_COUNT.search(prompt)
+        content = json.dumps({'questions': fake_questions(int(match.group(1)) if match else 8)})
+    if malformed:
+        # Truncated JSON, the way a cut-off completion looks
+        content = content[:len(content) // 2]
+    return content
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+
+        delay, fail, malformed = self.config.roll()
+        time.sleep(delay)
+
+        if fail:
+            self._send_json(503, {'error': {'message': 'fake upstream overloaded'}})
+            return
+
+        content = build_content(payload, malformed)
+        usage = {
+            'prompt_tokens': sum(len(m.get('content', '')) for m in payload.get('messages', [])) // 4,
+            'completion_tokens': len(content) // 4
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        if payload.get('stream'):
+            self._send_stream(content)
+        else:
+            self._send_json(200, {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': usage
+            })
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        size = self.config.chunk_size
+        for start in range(0, len(content), size):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': content[start:start + size]}}]}
+            self._write_chunk(f'data: {json.dumps(chunk)}\n\n')
+            time.sleep(self.config.chunk_delay)
+        self._write_chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+def start_fake_llm(config, host='127.0.0.1', port=0):
+    """Start the fake server on a daemon thread; returns (server, url)"""
+    handler = type('ConfiguredFakeLLMHandler', (FakeLLMHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/v1/chat/completions'
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.5, help='base response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of completions with broken JSON')
+    parser.add_argument('--chunk-size', type=int, default=24, help='characters per streamed delta')
+    parser.add_argument('--chunk-delay', type=float, default=0.01, help='seconds between streamed deltas')
+    parser.add_argument('--seed', type=int, default=None, help='seed for error/malformed sampling')
+
+
+def config_from_args(args):
+    return FakeLLMConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        seed=args.seed
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_fake_llm(config_from_args(args), args.host, args.port)
+    print(f"Fake LLM listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
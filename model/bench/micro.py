@@ -0,0 +1,83 @@
+"""Micro-benchmarks for the in-process demo paths.
+
+Times ``generate_questions_demo``, the bulk ``generate_surveys_demo`` and
+``improve_questions_demo`` directly on a ``SurveyAIService`` (no HTTP) and
+prints JSON with calls/s and per-call latency.
+
+    cd model && python -m bench.micro --iterations 20000
+"""
+import argparse
+import json
+import os
+import platform
+import time
+from datetime import datetime
+
+from bench.run import QUESTIONS, SURVEY
+from bench.stats import summarize
+
+
+def time_calls(fn, iterations, repeat_size=100):
+    """Run ``fn`` ``iterations`` times, sampling latency per block of ``repeat_size`` calls"""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(max(1, iterations // repeat_size)):
+        block_started = time.perf_counter()
+        for _ in range(repeat_size):
+            fn()
+        samples.append((time.perf_counter() - block_started) / repeat_size)
+    duration = time.perf_counter() - started
+    calls = len(samples) * repeat_size
+    return {
+        'calls': calls,
+        'duration_s': round(duration, 4),
+        'calls_per_s': round(calls / duration, 1),
+        'per_call_ms': summarize(samples)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--questions', type=int, default=8, help='numberOfQuestions per generated survey')
+    parser.add_argument('--surveys', type=int, default=10, help='surveys per generate_surveys_demo call')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DEMO_MODE', 'true')
+    from app import SurveyAIService
+
+    service = SurveyAIService()
+    requirements = dict(SURVEY, numberOfQuestions=args.questions)
+    seeded = dict(requirements, seed=42)
+    goals = ['clarity', 'engagement']
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+            'questions_per_survey': args.questions,
+            'surveys_per_bulk_call': args.surveys
+        },
+        'results': {
+            'generate_questions_demo': time_calls(lambda: service.generate_questions_demo(requirements),
+                                                  args.iterations),
+            'generate_questions_demo_seeded': time_calls(lambda: service.generate_questions_demo(seeded),
+                                                         args.iterations),
+            'generate_surveys_demo': time_calls(lambda: service.generate_surveys_demo(seeded, args.surveys),
+                                                max(1, args.iterations // args.surveys)),
+            'improve_questions_demo': time_calls(lambda: service.improve_questions_demo(QUESTIONS, goals),
+                                                 args.iterations)
+        }
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Load benchmark for the AI survey service.
+
+Starts the fake LLM server and the service (Flask or ASGI) as a subprocess,
+drives each route at a fixed concurrency and prints machine-readable JSON with
+throughput and p50/p95/p99 latency, so results can be diffed between releases.
+
+    cd model && python -m bench.run --mode both --requests 200 --concurrency 16 --output bench.json
+
+``--second-backend-latency`` starts a second fake LLM with that latency and
+serves generation from both through AI_BACKENDS, exercising hedged requests.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from bench.fake_llm import add_arguments, config_from_args, start_fake_llm
+from bench.stats import summarize
+
+
+MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SURVEY = {
+    'title': 'District Water Supply Feedback',
+    'description': 'Citizen feedback on daily water supply',
+    'category': 'feedback',
+    'targetAudience': 'residents',
+    'numberOfQuestions': 8,
+    'questionTypes': ['multiple-choice', 'text', 'rating-scale', 'yes-no']
+}
+
+QUESTIONS = [
+    {'type': 'text', 'text': 'Please describe how you utilize the service'},
+    {'type': 'multiple-choice', 'text': 'How can we facilitate better access', 'options': ['A', 'B']},
+    {'type': 'rating-scale', 'text': 'Rate your satisfaction with our service'}
+]
+
+
+def unique_survey(i):
+    # Vary the title so the result cache doesn't turn the AI path into a cache benchmark
+    return dict(SURVEY, title=f"{SURVEY['title']} #{i}")
+
+
+ROUTES = {
+    'health': ('GET', '/health', None, False),
+    'suggestions': ('GET', '/suggestions?category=feedback&targetAudience=residents', None, False),
+    'generate-survey': ('POST', '/generate-survey', unique_survey, False),
+    'generate-survey-stream': ('POST', '/generate-survey?stream=ndjson', unique_survey, True),
+    'generate-survey-batch': ('POST', '/generate-survey/batch',
+                              lambda i: {'requirements': [unique_survey(f'{i}.{j}') for j in range(4)]}, False),
+    'improve-questions': ('POST', '/improve-questions',
+                          lambda i: {'questions': QUESTIONS, 'improvementGoals': ['clarity', 'engagement']}, False),
+    'metrics': ('GET', '/metrics', None, False)
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_service(server, env_overrides, timeout=30):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), DEBUG='false', **env_overrides)
+    process = subprocess.Popen(
+        [sys.executable, 'asgi.py' if server == 'asgi' else 'app.py'],
+        cwd=MODEL_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Service exited with code {process.returncode}')
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).ok:
+                return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('Service did not become healthy in time')
+
+
+def stop_service(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def drive_route(base_url, route, total, concurrency):
+    method, path, body, stream = ROUTES[route]
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        first_byte = None
+        try:
+            response = session.request(method, base_url + path, json=body(i) if body else None,
+                                       stream=stream, timeout=120)
+            if stream:
+                for line in response.iter_lines():
+                    if line and first_byte is None:
+                        first_byte = time.perf_counter() - started
+            else:
+                response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, first_byte, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, range(total)))
+    duration = time.perf_counter() - started
+
+    latencies = [latency for latency, _, ok in outcomes if ok]
+    result = {
+        'route': route,
+        'requests': total,
+        'errors': sum(1 for _, _, ok in outcomes if not ok),
+        'concurrency': concurrency,
+        'duration_s': round(duration, 4),
+        'throughput_rps': round(len(latencies) / duration, 2) if duration else 0.0,
+        'latency_ms': summarize(latencies)
+    }
+    if stream:
+        result['first_event_ms'] = summarize([fb for _, fb, ok in outcomes if ok and fb is not None])
+    return result
+
+
+def run_mode(mode, args, llm_url, second_url=None):
+    env = {
+        'DEMO_MODE': 'true' if mode == 'demo' else 'false',
+        'AI_API_KEY': 'bench-key',
+        'AI_API_URL': llm_url,
+        'AI_CACHE_TTL': str(args.cache_ttl)
+    }
+    if second_url:
+        env['AI_BACKENDS'] = json.dumps([
+            {'name': 'primary', 'url': llm_url, 'apiKey': 'bench-key'},
+            {'name': 'secondary', 'url': second_url, 'apiKey': 'bench-key'}
+        ])
+    process, base_url = start_service(args.server, env)
+    try:
+        results = []
+        for route in args.routes:
+            # One untimed request per route warms connection pools and lazy state
+            drive_route(base_url, route, 1, 1)
+            results.append(dict(drive_route(base_url, route, args.requests, args.concurrency), mode=mode))
+        return results
+    finally:
+        stop_service(process)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('demo', 'ai', 'both'), default='both')
+    parser.add_argument('--server', choices=('flask', 'asgi'), default='flask')
+    parser.add_argument('--routes', nargs='+', choices=sorted(ROUTES), default=sorted(ROUTES))
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--cache-ttl', type=int, default=0, help='AI_CACHE_TTL for the service (0 disables)')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--second-backend-latency', type=float, default=None,
+                        help='also start a second fake LLM with this latency and hedge across both')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    llm, llm_url = start_fake_llm(config_from_args(args))
+    second, second_url = None, None
+    if args.second_backend_latency is not None:
+        config = config_from_args(args)
+        config.latency = args.second_backend_latency
+        second, second_url = start_fake_llm(config)
+    try:
+        modes = ('demo', 'ai') if args.mode == 'both' else (args.mode,)
+        results = [result for mode in modes for result in run_mode(mode, args, llm_url, second_url)]
+    finally:
+        llm.shutdown()
+        if second is not None:
+            second.shutdown()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'server': args.server,
+            'requests_per_route': args.requests,
+            'concurrency': args.concurrency,
+            'fake_llm': {
+                'latency': args.latency,
+                'jitter': args.jitter,
+                'error_rate': args.error_rate,
+                'malformed_rate': args.malformed_rate,
+                'seed': args.seed,
+                'second_backend_latency': args.second_backend_latency
+            }
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
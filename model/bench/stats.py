@@ -0,0 +1,24 @@
+import math
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(seconds):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(1000 * sum(values) / len(values), 3),
+        'p50': round(1000 * percentile(values, 0.50), 3),
+        'p95': round(1000 * percentile(values, 0.95), 3),
+        'p99': round(1000 * percentile(values, 0.99), 3),
+        'max': round(1000 * values[-1], 3)
+    }
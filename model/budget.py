@@ -0,0 +1,149 @@
+import math
+import re
+import threading
+
+
+WORD_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# Rough completion tokens for one question of each type in the JSON reply,
+# including its keys and punctuation; the learned ratio corrects for drift
+QUESTION_TOKENS = {
+    'multiple-choice': 60,
+    'text': 32,
+    'rating-scale': 34,
+    'yes-no': 32
+}
+DEFAULT_QUESTION_TOKENS = 40
+ENVELOPE_TOKENS = 12
+# Non-Latin scripts cost several tokens per word
+NON_ENGLISH_FACTOR = 2.5
+OTHER_TENANTS = '__other__'
+
+
+def estimate_tokens(text):
+    """Approximate BPE token count: short ASCII words are one token, other scripts about one per character"""
+    tokens = 0
+    for piece in WORD_PATTERN.findall(text or ''):
+        if piece.isascii():
+            tokens += 1 + len(piece) // 8
+        else:
+            tokens += len(piece)
+    return tokens
+
+
+class TokenBudget:
+    """Sizes ``max_tokens`` from the requested questions instead of a fixed ceiling.
+
+    The estimate per question type is scaled by a ratio learned from observed
+    completion tokens (EWMA), plus a safety ``margin``. A reply cut off at the
+    budget (``finish_reason == 'length'``) raises the ratio immediately.
+    """
+
+    def __init__(self, margin=1.25, floor=256, cap=4096, smoothing=0.2, min_ratio=0.5, max_ratio=3.0):
+        self.margin = margin
+        self.floor = floor
+        self.cap = cap
+        self.smoothing = smoothing
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.ratio = 1.0
+        self.truncations = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, requirements):
+        """Expected completion tokens for a reply to these requirements"""
+        num_questions = int(requirements.get('numberOfQuestions', 8))
+        question_types = requirements.get('questionTypes') or ['multiple-choice', 'text']
+        tokens = ENVELOPE_TOKENS + sum(
+            QUESTION_TOKENS.get(question_types[i % len(question_types)], DEFAULT_QUESTION_TOKENS)
+            for i in range(num_questions)
+        )
+        if requirements.get('language', 'en') != 'en':
+            tokens *= NON_ENGLISH_FACTOR
+        return tokens
+
+    def max_tokens(self, requirements):
+        budget = math.ceil(self.estimate(requirements) * self.ratio * self.margin)
+        return max(self.floor, min(self.cap, budget))
+
+    def observe(self, requirements, completion_tokens, finish_reason=None):
+        with self._lock:
+            if finish_reason == 'length':
+                self.truncations += 1
+                self.ratio = min(self.max_ratio, self.ratio * 1.25)
+                return
+            if not isinstance(completion_tokens, int) or completion_tokens <= 0:
+                return
+            sample = completion_tokens / self.estimate(requirements)
+            ratio = self.ratio + self.smoothing * (sample - self.ratio)
+            self.ratio = min(self.max_ratio, max(self.min_ratio, ratio))
+
+    def stats(self):
+        return {
+            'ratio': round(self.ratio, 3),
+            'margin': self.margin,
+            'truncations': self.truncations
+        }
+
+
+def usage_summary(usage, prompt_text, completion_text, max_tokens):
+    """Response-facing usage block; falls back to local estimates when upstream sends none"""
+    if isinstance(usage, dict) and isinstance(usage.get('prompt_tokens'), int) \
+            and isinstance(usage.get('completion_tokens'), int):
+        prompt_tokens, completion_tokens, source = usage['prompt_tokens'], usage['completion_tokens'], 'upstream'
+    else:
+        prompt_tokens, completion_tokens = estimate_tokens(prompt_text), estimate_tokens(completion_text)
+        source = 'estimate'
+    return {
+        'promptTokens': prompt_tokens,
+        'completionTokens': completion_tokens,
+        'totalTokens': prompt_tokens + completion_tokens,
+        'maxTokens': max_tokens,
+        'source': source
+    }
+
+
+def no_usage(source):
+    """Usage block for results that did not call upstream (cache hits, coalesced waiters)"""
+    return {'promptTokens': 0, 'completionTokens': 0, 'totalTokens': 0, 'maxTokens': 0, 'source': source}
+
+
+class TokenLedger:
+    """Per-tenant running token totals; tenants past ``max_tenants`` are pooled"""
+
+    def __init__(self, max_tenants=10000):
+        self.max_tenants = max_tenants
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+    def record(self, tenant, usage):
+        with self._lock:
+            entry = self._tenants.get(tenant)
+            if entry is None:
+                if len(self._tenants) >= self.max_tenants:
+                    tenant = OTHER_TENANTS
+                entry = self._tenants.setdefault(tenant, {
+                    'requests': 0, 'upstreamCalls': 0, 'promptTokens': 0, 'completionTokens': 0, 'totalTokens': 0
+                })
+            entry['requests'] += 1
+            if usage['source'] in ('upstream', 'estimate'):
+                entry['upstreamCalls'] += 1
+            entry['promptTokens'] += usage['promptTokens']
+            entry['completionTokens'] += usage['completionTokens']
+            entry['totalTokens'] += usage['totalTokens']
+
+    def snapshot(self, tenant=None):
+        with self._lock:
+            if tenant is not None:
+                entry = self._tenants.get(tenant)
+                return dict(entry) if entry is not None else None
+            return {name: dict(entry) for name, entry in self._tenants.items()}
+
+    def totals(self):
+        with self._lock:
+            totals = {'requests': 0, 'upstreamCalls': 0, 'promptTokens': 0, 'completionTokens': 0, 'totalTokens': 0}
+            for entry in self._tenants.values():
+                for key in totals:
+                    totals[key] += entry[key]
+            totals['tenants'] = len(self._tenants)
+            return totals
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_text(value):
+    return ' '.join(str(value or '').split()).lower()
+
+
+def normalize_requirements(requirements):
+    """Reduce a requirements dict to the fields that shape the generated survey"""
+    question_types = requirements.get('questionTypes') or ['multiple-choice', 'text']
+    try:
+        num_questions = int(requirements.get('numberOfQuestions', 8))
+    except (TypeError, ValueError):
+        num_questions = 8
+    return {
+        'title': _normalize_text(requirements.get('title')),
+        'description': _normalize_text(requirements.get('description')),
+        'category': _normalize_text(requirements.get('category') or 'feedback'),
+        'targetAudience': _normalize_text(requirements.get('targetAudience') or 'general'),
+        'language': _normalize_text(requirements.get('language') or 'en'),
+        'numberOfQuestions': num_questions,
+        'questionTypes': sorted({_normalize_text(t) for t in question_types})
+    }
+
+
+def requirements_key(requirements):
+    """Canonical cache key for a requirements dict"""
+    canonical = json.dumps(normalize_requirements(requirements), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """In-process LRU with TTL, optionally backed by a SQLite file that survives restarts"""
+
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS result_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._db.execute('DELETE FROM result_cache WHERE expires_at <= ?', (time.time(),))
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM result_cache WHERE key = ? AND expires_at > ?',
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._store_memory(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def contains(self, key):
+        """Whether ``key`` is cached in memory, without touching LRU order or hit stats"""
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.time()
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), expires_at)
+                )
+                self._db.commit()
+
+    def _store_memory(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'persistent': self._db is not None
+        }
@@ -0,0 +1,362 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import UPSTREAM_HEDGES
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamError
+
+
+def load_backends(spec):
+    """Parse the AI_BACKENDS JSON list into backend configs.
+
+    Each entry is ``{"url": ..., "apiKey" | "apiKeyEnv": ..., "weight": 1,
+    "model": null, "name": null}``; ``apiKeyEnv`` names an environment
+    variable so keys need not sit in the list itself.
+    """
+    if not spec:
+        return []
+    configs = []
+    for index, entry in enumerate(json.loads(spec)):
+        api_key = entry.get('apiKey') or os.getenv(entry.get('apiKeyEnv') or '')
+        if not entry.get('url') or not api_key:
+            raise ValueError(f'AI_BACKENDS[{index}] needs a url and an apiKey or apiKeyEnv')
+        configs.append({
+            'name': entry.get('name') or f'backend{index}',
+            'url': entry['url'],
+            'api_key': api_key,
+            'weight': float(entry.get('weight', 1)),
+            'model': entry.get('model')
+        })
+    return configs
+
+
+class BackendStats:
+    """Recent latencies (a fixed window) and an EWMA error rate for one backend"""
+
+    def __init__(self, window=200, smoothing=0.1, min_samples=10):
+        self.smoothing = smoothing
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def record_cancelled(self, elapsed):
+        """A call abandoned for another backend's reply: neither a success nor a failure.
+
+        Its elapsed time is kept as a latency sample, a lower bound that keeps
+        a slow tail visible to the percentile.
+        """
+        with self._lock:
+            self.cancelled += 1
+            self._latencies.append(elapsed)
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.requests += 1
+            if latency is not None:
+                self._latencies.append(latency)
+            if not ok:
+                self.failures += 1
+            self.error_rate += self.smoothing * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def percentile(self, q):
+        """Latency at quantile ``q`` of the window, or None until ``min_samples`` are in"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def snapshot(self):
+        p50, p95, p99 = self.percentile(0.5), self.percentile(0.95), self.percentile(0.99)
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'cancelled': self.cancelled,
+            'errorRate': round(self.error_rate, 4),
+            'p50': round(p50, 4) if p50 is not None else None,
+            'p95': round(p95, 4) if p95 is not None else None,
+            'p99': round(p99, 4) if p99 is not None else None
+        }
+
+
+class Backend:
+    """One OpenAI-compatible endpoint: its client, routing weight, model override and stats"""
+
+    def __init__(self, name, client, weight=1.0, model=None, stats=None):
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.model = model
+        self.stats = stats or BackendStats()
+
+    def with_client(self, client):
+        """Same backend (sharing stats) behind another client, e.g. the async one"""
+        return Backend(self.name, client, self.weight, self.model, self.stats)
+
+    def payload(self, payload):
+        return dict(payload, model=self.model) if self.model else payload
+
+
+class BreakerGroup:
+    """Read-only view over the per-backend breakers; open only when every backend is"""
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    @property
+    def state(self):
+        states = {backend.client.breaker.state for backend in self.backends}
+        if states == {CircuitBreaker.OPEN}:
+            return CircuitBreaker.OPEN
+        if CircuitBreaker.CLOSED in states:
+            return CircuitBreaker.CLOSED
+        return CircuitBreaker.HALF_OPEN
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'backends': {backend.name: backend.client.breaker.snapshot() for backend in self.backends}
+        }
+
+
+class _HedgeRouter:
+    """Backend choice and hedge timing shared by the sync and async clients.
+
+    The primary is drawn at random by effective weight: the configured weight
+    scaled down by the backend's error rate and by how much slower its median
+    latency is than the fastest backend's. A hedge goes to the best other
+    backend once the primary has run past its own ``percentile`` latency
+    (``initial_delay`` until enough samples exist), clamped to
+    [``min_delay``, ``max_delay``]; up to ``max_hedges`` hedges fire, each one
+    delay after the last, to the next-best backends in turn. A ``validate`` callable passed to
+    ``post_json`` rejects well-formed HTTP replies whose body is unusable for
+    that call, so the other request can still win.
+    """
+
+    def __init__(self, backends, percentile=0.95, initial_delay=2.0, min_delay=0.05, max_delay=10.0, max_hedges=1):
+        self.backends = backends
+        self.max_hedges = max_hedges
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.breaker = BreakerGroup(backends)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _effective_weights(self, backends):
+        medians = {backend.name: backend.stats.percentile(0.5) for backend in backends}
+        fastest = min((median for median in medians.values() if median), default=None)
+        weights = []
+        for backend in backends:
+            median = medians[backend.name]
+            speed = fastest / median if fastest and median else 1.0
+            weights.append(backend.weight * max(0.01, 1.0 - backend.stats.error_rate) * speed)
+        return weights
+
+    def candidates(self):
+        """Backends whose breaker is not open: a weighted-random primary, then the rest best-first"""
+        backends = [backend for backend in self.backends if backend.client.breaker.state != CircuitBreaker.OPEN]
+        if not backends:
+            raise CircuitOpenError('All upstream backends are open')
+        weights = self._effective_weights(backends)
+        primary = random.choices(range(len(backends)), weights=weights)[0]
+        rest = sorted((i for i in range(len(backends)) if i != primary), key=lambda i: -weights[i])
+        return [backends[primary]] + [backends[i] for i in rest]
+
+    def spares(self, candidates):
+        """Backends to hedge to, in the order they are tried"""
+        return candidates[1:1 + self.max_hedges]
+
+    def hedge_delay(self, backend):
+        delay = backend.stats.percentile(self.percentile)
+        if delay is None:
+            delay = self.initial_delay
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _count_hedge(self):
+        self.hedges += 1
+        UPSTREAM_HEDGES.inc(outcome='fired')
+
+    def _count_win(self, backend, primary):
+        if backend is not primary:
+            self.hedge_wins += 1
+            UPSTREAM_HEDGES.inc(outcome='won')
+
+    def stats(self):
+        return {
+            'hedges': self.hedges,
+            'hedgeWins': self.hedge_wins,
+            'backends': {
+                backend.name: dict(backend.stats.snapshot(), weight=backend.weight,
+                                   hedgeDelay=round(self.hedge_delay(backend), 4),
+                                   circuit=backend.client.breaker.state)
+                for backend in self.backends
+            }
+        }
+
+
+class HedgedUpstream(_HedgeRouter):
+    """Drop-in for ``UpstreamClient`` over several weighted backends with hedged calls.
+
+    ``post_json`` sends to the primary and, if it has not answered within the
+    hedge delay (or fails first), duplicates the call to the next backend; the
+    first valid reply wins and the loser is told to stop retrying. A request
+    already on the wire cannot be aborted from another thread, so its reply is
+    discarded when it lands (its latency still feeds the stats). Streams are
+    routed but not hedged: a second stream would bill the whole reply twice.
+    """
+
+    def __init__(self, backends, pool_size=20, **kwargs):
+        super().__init__(backends, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * (1 + self.max_hedges), thread_name_prefix='hedge')
+
+    def _call(self, backend, payload, cancel, validate):
+        started = time.perf_counter()
+        try:
+            body = backend.client.post_json(backend.payload(payload), cancel=cancel, validate=validate)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            if not cancel.is_set():
+                backend.stats.record(None, ok=False)
+            raise
+        backend.stats.record(time.perf_counter() - started, ok=True)
+        return body
+
+    def post_json(self, payload, validate=None):
+        candidates = self.candidates()
+        primary = candidates[0]
+        spare = self.spares(candidates)
+        cancel = threading.Event()
+        futures = {self._executor.submit(self._call, primary, payload, cancel, validate): primary}
+        pending = set(futures)
+        last_error = None
+
+        while pending:
+            done, pending = wait(pending, timeout=self.hedge_delay(primary) if spare else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    body = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                cancel.set()
+                self._count_win(futures[future], primary)
+                return body
+            # Hedge when the primary is slow (nothing done) or failed with nothing else in flight
+            if spare and (not done or not pending):
+                hedge = spare.pop(0)
+                self._count_hedge()
+                future = self._executor.submit(self._call, hedge, payload, cancel, validate)
+                futures[future] = hedge
+                pending.add(future)
+
+        raise last_error
+
+    def stream_chat(self, payload, usage=None):
+        """Stream from the best available backend, moving on if one fails before its first delta"""
+        last_error = None
+        for backend in self.candidates():
+            started = time.perf_counter()
+            emitted = False
+            try:
+                for delta in backend.client.stream_chat(backend.payload(payload), usage):
+                    emitted = True
+                    yield delta
+            except UpstreamError as e:
+                backend.stats.record(None, ok=False)
+                if emitted:
+                    raise
+                last_error = e
+                continue
+            backend.stats.record(time.perf_counter() - started, ok=True)
+            return
+        raise last_error
+
+    def close(self):
+        for backend in self.backends:
+            backend.client.close()
+        self._executor.shutdown(wait=False)
+
+
+class AsyncHedgedUpstream(_HedgeRouter):
+    """asyncio counterpart of ``HedgedUpstream``; losing calls are cancelled outright"""
+
+    async def _call(self, backend, payload, validate):
+        started = time.perf_counter()
+        try:
+            body = await backend.client.post_json(backend.payload(payload), validate=validate)
+        except asyncio.CancelledError:
+            backend.stats.record_cancelled(time.perf_counter() - started)
+            raise
+        except CircuitOpenError:
+            raise
+        except Exception:
+            backend.stats.record(None, ok=False)
+            raise
+        backend.stats.record(time.perf_counter() - started, ok=True)
+        return body
+
+    async def post_json(self, payload, validate=None):
+        candidates = self.candidates()
+        primary = candidates[0]
+        spare = self.spares(candidates)
+        tasks = {asyncio.ensure_future(self._call(primary, payload, validate)): primary}
+        pending = set(tasks)
+        last_error = None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=self.hedge_delay(primary) if spare else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    self._count_win(tasks[task], primary)
+                    return task.result()
+                if spare and (not done or not pending):
+                    hedge = spare.pop(0)
+                    self._count_hedge()
+                    task = asyncio.ensure_future(self._call(hedge, payload, validate))
+                    tasks[task] = hedge
+                    pending.add(task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def stream_chat(self, payload, usage=None):
+        last_error = None
+        for backend in self.candidates():
+            started = time.perf_counter()
+            emitted = False
+            try:
+                async for delta in backend.client.stream_chat(backend.payload(payload), usage):
+                    emitted = True
+                    yield delta
+            except UpstreamError as e:
+                backend.stats.record(None, ok=False)
+                if emitted:
+                    raise
+                last_error = e
+                continue
+            backend.stats.record(time.perf_counter() - started, ok=True)
+            return
+        raise last_error
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.client.aclose()
@@ -0,0 +1,377 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import JOBS_FINISHED
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobConflict(Exception):
+    """Raised when an idempotency key is reused for a different request"""
+    pass
+
+
+def resolve_webhook(url, allowed_hosts=None):
+    """Check a webhook URL; returns (address, error).
+
+    With ``allowed_hosts`` only those hosts are accepted and ``address`` is
+    None (connect normally). Otherwise the host must resolve, and only to
+    publicly routable addresses, so job results can't be sent to loopback,
+    private or link-local services (such as a cloud metadata endpoint);
+    ``address`` is the checked IP the delivery must connect to.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return None, 'webhookUrl must be an absolute http(s) URL'
+    host = parsed.hostname.lower()
+    if allowed_hosts:
+        return None, None if host in allowed_hosts else 'webhookUrl host is not allowed'
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, parsed.port, proto=socket.IPPROTO_TCP)]
+    except (socket.gaierror, UnicodeError, ValueError):
+        return None, 'webhookUrl host does not resolve'
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            return None, 'webhookUrl must point to a public address'
+    return addresses[0], None
+
+
+def webhook_url_error(url, allowed_hosts=None):
+    """Return an error message for a webhook URL the runner must not call, or None"""
+    return resolve_webhook(url, allowed_hosts)[1]
+
+
+class PinnedAddressAdapter(HTTPAdapter):
+    """Connects to ``address`` whatever the URL's host resolves to now.
+
+    The hostname is still used for SNI and certificate checks, so a checked
+    address can't be swapped by DNS rebinding between check and connect.
+    """
+
+    def __init__(self, address, hostname, **kwargs):
+        self.address = address
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        host_params, pool_kwargs = self.build_connection_pool_key_attributes(request, verify, cert)
+        host_params['host'] = self.address
+        if host_params['scheme'] == 'https':
+            pool_kwargs['server_hostname'] = self.hostname
+            pool_kwargs['assert_hostname'] = self.hostname
+        return self.poolmanager.connection_from_host(**host_params, pool_kwargs=pool_kwargs)
+
+
+class JobStore:
+    """Job records in SQLite, shared by every worker process pointed at the same file.
+
+    A job is claimed by moving it from queued to running with a lease; a
+    running job whose lease has expired (its process died) is claimable
+    again, up to ``max_attempts`` claims. Finished jobs are kept for ``ttl``
+    seconds so a client that timed out can still collect the result.
+    """
+
+    def __init__(self, db_path=':memory:', ttl=86400, lease=300, max_attempts=3):
+        self.ttl = ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        if db_path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, tenant TEXT, dedupe_key TEXT, '
+            'payload TEXT NOT NULL, result TEXT, error TEXT, webhook_url TEXT, webhook_status TEXT, '
+            'attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, started_at REAL, '
+            'finished_at REAL, lease_until REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key)')
+        self._db.commit()
+        self.purge()
+
+    def submit(self, kind, payload, tenant=None, dedupe_key=None, reuse_finished=False, webhook_url=None,
+               max_pending=None):
+        """Create a job, or return an existing one with the same ``dedupe_key``; returns (job_id, created).
+
+        Only queued or running jobs are reused unless ``reuse_finished``, which
+        also matches succeeded ones (idempotency keys). Failed jobs never are.
+        An idempotency key must come back with the same payload and webhook,
+        else ``JobConflict`` is raised.
+        """
+        now = time.time()
+        with self._lock:
+            if dedupe_key:
+                statuses = (QUEUED, RUNNING, SUCCEEDED if reuse_finished else RUNNING)
+                row = self._db.execute(
+                    'SELECT id, payload, webhook_url FROM jobs WHERE dedupe_key = ? AND status IN (?, ?, ?) '
+                    'ORDER BY created_at DESC LIMIT 1',
+                    (dedupe_key, *statuses)
+                ).fetchone()
+                if row is not None:
+                    if reuse_finished and (json.loads(row['payload']) != payload
+                                           or row['webhook_url'] != webhook_url):
+                        raise JobConflict(f'Job {row["id"]} was submitted with a different request')
+                    return row['id'], False
+            if max_pending is not None:
+                (pending,) = self._db.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()
+                if pending >= max_pending:
+                    raise JobQueueFull(f'{pending} jobs already queued')
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                'INSERT INTO jobs (id, kind, status, tenant, dedupe_key, payload, webhook_url, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, QUEUED, tenant, dedupe_key, json.dumps(payload), webhook_url, now)
+            )
+            self._db.commit()
+        return job_id, True
+
+    def claim(self):
+        """Lease the oldest runnable job to the caller; returns the job dict or None"""
+        now = time.time()
+        with self._lock:
+            while True:
+                row = self._db.execute(
+                    'SELECT id, attempts FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) '
+                    'ORDER BY created_at LIMIT 1',
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row['attempts'] >= self.max_attempts:
+                    # Its worker died mid-run every time; don't hand it out again
+                    self._db.execute(
+                        'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND attempts = ?',
+                        (FAILED, 'Job was interrupted too many times', now, row['id'], row['attempts'])
+                    )
+                    self._db.commit()
+                    continue
+                # Conditional on the attempt count we read, so two processes can't both claim it
+                claimed = self._db.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? '
+                    'WHERE id = ? AND attempts = ? AND (status = ? OR (status = ? AND lease_until < ?))',
+                    (RUNNING, now, now + self.lease, row['id'], row['attempts'], QUEUED, RUNNING, now)
+                ).rowcount
+                self._db.commit()
+                if claimed:
+                    return self._get(row['id'])
+
+    def finish(self, job_id, result=None, error=None):
+        with self._lock:
+            self._db.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?',
+                (FAILED if error else SUCCEEDED, json.dumps(result) if result is not None else None,
+                 error, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def set_webhook_status(self, job_id, status):
+        with self._lock:
+            self._db.execute('UPDATE jobs SET webhook_status = ? WHERE id = ?', (status, job_id))
+            self._db.commit()
+
+    def _get(self, job_id):
+        row = self._db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._get(job_id)
+
+    def purge(self):
+        """Delete finished jobs older than ``ttl``"""
+        with self._lock:
+            deleted = self._db.execute(
+                'DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+                (SUCCEEDED, FAILED, time.time() - self.ttl)
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+
+
+def public_job(job):
+    """Client-facing view of a job record"""
+    view = {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'createdAt': job['created_at'],
+        'startedAt': job['started_at'],
+        'finishedAt': job['finished_at']
+    }
+    if job['status'] == SUCCEEDED:
+        view['result'] = job['result']
+    elif job['status'] == FAILED:
+        view['error'] = job['error']
+    if job['webhook_url']:
+        view['webhook'] = {'url': job['webhook_url'], 'status': job['webhook_status'] or 'pending'}
+    return view
+
+
+class JobRunner:
+    """Worker threads that claim jobs from a JobStore and run ``handlers[kind](payload, tenant)``.
+
+    A handler returns a result dict with ``success``; a falsy ``success``
+    marks the job failed with the result's ``message``. ``submit`` wakes an
+    idle worker at once; jobs queued by other processes or recovered after a
+    restart are picked up within ``poll_interval`` seconds. When a job has a
+    webhook URL its final state is POSTed there, signed with HMAC-SHA256 in
+    ``X-Signature`` when ``webhook_secret`` is set. ``resolve_url`` re-checks
+    the URL just before delivery, as its DNS may have changed since submission,
+    and returns (address, error) like ``resolve_webhook``; the POST connects to
+    that address and redirects are never followed.
+    """
+
+    def __init__(self, store, handlers, workers=4, poll_interval=1.0, webhook_timeout=5.0,
+                 webhook_retries=3, webhook_secret=None, purge_interval=600.0, resolve_url=None):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.webhook_timeout = webhook_timeout
+        self.webhook_retries = webhook_retries
+        self.webhook_secret = webhook_secret
+        self.purge_interval = purge_interval
+        self.resolve_url = resolve_url
+        self._wake = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._last_purge = time.monotonic()
+        self.session = requests.Session()
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, kind, payload, **kwargs):
+        job_id, created = self.store.submit(kind, payload, **kwargs)
+        if created:
+            with self._wake:
+                self._wake.notify()
+        return job_id, created
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                job = self.store.claim()
+            except sqlite3.Error as e:
+                print(f"Job claim error: {str(e)}")
+                job = None
+            if job is None:
+                self._maybe_purge()
+                with self._wake:
+                    if not self._stopping:
+                        self._wake.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            result = self.handlers[job['kind']](job['payload'], job['tenant'])
+            if result.get('success'):
+                self.store.finish(job['id'], result=result)
+            else:
+                self.store.finish(job['id'], error=result.get('message') or 'Generation failed')
+        except Exception as e:
+            print(f"Job {job['id']} error: {str(e)}")
+            self.store.finish(job['id'], error='Internal server error')
+
+        finished = self.store.get(job['id'])
+        JOBS_FINISHED.inc(kind=finished['kind'], status=finished['status'])
+        if finished['webhook_url']:
+            self._deliver(finished)
+
+    def _deliver(self, job):
+        address, error = self.resolve_url(job['webhook_url']) if self.resolve_url is not None else (None, None)
+        if error:
+            print(f"Job {job['id']} webhook not sent: {error}")
+            self.store.set_webhook_status(job['id'], f'rejected: {error}')
+            return
+        body = json.dumps(public_job(job)).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['X-Signature'] = 'sha256=' + hmac.new(
+                self.webhook_secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        session = self.session
+        if address is not None:
+            parsed = urlparse(job['webhook_url'])
+            session = requests.Session()
+            # A proxy from the environment would resolve the host again
+            session.trust_env = False
+            session.mount(f'{parsed.scheme}://', PinnedAddressAdapter(address, parsed.hostname))
+            headers['Host'] = parsed.netloc.rpartition('@')[2]
+        status = 'failed'
+        for attempt in range(self.webhook_retries):
+            try:
+                response = session.post(job['webhook_url'], data=body, headers=headers,
+                                        timeout=self.webhook_timeout, allow_redirects=False)
+                if response.status_code < 300:
+                    status = 'delivered'
+                    break
+                status = f'failed: HTTP {response.status_code}'
+                if response.is_redirect:
+                    # The target could be anything, including an internal address
+                    status += ' redirect not followed'
+                    break
+            except requests.RequestException as e:
+                status = f'failed: {type(e).__name__}'
+            if attempt + 1 < self.webhook_retries:
+                time.sleep(min(2 ** attempt, 10))
+        if session is not self.session:
+            session.close()
+        self.store.set_webhook_status(job['id'], status)
+
+    def _maybe_purge(self):
+        if time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic()
+        try:
+            self.store.purge()
+        except sqlite3.Error as e:
+            print(f"Job purge error: {str(e)}")
@@ -0,0 +1,202 @@
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class _CallbackMetric:
+    """Metric whose value is read from a callable at scrape time"""
+
+    def __init__(self, kind, name, help_text, fn):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {_format_value(self.fn())}']
+
+
+class Registry:
+    """Process-local metric registry rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Duplicate metric {metric.name}')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, kind, name, help_text, fn):
+        self._metrics.pop(name, None)
+        return self._register(_CallbackMetric(kind, name, help_text, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'survey_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'survey_http_request_duration_seconds', 'HTTP request latency by route', ('route',))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'survey_http_requests_in_flight', 'HTTP requests currently being served', ('route',))
+UPSTREAM_CONNECT = REGISTRY.histogram(
+    'survey_upstream_connect_seconds', 'Time to open a new upstream connection (TCP + TLS)',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'survey_upstream_request_duration_seconds', 'Total time of one upstream attempt by outcome', ('outcome',))
+UPSTREAM_TOKENS = REGISTRY.counter(
+    'survey_upstream_tokens_total', 'Tokens reported in upstream usage blocks', ('kind',))
+DEMO_FALLBACKS = REGISTRY.counter(
+    'survey_demo_fallbacks_total', 'AI generations served from demo templates, by reason', ('reason',))
+ADMISSION_REJECTED = REGISTRY.counter(
+    'survey_admission_rejected_total', 'Generation requests shed by admission control', ('reason', 'priority'))
+UPSTREAM_HEDGES = REGISTRY.counter(
+    'survey_upstream_hedges_total', 'Hedged duplicate upstream requests fired, and those that won', ('outcome',))
+TRANSLATED_STRINGS = REGISTRY.counter(
+    'survey_translated_strings_total', 'Unique strings served by /translate-survey, by origin', ('origin',))
+JOBS_FINISHED = REGISTRY.counter(
+    'survey_jobs_total', 'Background jobs finished, by kind and final status', ('kind', 'status'))
+
+
+def record_usage(usage):
+    """Fold an OpenAI-style ``usage`` block into the token counters"""
+    if not isinstance(usage, dict):
+        return
+    for kind in ('prompt', 'completion'):
+        tokens = usage.get(f'{kind}_tokens')
+        if isinstance(tokens, int):
+            UPSTREAM_TOKENS.inc(tokens, kind=kind)
+
+
+def request_started(route):
+    HTTP_IN_FLIGHT.inc(route=route)
+    return time.perf_counter()
+
+
+def request_finished(route, method, status, started):
+    HTTP_IN_FLIGHT.dec(route=route)
+    HTTP_LATENCY.observe(time.perf_counter() - started, route=route)
+    HTTP_REQUESTS.inc(route=route, method=method, status=status)
@@ -0,0 +1,487 @@
+import bisect
+import hashlib
+import json
+import math
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: saves then assume a single writer process
+    fcntl = None
+
+
+def _combining_marks():
+    """Regex class body of every combining mark (Unicode category M*) in the BMP.
+
+    ``\\w`` leaves marks out, which splits words in scripts such as Devanagari
+    at each vowel sign.
+    """
+    ranges = []
+    for code in range(0x10000):
+        if unicodedata.category(chr(code)).startswith('M'):
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    return ''.join(f'\\u{start:04x}-\\u{end:04x}' for start, end in ranges)
+
+
+# Letters and digits of any script, with their combining marks
+TOKEN_PATTERN = re.compile(rf'[^\W_](?:[^\W_]|[{_combining_marks()}])*')
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'in',
+    'is', 'it', 'of', 'on', 'or', 'our', 'survey', 'the', 'this', 'to', 'was', 'we', 'were', 'what',
+    'which', 'with', 'would', 'you', 'your'
+})
+MAGIC = b'QBANK001'
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def text_hash(text):
+    """64-bit fingerprint of a question's normalized text, used for dedup"""
+    normalized = ' '.join(text.lower().split())
+    return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class BankSegment:
+    """Read-only, memory-mapped snapshot of a question bank.
+
+    File layout: magic, little-endian u64 header length, JSON header (term ->
+    posting range, type/category/language names, array layout), then 8-byte
+    aligned arrays. Arrays are views into one ``np.memmap``, so workers opening
+    the same file share its pages and loading is O(vocabulary), not O(questions).
+    Files written before languages were tracked held English questions only.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(8) != MAGIC:
+                raise ValueError(f'Not a question bank file: {path}')
+            (header_length,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length))
+
+        self.path = path
+        self.terms = header['terms']
+        self.types = header['types']
+        self.categories = header['categories']
+        self.languages = header.get('languages', ['en'])
+        self.total_length = header['totalLength']
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        data_start = _align(16 + header_length)
+        arrays = {}
+        for name, (offset, dtype, length) in header['arrays'].items():
+            start = data_start + offset
+            arrays[name] = raw[start:start + length * np.dtype(dtype).itemsize].view(dtype)
+        self.postings_doc = arrays['postings_doc']
+        self.postings_tf = arrays['postings_tf']
+        self.doc_length = arrays['doc_length']
+        self.doc_type = arrays['doc_type']
+        self.doc_category = arrays['doc_category']
+        self.doc_language = arrays.get('doc_language')
+        self.doc_offsets = arrays['doc_offsets']
+        self.doc_bytes = arrays['doc_bytes']
+        self.hashes = arrays['hashes']
+        self.size = len(self.doc_length)
+        if self.doc_language is None:
+            self.doc_language = np.zeros(self.size, dtype=np.uint16)
+
+    def postings(self, term):
+        span = self.terms.get(term)
+        if span is None:
+            return None
+        return self.postings_doc[span[0]:span[1]], self.postings_tf[span[0]:span[1]]
+
+    def contains(self, fingerprint):
+        i = np.searchsorted(self.hashes, np.uint64(fingerprint))
+        return i < len(self.hashes) and int(self.hashes[i]) == fingerprint
+
+    def document(self, doc_id):
+        return json.loads(self.doc_bytes[self.doc_offsets[doc_id]:self.doc_offsets[doc_id + 1]].tobytes())
+
+    @staticmethod
+    def write(path, header, arrays):
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            offset = _align(offset)
+            layout[name] = [offset, array.dtype.str, len(array)]
+            offset += array.nbytes
+        blob = json.dumps(dict(header, arrays=layout), separators=(',', ':')).encode('utf-8')
+        data_start = _align(16 + len(blob))
+
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(blob)))
+            f.write(blob)
+            for name, array in arrays.items():
+                f.write(b'\0' * (data_start + layout[name][0] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers keep their mapping of the old inode, so swapping is safe under load
+        os.replace(temp_path, path)
+
+
+class _BankView:
+    """The segment plus the in-memory tail as they stood at one instant.
+
+    Doc ids are stable across saves (tail doc ``i`` becomes segment doc
+    ``base + i``), and the tail lists are only ever appended to or replaced,
+    so a view stays valid without holding the lock.
+    """
+
+    def __init__(self, segment, base, documents, lengths, doc_types, doc_categories, doc_languages, tail_length,
+                 postings):
+        self.segment = segment
+        self.base = base
+        self.size = base + len(documents)
+        self.documents = documents
+        self.lengths = lengths
+        self.doc_types = doc_types
+        self.doc_categories = doc_categories
+        self.doc_languages = doc_languages
+        self.total_length = (segment.total_length if segment else 0) + tail_length
+        self.postings = postings
+
+    def document(self, doc_id, types, categories, languages):
+        if doc_id < self.base:
+            document = self.segment.document(doc_id)
+            type_code = int(self.segment.doc_type[doc_id])
+            category_code = int(self.segment.doc_category[doc_id])
+            language_code = int(self.segment.doc_language[doc_id])
+        else:
+            document = dict(self.documents[doc_id - self.base])
+            type_code = self.doc_types[doc_id - self.base]
+            category_code = self.doc_categories[doc_id - self.base]
+            language_code = self.doc_languages[doc_id - self.base]
+        document['type'] = types[type_code]
+        document['category'] = categories[category_code] or None
+        document['language'] = languages[language_code] or None
+        return document
+
+    def values(self, doc_ids, segment_field, tail_values):
+        """Per-document values for ``doc_ids``, read from the mapped segment or the tail"""
+        values = np.empty(len(doc_ids), dtype=np.int64)
+        in_segment = doc_ids < self.base
+        if in_segment.any():
+            values[in_segment] = getattr(self.segment, segment_field)[doc_ids[in_segment]]
+        if not in_segment.all():
+            values[~in_segment] = [tail_values[i - self.base] for i in doc_ids[~in_segment]]
+        return values
+
+    def candidates(self, terms):
+        """Return (doc ids, tfs, doc lengths, idf per posting, average length, query idf) or None"""
+        if self.size == 0:
+            return None
+        doc_ids, tfs, idfs = [], [], []
+        query_idf = 0.0
+        for term in terms:
+            parts = []
+            if self.segment is not None:
+                found = self.segment.postings(term)
+                if found is not None:
+                    parts.append((found[0].astype(np.int64), found[1].astype(np.float64)))
+            tail = self.postings.get(term)
+            if tail is not None:
+                # Concurrent adds may have grown the lists past this view
+                count = min(len(tail[0]), len(tail[1]))
+                ids = np.array(tail[0][:count], dtype=np.int64)
+                visible = ids < self.size
+                parts.append((ids[visible], np.array(tail[1][:count], dtype=np.float64)[visible]))
+            df = sum(len(ids) for ids, _ in parts)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            # Terms the bank has never seen still count against relevance
+            query_idf += idf
+            if not df:
+                continue
+            for ids, counts in parts:
+                doc_ids.append(ids)
+                tfs.append(counts)
+                idfs.append(np.full(len(ids), idf))
+        if not doc_ids:
+            return None
+
+        doc_ids = np.concatenate(doc_ids)
+        lengths = self.values(doc_ids, 'doc_length', self.lengths).astype(np.float64)
+        return doc_ids, np.concatenate(tfs), lengths, np.concatenate(idfs), self.total_length / self.size, query_idf
+
+
+class QuestionBank:
+    """BM25 search over known questions: a memory-mapped segment plus an in-memory tail.
+
+    New questions go to the tail (deduplicated by normalized text); ``save()``
+    merges the tail into a fresh segment file. Query cost depends on the
+    posting lengths of the query terms, not on the number of questions.
+
+    One process writes a bank file: the first to take ``<path>.lock``.
+    Other processes sharing the path search its segment but keep the
+    questions they add in memory, since replacing the file would drop the
+    writer's.
+    """
+
+    def __init__(self, path=None, save_interval=300.0, k1=1.2, b=0.75):
+        self.path = path
+        self.save_interval = save_interval
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._writer_lock = None
+        self._writer_warned = False
+        self._segment = BankSegment(path) if path and os.path.exists(path) else None
+        self._types = list(self._segment.types) if self._segment else []
+        self._categories = list(self._segment.categories) if self._segment else []
+        self._languages = list(self._segment.languages) if self._segment else []
+        self._type_codes = {name: i for i, name in enumerate(self._types)}
+        self._category_codes = {name: i for i, name in enumerate(self._categories)}
+        self._language_codes = {name: i for i, name in enumerate(self._languages)}
+        self._reset_tail()
+        self._last_save = time.monotonic()
+
+    def _reset_tail(self):
+        self._postings = {}
+        self._documents = []
+        self._lengths = []
+        self._doc_types = []
+        self._doc_categories = []
+        self._doc_languages = []
+        self._doc_hashes = []
+        self._hashes = set()
+        self._tail_length = 0
+        self._dirty = False
+
+    @property
+    def _base(self):
+        return self._segment.size if self._segment else 0
+
+    def __len__(self):
+        return self._base + len(self._documents)
+
+    def _code(self, codes, names, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def add(self, text, question_type, category=None, options=None, source='generated', language=None):
+        """Index one question; returns False if an identical question is already known"""
+        if not isinstance(text, str) or not text.strip():
+            return False
+        fingerprint = text_hash(text)
+        with self._lock:
+            if fingerprint in self._hashes or (self._segment and self._segment.contains(fingerprint)):
+                return False
+            doc_id = self._base + len(self._documents)
+            tokens = tokenize(text)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                docs, tfs = self._postings.setdefault(token, ([], []))
+                docs.append(doc_id)
+                tfs.append(tf)
+            self._documents.append({'text': text, 'options': options, 'source': source})
+            self._lengths.append(len(tokens))
+            self._doc_types.append(self._code(self._type_codes, self._types, question_type or 'text'))
+            self._doc_categories.append(self._code(self._category_codes, self._categories, category or ''))
+            self._doc_languages.append(self._code(self._language_codes, self._languages, language or ''))
+            self._doc_hashes.append(fingerprint)
+            self._hashes.add(fingerprint)
+            self._tail_length += len(tokens)
+            self._dirty = True
+        return True
+
+    def add_questions(self, questions, category=None, source='generated', language=None):
+        added = 0
+        for question in questions:
+            if isinstance(question, dict):
+                added += self.add(question.get('text'), question.get('type'), category,
+                                  question.get('options'), source, language)
+        if added and self.path and time.monotonic() - self._last_save >= self.save_interval:
+            # A save rewrites the whole segment, so it never runs on the caller's thread
+            self._last_save = time.monotonic()
+            threading.Thread(target=self._save_quietly, name='question-bank-save', daemon=True).start()
+        return added
+
+    def _save_quietly(self):
+        try:
+            self.save()
+        except (OSError, ValueError) as e:
+            print(f"Question bank save error: {str(e)}")
+
+    def _is_writer(self):
+        if fcntl is None:
+            return True
+        if self._writer_lock is None:
+            handle = open(f'{self.path}.lock', 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                if not self._writer_warned:
+                    self._writer_warned = True
+                    print(f"Question bank {self.path} is written by another process; new questions stay in memory")
+                return False
+            self._writer_lock = handle
+        return True
+
+    def _view(self):
+        with self._lock:
+            return _BankView(self._segment, self._base, self._documents, self._lengths, self._doc_types,
+                             self._doc_categories, self._doc_languages, self._tail_length, self._postings)
+
+    def search(self, query, limit=10, question_types=None, category=None, language=None):
+        """Top ``limit`` questions by BM25; ``relevance`` is the score over the query's total idf, capped at 1"""
+        terms = list(dict.fromkeys(tokenize(query or '')))
+        view = self._view()
+        found = view.candidates(terms) if terms else None
+        if found is None:
+            return []
+        doc_ids, tfs, lengths, idfs, average_length, query_idf = found
+
+        contributions = idfs * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths / average_length))
+        unique, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions)
+
+        keep = np.ones(len(unique), dtype=bool)
+        if question_types:
+            wanted = [self._type_codes[t] for t in question_types if t in self._type_codes]
+            keep &= np.isin(view.values(unique, 'doc_type', view.doc_types), wanted)
+        if category:
+            code = self._category_codes.get(category, -1)
+            keep &= view.values(unique, 'doc_category', view.doc_categories) == code
+        if language:
+            code = self._language_codes.get(language, -1)
+            keep &= view.values(unique, 'doc_language', view.doc_languages) == code
+        unique, scores = unique[keep], scores[keep]
+
+        if len(unique) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            unique, scores = unique[top], scores[top]
+        order = np.lexsort((unique, -scores))
+
+        results = []
+        for i in order:
+            document = view.document(int(unique[i]), self._types, self._categories, self._languages)
+            document['score'] = round(float(scores[i]), 4)
+            # One occurrence of every query term in an average-length question scores the query idf
+            document['relevance'] = round(min(1.0, float(scores[i]) / query_idf), 4)
+            results.append(document)
+        return results
+
+    def save(self):
+        """Merge the tail into a new segment file and map it in its place.
+
+        The merge works on a snapshot of the tail taken under the lock, so adds
+        and searches carry on meanwhile; questions added during the merge stay
+        in the tail for the next save. Returns False when there was nothing to
+        save or another process owns the file.
+        """
+        if not self.path:
+            return False
+        with self._save_lock:
+            if not self._is_writer():
+                return False
+            with self._lock:
+                if not self._dirty:
+                    return False
+                segment = self._segment
+                count = len(self._documents)
+                documents = self._documents[:count]
+                lengths = self._lengths[:count]
+                doc_types = self._doc_types[:count]
+                doc_categories = self._doc_categories[:count]
+                doc_languages = self._doc_languages[:count]
+                doc_hashes = self._doc_hashes[:count]
+                postings = {term: (docs[:], tfs[:]) for term, (docs, tfs) in self._postings.items()}
+                header = {
+                    'types': list(self._types),
+                    'categories': list(self._categories),
+                    'languages': list(self._languages),
+                    'totalLength': (segment.total_length if segment else 0) + sum(lengths)
+                }
+
+            term_spans = {}
+            doc_parts, tf_parts = [], []
+            position = 0
+            for term in sorted(set(segment.terms if segment else ()) | set(postings)):
+                start = position
+                found = segment.postings(term) if segment is not None else None
+                if found is not None:
+                    doc_parts.append(found[0])
+                    tf_parts.append(found[1])
+                    position += len(found[0])
+                if term in postings:
+                    docs, tfs = postings[term]
+                    doc_parts.append(np.array(docs, dtype=np.uint32))
+                    tf_parts.append(np.array(tfs, dtype=np.uint16))
+                    position += len(docs)
+                term_spans[term] = [start, position]
+
+            blobs = [json.dumps(document, separators=(',', ':')).encode('utf-8') for document in documents]
+            encoded = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+            offsets = np.cumsum([0] + [len(blob) for blob in blobs], dtype=np.int64)
+
+            def merged(name, tail, dtype):
+                tail = np.asarray(tail, dtype=dtype)
+                return np.concatenate([getattr(segment, name), tail]) if segment is not None else tail
+
+            arrays = {
+                'postings_doc': np.concatenate(doc_parts).astype(np.uint32),
+                'postings_tf': np.concatenate(tf_parts).astype(np.uint16),
+                'doc_length': merged('doc_length', lengths, np.uint16),
+                'doc_type': merged('doc_type', doc_types, np.uint8),
+                'doc_category': merged('doc_category', doc_categories, np.uint16),
+                'doc_language': merged('doc_language', doc_languages, np.uint16),
+                'doc_offsets': (np.concatenate([segment.doc_offsets, segment.doc_offsets[-1] + offsets[1:]])
+                                if segment is not None else offsets),
+                'doc_bytes': merged('doc_bytes', encoded, np.uint8),
+                'hashes': np.sort(merged('hashes', doc_hashes, np.uint64))
+            }
+            header['terms'] = term_spans
+            BankSegment.write(self.path, header, arrays)
+            saved = BankSegment(self.path)
+
+            with self._lock:
+                # Doc ids are unchanged: the merged prefix of the tail now lives in the segment
+                self._segment = saved
+                self._documents = self._documents[count:]
+                self._lengths = self._lengths[count:]
+                self._doc_types = self._doc_types[count:]
+                self._doc_categories = self._doc_categories[count:]
+                self._doc_languages = self._doc_languages[count:]
+                self._doc_hashes = self._doc_hashes[count:]
+                self._hashes = set(self._doc_hashes)
+                self._tail_length = sum(self._lengths)
+                tail_postings = {}
+                for term, (docs, tfs) in self._postings.items():
+                    cut = bisect.bisect_left(docs, saved.size)
+                    if cut < len(docs):
+                        tail_postings[term] = (docs[cut:], tfs[cut:])
+                self._postings = tail_postings
+                self._dirty = bool(self._documents)
+                self._last_save = time.monotonic()
+        return True
+
+    def stats(self):
+        return {
+            'questions': len(self),
+            'unsaved': len(self._documents),
+            'persistent': bool(self.path)
+        }
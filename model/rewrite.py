@@ -0,0 +1,100 @@
+import json
+import re
+import threading
+
+
+# Rule kinds:
+#   phrase - replace every occurrence of ``match`` with ``replace``
+#   prefix - strip/replace ``match`` at the start of the text
+#   suffix - make sure the text ends with ``match``
+DEFAULT_RULES = (
+    {'name': 'strip-please', 'goal': 'engagement', 'kind': 'prefix', 'match': 'Please ', 'replace': '',
+     'description': "Removed leading 'Please'"},
+    {'name': 'utilize-to-use', 'goal': 'clarity', 'kind': 'phrase', 'match': 'utilize', 'replace': 'use',
+     'description': "Replaced 'utilize' with 'use'"},
+    {'name': 'facilitate-to-help', 'goal': 'clarity', 'kind': 'phrase', 'match': 'facilitate', 'replace': 'help',
+     'description': "Replaced 'facilitate' with 'help'"},
+    {'name': 'question-mark', 'goal': 'clarity', 'kind': 'suffix', 'match': '?', 'replace': '?',
+     'description': 'Added question mark'},
+)
+RULE_KINDS = ('prefix', 'phrase', 'suffix')
+
+
+def load_rules(path=None):
+    """Rule table from a JSON file (a list of rule objects), or the built-in defaults"""
+    if not path:
+        return DEFAULT_RULES
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    for rule in rules:
+        if rule.get('kind') not in RULE_KINDS or not rule.get('name') or 'match' not in rule:
+            raise ValueError(f'Invalid rewrite rule: {rule!r}')
+    return tuple(rules)
+
+
+class RuleEngine:
+    """Applies every rule for a set of goals in one regex pass per string.
+
+    All selected rules are folded into a single alternation of named groups
+    (prefixes anchored at the start, suffix checks as zero-width matches at the
+    end), so adding a rule does not add another pass over the text. Compiled
+    patterns are cached per goal set; only goals some rule belongs to count,
+    so the cache holds at most one entry per subset of the rule table's goals.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self.goals = frozenset(rule.get('goal', 'clarity') for rule in self.rules)
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def goal_set(self, goals):
+        """The known goals among ``goals``: a list, or a string naming one goal (or several, comma separated)"""
+        if isinstance(goals, str):
+            goals = goals.split(',')
+        elif not isinstance(goals, (list, tuple, set, frozenset)):
+            return frozenset()
+        return frozenset(goal.strip() for goal in goals if isinstance(goal, str) and goal.strip() in self.goals)
+
+    def _compile(self, goals):
+        key = self.goal_set(goals)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            return compiled
+
+        selected = [rule for rule in self.rules if rule.get('goal', 'clarity') in key]
+        # Prefixes must be tried first at position 0, suffix checks last at the end
+        selected.sort(key=lambda rule: RULE_KINDS.index(rule['kind']))
+        alternatives = []
+        by_group = {}
+        for i, rule in enumerate(selected):
+            group = f'r{i}'
+            match = re.escape(rule['match'])
+            if rule['kind'] == 'prefix':
+                pattern = rf'\A{match}'
+            elif rule['kind'] == 'suffix':
+                pattern = rf'(?<!{match})\Z'
+            else:
+                pattern = match
+            alternatives.append(f'(?P<{group}>{pattern})')
+            by_group[group] = rule
+
+        compiled = (re.compile('|'.join(alternatives)) if alternatives else None, by_group)
+        with self._lock:
+            self._compiled[key] = compiled
+        return compiled
+
+    def apply(self, text, goals):
+        """Return (rewritten_text, [fired rule, ...]) with rules in first-fired order"""
+        pattern, by_group = self._compile(goals)
+        if pattern is None:
+            return text, []
+
+        fired = {}
+
+        def substitute(match):
+            rule = by_group[match.lastgroup]
+            fired.setdefault(rule['name'], rule)
+            return rule.get('replace', '')
+
+        return pattern.sub(substitute, text), list(fired.values())
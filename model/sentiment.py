@@ -0,0 +1,202 @@
+import re
+
+import numpy as np
+from scipy import sparse
+
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+NEGATORS = frozenset({
+    'not', 'no', 'never', 'none', 'nothing', 'neither', 'nor', 'cannot', "can't", "don't", "doesn't",
+    "didn't", "isn't", "wasn't", "aren't", "weren't", "won't", "wouldn't", "shouldn't", "couldn't", 'without'
+})
+NEGATION_WINDOW = 3
+
+# Compact offline lexicon (weights roughly on a -3..3 scale); extend or replace
+# with a word<TAB>weight file via SENTIMENT_LEXICON
+DEFAULT_LEXICON = {
+    'good': 1.9, 'great': 3.1, 'excellent': 3.2, 'amazing': 2.8, 'awesome': 3.1, 'best': 3.2,
+    'happy': 2.7, 'satisfied': 1.8, 'helpful': 1.8, 'useful': 1.9, 'easy': 1.9, 'clean': 1.7,
+    'fast': 1.5, 'quick': 1.4, 'friendly': 2.2, 'love': 3.2, 'like': 1.5, 'nice': 1.8, 'fine': 0.8,
+    'improved': 1.9, 'improvement': 1.4, 'efficient': 1.8, 'reliable': 1.8, 'safe': 1.9, 'thank': 1.5,
+    'thanks': 1.9, 'appreciate': 2.1, 'recommend': 1.5, 'convenient': 1.9, 'affordable': 1.5, 'clear': 1.6,
+    'responsive': 1.4, 'polite': 1.8, 'regular': 0.8, 'adequate': 0.9, 'wonderful': 2.7, 'perfect': 2.7,
+    'bad': -2.5, 'poor': -2.1, 'terrible': -2.9, 'awful': -2.9, 'worst': -3.1, 'horrible': -2.5,
+    'slow': -1.5, 'late': -1.3, 'delay': -1.4, 'delayed': -1.5, 'dirty': -1.9, 'broken': -2.1,
+    'corrupt': -2.8, 'corruption': -2.8, 'bribe': -2.5, 'rude': -2.2, 'unsafe': -2.3, 'expensive': -1.4,
+    'difficult': -1.5, 'problem': -1.7, 'problems': -1.7, 'issue': -1.0, 'issues': -1.0, 'complaint': -1.7,
+    'unhappy': -2.4, 'disappointed': -2.3, 'frustrated': -2.2, 'angry': -2.3, 'hate': -2.7,
+    'useless': -2.4, 'waste': -1.8, 'shortage': -1.8, 'lack': -1.4, 'lacking': -1.5, 'irregular': -1.4,
+    'unreliable': -1.9, 'confusing': -1.7, 'neglected': -2.0, 'ignored': -1.7, 'fail': -2.3,
+    'failed': -2.3, 'failure': -2.3, 'scarce': -1.6, 'pathetic': -2.8
+}
+
+
+def load_lexicon(path=None):
+    """Lexicon from a word<TAB>weight file, or the built-in default"""
+    if not path:
+        return DEFAULT_LEXICON
+    lexicon = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            word, weight = line.rstrip('\n').split('\t')[:2]
+            lexicon[word.lower()] = float(weight)
+    return lexicon
+
+
+def normalize_answer(item):
+    """Return (question_id, text) for an answer given as a string or an object"""
+    if isinstance(item, str):
+        return None, item
+    if isinstance(item, dict) and isinstance(item.get('text', item.get('answer')), str):
+        question_id = item.get('questionId')
+        return (str(question_id) if question_id is not None else None), item.get('text', item.get('answer'))
+    raise ValueError('Answer must be a string or an object with a text field')
+
+
+class SentimentModel:
+    """Lexicon-weighted linear sentiment scorer evaluated as one sparse mat-vec per batch.
+
+    Every token maps to a column of a CSR feature matrix; tokens within a short
+    window after a negator map to a mirrored "negated" column whose weight is
+    flipped and damped. Scores are ``raw / sqrt(raw^2 + alpha)`` in (-1, 1).
+    """
+
+    def __init__(self, lexicon=DEFAULT_LEXICON, negation_scale=-0.74, alpha=15.0, neutral_band=0.05):
+        self.vocabulary = {word: i for i, word in enumerate(lexicon)}
+        weights = np.fromiter(lexicon.values(), dtype=np.float64, count=len(lexicon))
+        self.weights = np.concatenate([weights, weights * negation_scale])
+        self.alpha = alpha
+        self.neutral_band = neutral_band
+
+    def features(self, texts):
+        size = len(self.vocabulary)
+        vocabulary = self.vocabulary
+        indices = []
+        indptr = [0]
+        for text in texts:
+            negated_for = 0
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                if token in NEGATORS:
+                    negated_for = NEGATION_WINDOW
+                    continue
+                column = vocabulary.get(token)
+                if column is not None:
+                    indices.append(column + size if negated_for else column)
+                if negated_for:
+                    negated_for -= 1
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(texts), 2 * size))
+
+    def score(self, texts):
+        raw = self.features(texts) @ self.weights
+        return raw / np.sqrt(raw * raw + self.alpha)
+
+    def labels(self, scores):
+        return np.where(scores >= self.neutral_band, 'positive',
+                        np.where(scores <= -self.neutral_band, 'negative', 'neutral'))
+
+
+class SentimentAggregate:
+    """Running per-question counts and score sums, folded in one batch at a time"""
+
+    def __init__(self):
+        self._questions = {}
+
+    def add(self, question_ids, scores, labels):
+        keys = np.array(['' if q is None else q for q in question_ids], dtype=object)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique))
+        sums = np.bincount(inverse, weights=scores, minlength=len(unique))
+        by_label = {
+            label: np.bincount(inverse, weights=(labels == label), minlength=len(unique))
+            for label in ('positive', 'neutral', 'negative')
+        }
+        for i, key in enumerate(unique):
+            entry = self._questions.setdefault(key, {'count': 0, 'sum': 0.0, 'positive': 0, 'neutral': 0, 'negative': 0})
+            entry['count'] += int(counts[i])
+            entry['sum'] += float(sums[i])
+            for label, values in by_label.items():
+                entry[label] += int(values[i])
+
+    def summary(self):
+        summary = {}
+        for key, entry in self._questions.items():
+            summary[key or 'unassigned'] = {
+                'count': entry['count'],
+                'meanScore': round(entry['sum'] / entry['count'], 4),
+                'positive': entry['positive'],
+                'neutral': entry['neutral'],
+                'negative': entry['negative']
+            }
+        return summary
+
+
+class SentimentAnalyzer:
+    def __init__(self, model=None):
+        self.model = model or SentimentModel()
+
+    def score_records(self, records, aggregate):
+        """Score a batch of (index, answer) pairs; returns a list of (event, data) pairs"""
+        events = []
+        valid = []
+        for index, item in records:
+            try:
+                question_id, text = normalize_answer(item)
+            except ValueError as e:
+                events.append(('error', {'index': index, 'message': str(e)}))
+                continue
+            valid.append((index, question_id, text))
+
+        if valid:
+            indexes, question_ids, texts = zip(*valid)
+            scores = self.model.score(texts)
+            labels = self.model.labels(scores)
+            aggregate.add(question_ids, scores, labels)
+            for index, question_id, score, label in zip(indexes, question_ids, scores.tolist(), labels.tolist()):
+                events.append(('answer', {
+                    'index': index,
+                    'questionId': question_id,
+                    'score': round(score, 4),
+                    'label': label
+                }))
+            events.sort(key=lambda event: event[1]['index'])
+        return events
+
+    def analyze(self, answers):
+        """Score a whole array of answers at once"""
+        aggregate = SentimentAggregate()
+        events = self.score_records(enumerate(answers), aggregate)
+        return {
+            'success': True,
+            'results': [data for event, data in events if event == 'answer'],
+            'errors': [data for event, data in events if event == 'error'],
+            'questions': aggregate.summary(),
+            'method': 'lexicon_linear'
+        }
+
+    def stream(self, records, batch_size):
+        """Score an iterator of (index, answer) pairs in fixed-size batches"""
+        aggregate = SentimentAggregate()
+        batch = []
+        count = 0
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield from self.score_records(batch, aggregate)
+                count += len(batch)
+                batch = []
+        if batch:
+            yield from self.score_records(batch, aggregate)
+            count += len(batch)
+        yield 'done', self.summary(aggregate, count)
+
+    def summary(self, aggregate, count):
+        return {
+            'success': True,
+            'count': count,
+            'questions': aggregate.summary(),
+            'method': 'lexicon_linear'
+        }
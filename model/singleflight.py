@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait for and receive the leader's result or
+    exception. Nothing is remembered once the call completes, so this only
+    dedupes overlapping work, unlike ``ResultCache``.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.deduplicated = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, fn):
+        """Coroutine variant of ``do``; ``fn`` is a zero-argument coroutine function"""
+        with self._lock:
+            task = self._async_calls.get(key)
+            if task is None:
+                task = self._async_calls[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda _: self._async_calls.pop(key, None))
+                self.leaders += 1
+            else:
+                self.deduplicated += 1
+
+        # The shared call runs as its own task, so a disconnecting caller (even
+        # the leader) cancels only its own wait, not everyone else's result
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            'inFlight': len(self._calls) + len(self._async_calls),
+            'leaders': self.leaders,
+            'deduplicated': self.deduplicated
+        }
@@ -0,0 +1,264 @@
+from datetime import datetime
+
+import numpy as np
+
+
+CLOSED_TYPES = frozenset({'multiple-choice', 'rating-scale', 'yes-no'})
+YES_NO_CODES = {'yes': 0, 'true': 0, 'no': 1, 'false': 1}
+MISSING = -1
+SOURCE_FIELDS = ('ip', 'userAgent')
+
+
+def _response_id(response, index):
+    return str(response.get('_id') or response.get('responseId') or response.get('id') or index)
+
+
+def _question_id(question):
+    return str(question.get('_id') or question.get('id') or question.get('questionId'))
+
+
+def _timestamp(value):
+    """Seconds since the epoch for an ISO-8601 string or a number, else NaN"""
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+def _value_key(value):
+    if isinstance(value, list):
+        return '\x1f'.join(sorted(str(v) for v in value))
+    return str(value).strip().lower()
+
+
+class ResponseMatrix:
+    """Dense (responses x questions) encoding of a batch of survey responses.
+
+    ``codes`` holds per-question value ids (identical answers share an id),
+    used for fingerprints. ``positions`` holds a comparable answer position for
+    closed questions (option index, rating value, yes=0/no=1) so "same answer
+    everywhere" is visible across questions; open questions are ``MISSING``.
+    ``sources`` holds per-field ids of the submitting IP and user agent
+    (``MISSING`` when absent) and ``submitted`` the submit time in seconds.
+    """
+
+    def __init__(self, responses, questions=None):
+        if questions:
+            question_ids = [_question_id(q) for q in questions]
+            types = {_question_id(q): q.get('type') for q in questions}
+            options = {_question_id(q): {_value_key(o): i for i, o in enumerate(q.get('options') or [])}
+                       for q in questions}
+        else:
+            question_ids = []
+            seen = set()
+            for response in responses:
+                for answer in response.get('answers') or []:
+                    question_id = str(answer.get('questionId'))
+                    if question_id not in seen:
+                        seen.add(question_id)
+                        question_ids.append(question_id)
+            types = {}
+            options = {}
+
+        column = {question_id: i for i, question_id in enumerate(question_ids)}
+        vocabularies = [{} for _ in question_ids]
+        n, q = len(responses), len(question_ids)
+        self.codes = np.full((n, q), MISSING, dtype=np.int32)
+        self.positions = np.full((n, q), MISSING, dtype=np.int32)
+        self.durations = np.full(n, np.nan)
+        self.sources = np.full((n, len(SOURCE_FIELDS)), MISSING, dtype=np.int32)
+        self.submitted = np.full(n, np.nan)
+        self.response_ids = []
+        source_ids = [{} for _ in SOURCE_FIELDS]
+
+        for row, response in enumerate(responses):
+            self.response_ids.append(_response_id(response, row))
+            metadata = response.get('metadata') or {}
+            duration = metadata.get('duration', response.get('duration'))
+            if isinstance(duration, (int, float)) and duration > 0:
+                self.durations[row] = duration
+            for field, source in enumerate(SOURCE_FIELDS):
+                value = metadata.get(source)
+                if isinstance(value, str) and value:
+                    self.sources[row, field] = source_ids[field].setdefault(value, len(source_ids[field]))
+            self.submitted[row] = _timestamp(metadata.get('submitTime') or response.get('createdAt'))
+
+            for answer in response.get('answers') or []:
+                col = column.get(str(answer.get('questionId')))
+                value = answer.get('value')
+                if col is None or value is None or value == '':
+                    continue
+                key = _value_key(value)
+                vocabulary = vocabularies[col]
+                self.codes[row, col] = vocabulary.setdefault(key, len(vocabulary))
+                self.positions[row, col] = self._position(key, types.get(question_ids[col]),
+                                                          options.get(question_ids[col]))
+
+        self.question_ids = question_ids
+
+    @staticmethod
+    def _position(key, question_type, options):
+        if question_type is not None and question_type not in CLOSED_TYPES:
+            return MISSING
+        if options and key in options:
+            return options[key]
+        if key in YES_NO_CODES and question_type in (None, 'yes-no'):
+            return YES_NO_CODES[key]
+        if key.isdigit() and len(key) <= 2:
+            return int(key)
+        # Free-text values can't be compared across questions
+        return MISSING
+
+
+class SpamDetector:
+    """Vectorized response-quality scoring over a ``ResponseMatrix``"""
+
+    def __init__(self, straightline_threshold=0.9, min_closed_answers=3, entropy_threshold=0.2,
+                 speed_z_threshold=-3.5, min_seconds_per_answer=1.0, spam_threshold=0.5, duplicate_window=3600):
+        self.straightline_threshold = straightline_threshold
+        self.min_closed_answers = min_closed_answers
+        self.entropy_threshold = entropy_threshold
+        self.speed_z_threshold = speed_z_threshold
+        self.min_seconds_per_answer = min_seconds_per_answer
+        self.spam_threshold = spam_threshold
+        self.duplicate_window = duplicate_window
+
+    def position_stats(self, positions):
+        """Per-row (closed answers, share of the modal position, normalized entropy)"""
+        n = positions.shape[0]
+        valid = positions >= 0
+        answered = valid.sum(axis=1)
+        if not valid.any():
+            return answered, np.zeros(n), np.ones(n)
+
+        width = int(positions.max()) + 1
+        rows = np.nonzero(valid)[0]
+        counts = np.bincount(rows * width + positions[valid], minlength=n * width).reshape(n, width)
+
+        safe_answered = np.maximum(answered, 1)[:, None]
+        modal_share = counts.max(axis=1) / safe_answered[:, 0]
+        p = counts / safe_answered
+        with np.errstate(divide='ignore', invalid='ignore'):
+            entropy = -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1)
+        max_entropy = np.log2(np.maximum(np.minimum(answered, width), 2))
+        # + 0.0 folds the -0.0 a zero entropy sum produces
+        return answered, modal_share, np.clip(entropy / max_entropy, 0.0, 1.0) + 0.0
+
+    def duration_z(self, durations):
+        """Robust z-score of log completion time (median / MAD); NaN when unknown"""
+        logs = np.log(durations)
+        known = ~np.isnan(logs)
+        z = np.full(durations.shape, np.nan)
+        if known.sum() < 3:
+            return z
+        median = np.median(logs[known])
+        mad = np.median(np.abs(logs[known] - median))
+        if mad == 0:
+            return z
+        z[known] = 0.6745 * (logs[known] - median) / mad
+        return z
+
+    def duplicates(self, codes, sources, submitted):
+        """Index of an earlier identical submission from the same source for each row, or -1.
+
+        Identical answers alone are common on short closed surveys, so a
+        repeat only counts when it also shares the IP or the user agent of
+        the earlier row and arrived within ``duplicate_window`` seconds of it
+        (rows without a submit time are not held to the window).
+        """
+        n = codes.shape[0]
+        duplicate_of = np.full(n, -1)
+        if n == 0 or codes.shape[1] == 0:
+            return duplicate_of
+        rows = np.ascontiguousarray(codes).view(np.dtype((np.void, codes.dtype.itemsize * codes.shape[1]))).ravel()
+        group = np.unique(rows, return_inverse=True)[1].ravel()
+        answered_any = (codes >= 0).any(axis=1)
+
+        for field in range(sources.shape[1]):
+            source = sources[:, field]
+            # Rows with the same answers and source end up adjacent, in submission order
+            order = np.lexsort((np.arange(n), source, group))
+            previous, current = order[:-1], order[1:]
+            gap = np.abs(submitted[current] - submitted[previous])
+            with np.errstate(invalid='ignore'):
+                within = np.isnan(gap) | (gap <= self.duplicate_window)
+            repeat = ((group[current] == group[previous]) & (source[current] == source[previous])
+                      & (source[current] >= 0) & answered_any[current] & within)
+            hits, earlier = current[repeat], previous[repeat]
+            unset = duplicate_of[hits] < 0
+            duplicate_of[hits[unset]] = earlier[unset]
+        return duplicate_of
+
+    def score(self, matrix):
+        closed, modal_share, entropy = self.position_stats(matrix.positions)
+        answered = (matrix.codes >= 0).sum(axis=1)
+        z = self.duration_z(matrix.durations)
+        duplicate_of = self.duplicates(matrix.codes, matrix.sources, matrix.submitted)
+
+        enough_closed = closed >= self.min_closed_answers
+        straight = enough_closed & (modal_share >= self.straightline_threshold)
+        low_entropy = enough_closed & (entropy <= self.entropy_threshold)
+        with np.errstate(invalid='ignore'):
+            too_fast = (z <= self.speed_z_threshold) | (
+                matrix.durations < self.min_seconds_per_answer * np.maximum(answered, 1))
+        duplicate = duplicate_of >= 0
+
+        straight_component = np.where(enough_closed, np.clip((modal_share - 0.5) / 0.5, 0.0, 1.0), 0.0)
+        entropy_component = np.where(enough_closed, 1.0 - entropy, 0.0)
+        speed_component = np.where(too_fast, 1.0, np.clip(np.nan_to_num(-z, nan=0.0) / -self.speed_z_threshold, 0.0, 1.0))
+        scores = (0.35 * straight_component + 0.15 * entropy_component
+                  + 0.25 * speed_component + 0.25 * duplicate)
+
+        return {
+            'score': scores,
+            'straightLining': modal_share,
+            'entropy': entropy,
+            'durationZ': z,
+            'duplicateOf': duplicate_of,
+            'flags': {
+                'straight_lining': straight,
+                'low_entropy': low_entropy,
+                'too_fast': too_fast,
+                'duplicate': duplicate
+            }
+        }
+
+    def analyze(self, responses, questions=None):
+        matrix = ResponseMatrix(responses, questions)
+        scored = self.score(matrix)
+        flag_names = list(scored['flags'])
+        flag_matrix = np.column_stack([scored['flags'][name] for name in flag_names]) if len(responses) else None
+        is_spam = scored['score'] >= self.spam_threshold
+
+        results = []
+        for row, response_id in enumerate(matrix.response_ids):
+            z = scored['durationZ'][row]
+            results.append({
+                'index': row,
+                'responseId': response_id,
+                'score': round(float(scored['score'][row]), 4),
+                'isSpam': bool(is_spam[row]),
+                'flags': [name for name, hit in zip(flag_names, flag_matrix[row]) if hit],
+                'straightLining': round(float(scored['straightLining'][row]), 4),
+                'entropy': round(float(scored['entropy'][row]), 4),
+                'durationZ': None if np.isnan(z) else round(float(z), 3),
+                'duplicateOf': int(scored['duplicateOf'][row]) if scored['duplicateOf'][row] >= 0 else None
+            })
+
+        return {
+            'success': True,
+            'results': results,
+            'summary': {
+                'total': len(responses),
+                'questions': len(matrix.question_ids),
+                'flagged': int(is_spam.sum()),
+                'byFlag': {name: int(scored['flags'][name].sum()) for name in flag_names}
+            },
+            'method': 'vectorized_rules'
+        }
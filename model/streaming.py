@@ -0,0 +1,103 @@
+import json
+
+
+class QuestionStreamParser:
+    """Incrementally extract question objects from a streamed JSON completion.
+
+    Feed raw content deltas; every question object is returned as soon as its
+    closing brace arrives. Accepts ``{"questions": [{...}, ...]}`` as well as a
+    bare ``[{...}, ...]`` array, and ignores any text (e.g. code fences) outside
+    the JSON document.
+    """
+
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []
+        self._capturing = False
+
+    def _at_question_level(self):
+        return self._stack == ['{', '['] or self._stack == ['[']
+
+    def feed(self, text):
+        completed = []
+        for char in text:
+            if self._capturing:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                if self._stack:
+                    self._in_string = True
+            elif char in '{[':
+                if char == '{' and not self._capturing and self._at_question_level():
+                    self._capturing = True
+                    self._buffer = [char]
+                self._stack.append(char)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if char == '}' and self._capturing and self._at_question_level():
+                    self._capturing = False
+                    try:
+                        question = json.loads(''.join(self._buffer))
+                    except ValueError:
+                        question = None
+                    if isinstance(question, dict):
+                        completed.append(question)
+                    self._buffer = []
+        return completed
+
+
+def format_ndjson(event, data):
+    return json.dumps(dict(data, event=event)) + '\n'
+
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _parse_ndjson_line(line):
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if not line.strip():
+        return False, None
+    try:
+        return True, json.loads(line)
+    except ValueError:
+        return True, None
+
+
+def iter_ndjson(lines):
+    """Yield (index, object) for each non-blank NDJSON line; bad JSON yields (index, None)"""
+    index = 0
+    for line in lines:
+        present, record = _parse_ndjson_line(line)
+        if present:
+            yield index, record
+            index += 1
+
+
+async def aiter_ndjson(chunks):
+    """Async variant of ``iter_ndjson`` over an async iterator of byte chunks"""
+    index = 0
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            present, record = _parse_ndjson_line(line)
+            if present:
+                yield index, record
+                index += 1
+    present, record = _parse_ndjson_line(pending)
+    if present:
+        yield index, record
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import threading
+
+
+DEFAULT_SUGGESTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'suggestions.json')
+
+
+class SuggestionCatalog:
+    """Survey suggestions indexed by (category, audience), loaded once from a JSON file.
+
+    Entries without an ``audiences`` list apply to every audience. Each distinct
+    lookup's JSON body and strong ETag are built once and reused, so serving a
+    repeat request is a dict hit plus an ETag comparison.
+    """
+
+    def __init__(self, entries, default_category='feedback', limit=3):
+        self.default_category = default_category
+        self.limit = limit
+        self._by_category = {}
+        self._by_audience = {}
+        for entry in entries:
+            suggestion = {key: value for key, value in entry.items() if key not in ('category', 'audiences')}
+            category = entry['category']
+            self._by_category.setdefault(category, []).append(suggestion)
+            for audience in entry.get('audiences') or ('*',):
+                self._by_audience.setdefault((category, audience), []).append(suggestion)
+
+        canonical = json.dumps(list(entries), sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=None):
+        with open(path or DEFAULT_SUGGESTIONS_FILE, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def lookup(self, category, target_audience=None):
+        if category not in self._by_category:
+            category = self.default_category
+        suggestions = self._by_category.get(category, [])
+        if target_audience:
+            # Audience-specific entries first, then ones that apply to everyone;
+            # an audience with no entries still gets the category's suggestions
+            matched = (self._by_audience.get((category, target_audience), [])
+                       + self._by_audience.get((category, '*'), []))
+            suggestions = matched or suggestions
+        return suggestions[:self.limit]
+
+    def response_for(self, category, target_audience=None):
+        """Return the (json_body, etag) pair for a lookup, building it on first use"""
+        key = (category, target_audience or '')
+        cached = self._responses.get(key)
+        if cached is not None:
+            return cached
+
+        body = json.dumps({
+            'success': True,
+            'suggestions': self.lookup(category, target_audience)
+        })
+        etag = hashlib.sha256(f'{self.version}:{body}'.encode('utf-8')).hexdigest()[:32]
+        with self._lock:
+            # Bound the memo against arbitrary query strings
+            if len(self._responses) >= 4096:
+                self._responses.clear()
+            self._responses[key] = (body, etag)
+        return body, etag
@@ -0,0 +1,266 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+
+
+DEFAULT_TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'templates')
+PACK_NAME = re.compile(r'[a-z0-9_-]+')
+
+# Ordered (keywords, option set) rules; the first rule whose keyword appears in
+# the lower-cased question text decides the options of a multiple-choice question
+# that does not name its option set
+OPTION_RULES = (
+    (('satisfaction', 'rate'), 'satisfaction'),
+    (('likely', 'recommend'), 'likelihood'),
+    (('age',), 'age_group'),
+    (('education',), 'education'),
+    (('experience', 'expertise'), 'experience'),
+    (('important',), 'importance'),
+)
+DEFAULT_OPTION_SET = 'agreement'
+
+
+def resolve_option_set(question_text):
+    """Name of the option set a multiple-choice question text maps to"""
+    lowered = question_text.lower()
+    for keywords, option_set in OPTION_RULES:
+        if any(keyword in lowered for keyword in keywords):
+            return option_set
+    return DEFAULT_OPTION_SET
+
+
+def compile_pack(pack, option_sets):
+    """Compile a pack into question_type -> ((text, options), ...).
+
+    A question is a string, or an object whose ``options`` is an option set
+    name from the language's options.json or an inline list. Options are
+    resolved here and stored as shared tuples, so sampling is index picks only.
+    """
+    option_sets = {name: tuple(values) for name, values in option_sets.items()}
+    entries = {}
+    for question_type, questions in pack['questions'].items():
+        compiled = []
+        for question in questions:
+            if isinstance(question, str):
+                question = {'text': question}
+            options = None
+            if question_type == 'multiple-choice':
+                options = question.get('options') or resolve_option_set(question['text'])
+                options = tuple(options) if isinstance(options, list) else option_sets[options]
+            compiled.append((question['text'], options))
+        entries[question_type] = tuple(compiled)
+    return entries
+
+
+def sample_questions(entries, question_types, num_questions, rng=None):
+    """Pick ``num_questions`` questions cycling through ``question_types``"""
+    rng = rng or random
+    questions = []
+    for i in range(num_questions):
+        question_type = question_types[i % len(question_types)]
+        candidates = entries.get(question_type, ())
+        if not candidates:
+            continue
+        text, options = candidates[rng.randrange(len(candidates))]
+        question = {
+            'type': question_type,
+            'text': text,
+            'required': i < num_questions // 2,
+            'order': i
+        }
+        if options is not None:
+            question['options'] = list(options)
+        questions.append(question)
+    return questions
+
+
+def sample_unique_questions(entries, question_types, num_questions, skip, rng=None):
+    """Like ``sample_questions``, but never picks a question twice or one whose text ``skip`` accepts.
+
+    Fewer than ``num_questions`` come back once every usable question of the
+    requested types has been picked.
+    """
+    rng = rng or random
+    pools = {question_type: [entry for entry in entries.get(question_type, ()) if not skip(entry[0])]
+             for question_type in question_types}
+    questions = []
+    i = 0
+    while len(questions) < num_questions and any(pools.values()):
+        question_type = question_types[i % len(question_types)]
+        i += 1
+        pool = pools[question_type]
+        if not pool:
+            continue
+        # Swap-remove keeps each pick O(1)
+        index = rng.randrange(len(pool))
+        pool[index], pool[-1] = pool[-1], pool[index]
+        text, options = pool.pop()
+        question = {
+            'type': question_type,
+            'text': text,
+            'required': len(questions) < num_questions // 2,
+            'order': len(questions)
+        }
+        if options is not None:
+            question['options'] = list(options)
+        questions.append(question)
+    return questions
+
+
+class _LoadedPack:
+    __slots__ = ('signature', 'entries', 'checked_at')
+
+    def __init__(self, signature, entries, checked_at):
+        self.signature = signature
+        self.entries = entries
+        self.checked_at = checked_at
+
+
+class TemplatePacks:
+    """Question template packs stored as ``<root>/<language>/<category>.json``.
+
+    Each (language, category) pack is parsed on first use, so a worker only
+    holds the packs its requests touch. Option sets live next to the packs in
+    ``<language>/options.json``. A pack is re-checked at most every
+    ``reload_interval`` seconds and recompiled when either file changes.
+    Lookups fall back to the default language, then the default category.
+    ``on_load(language, category, entries)`` is called whenever a pack is
+    compiled, on first use and on every reload.
+    """
+
+    def __init__(self, root=None, default_language='en', default_category='feedback', reload_interval=2.0,
+                 on_load=None):
+        self.root = root or DEFAULT_TEMPLATES_DIR
+        self.default_language = default_language
+        self.default_category = default_category
+        self.reload_interval = reload_interval
+        self.on_load = on_load
+        self._packs = {}
+        self._lock = threading.Lock()
+
+    def _signature(self, language, category):
+        signature = []
+        for name in (category, 'options'):
+            try:
+                stat = os.stat(os.path.join(self.root, language, f'{name}.json'))
+            except FileNotFoundError:
+                if name == category:
+                    return None
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self, language, category):
+        now = time.monotonic()
+        loaded = self._packs.get((language, category))
+        if loaded is not None and now - loaded.checked_at < self.reload_interval:
+            return loaded.entries
+
+        with self._lock:
+            loaded = self._packs.get((language, category))
+            if loaded is not None and now - loaded.checked_at < self.reload_interval:
+                return loaded.entries
+            signature = self._signature(language, category)
+            if loaded is not None and signature == loaded.signature:
+                loaded.checked_at = now
+                return loaded.entries
+
+            entries = None
+            if signature is not None:
+                directory = os.path.join(self.root, language)
+                with open(os.path.join(directory, f'{category}.json'), encoding='utf-8') as f:
+                    pack = json.load(f)
+                option_sets = {}
+                if signature[1] is not None:
+                    with open(os.path.join(directory, 'options.json'), encoding='utf-8') as f:
+                        option_sets = json.load(f)
+                entries = compile_pack(pack, option_sets)
+                if self.on_load is not None:
+                    self.on_load(language, category, entries)
+            # Missing packs are remembered too, so fallbacks don't stat on every request
+            self._packs[(language, category)] = _LoadedPack(signature, entries, now)
+            return entries
+
+    def entries(self, language, category):
+        """question_type -> ((text, options), ...) for the best available pack"""
+        language = language if language and PACK_NAME.fullmatch(language) else self.default_language
+        category = category if category and PACK_NAME.fullmatch(category) else self.default_category
+        for candidate in ((language, category), (self.default_language, category),
+                          (language, self.default_category), (self.default_language, self.default_category)):
+            entries = self._load(*candidate)
+            if entries is not None:
+                return entries
+        return {}
+
+    def sample(self, language, category, question_types, num_questions, rng=None):
+        return sample_questions(self.entries(language, category), question_types, num_questions, rng)
+
+    def sample_unique(self, language, category, question_types, num_questions, skip, rng=None):
+        return sample_unique_questions(self.entries(language, category), question_types, num_questions, skip, rng)
+
+    def sample_many(self, language, category, question_types, num_questions, count, rng=None):
+        """Generate ``count`` independent surveys from one RNG stream"""
+        rng = rng or random
+        entries = self.entries(language, category)
+        return [sample_questions(entries, question_types, num_questions, rng) for _ in range(count)]
+
+    def preload(self, language=None, category=None):
+        """Load (or re-check) every pack matching ``language`` and ``category``; None matches any"""
+        for name in (language, category):
+            if name is not None and not (isinstance(name, str) and PACK_NAME.fullmatch(name)):
+                return
+        languages = [language] if language else sorted(os.listdir(self.root))
+        for candidate in languages:
+            directory = os.path.join(self.root, candidate)
+            if not PACK_NAME.fullmatch(candidate) or not os.path.isdir(directory):
+                continue
+            if category:
+                self._load(candidate, category)
+                continue
+            for filename in sorted(os.listdir(directory)):
+                name, extension = os.path.splitext(filename)
+                if extension == '.json' and name != 'options' and PACK_NAME.fullmatch(name):
+                    self._load(candidate, name)
+
+    def questions(self, language=None):
+        """Yield (category, question_type, text, options) for every pack of one language"""
+        language = language or self.default_language
+        directory = os.path.join(self.root, language)
+        for filename in sorted(os.listdir(directory)):
+            category, extension = os.path.splitext(filename)
+            if extension != '.json' or category == 'options':
+                continue
+            for question_type, entries in self._load(language, category).items():
+                for text, options in entries:
+                    yield category, question_type, text, options
+
+    def aligned_pairs(self, source, target):
+        """Yield (source_text, target_text) for questions and options at the same position in both languages' packs"""
+        if not PACK_NAME.fullmatch(source) or not PACK_NAME.fullmatch(target):
+            return
+        directory = os.path.join(self.root, target)
+        if not os.path.isdir(directory):
+            return
+        for filename in sorted(os.listdir(directory)):
+            category, extension = os.path.splitext(filename)
+            if extension != '.json' or category == 'options':
+                continue
+            source_entries, target_entries = self._load(source, category), self._load(target, category)
+            if not source_entries or not target_entries:
+                continue
+            for question_type, entries in source_entries.items():
+                for (text, options), (translated, translated_options) in zip(entries,
+                                                                             target_entries.get(question_type, ())):
+                    yield text, translated
+                    if options and translated_options and len(options) == len(translated_options):
+                        yield from zip(options, translated_options)
+
+    def stats(self):
+        return {
+            'loaded': sorted(f'{language}/{category}' for (language, category), loaded in self._packs.items()
+                             if loaded.entries is not None)
+        }
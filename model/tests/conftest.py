@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The service modules import each other as top-level modules (``from metrics import ...``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py reads its configuration at import; keep tests off the network and the disk
+os.environ.setdefault('DEMO_MODE', 'true')
+os.environ.setdefault('JOBS_DB', ':memory:')
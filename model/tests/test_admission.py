@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, RateLimiter
+
+
+def hold_slots(controller, count, priority='interactive'):
+    """Take ``count`` slots on background threads; returns the event that releases them"""
+    release = threading.Event()
+    started = threading.Barrier(count + 1)
+
+    def hold():
+        with controller.slot(priority):
+            started.wait()
+            release.wait(5)
+
+    for _ in range(count):
+        threading.Thread(target=hold, daemon=True).start()
+    started.wait(5)
+    return release
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.005)
+
+
+def test_full_queue_is_shed_at_once():
+    controller = AdmissionController(1, 1, {'interactive': 5})
+    release = hold_slots(controller, 1)
+    waiter = threading.Thread(target=controller.acquire, args=('interactive',), daemon=True)
+    waiter.start()
+    wait_until(lambda: controller.stats()['queued'] == 1)
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.slot():
+            pass
+    assert rejected.value.reason == 'queue_full'
+    assert rejected.value.retry_after >= 1
+    assert time.monotonic() - started < 0.5
+    release.set()
+
+
+def test_waiter_times_out_and_leaves_the_queue():
+    controller = AdmissionController(1, 5, {'interactive': 0.05})
+    release = hold_slots(controller, 1)
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.slot():
+            pass
+    assert rejected.value.reason == 'queue_timeout'
+    assert controller.stats()['queued'] == 0
+    release.set()
+    wait_until(lambda: controller.stats()['active'] == 0)
+    with controller.slot():
+        assert controller.stats()['active'] == 1
+
+
+def test_interactive_waiters_are_granted_before_bulk():
+    controller = AdmissionController(1, 10, {'interactive': 5, 'bulk': 5})
+    release = hold_slots(controller, 1)
+    order = []
+
+    def request(priority):
+        with controller.slot(priority):
+            order.append(priority)
+
+    bulk = threading.Thread(target=request, args=('bulk',))
+    bulk.start()
+    wait_until(lambda: controller.stats()['queued'] == 1)
+    interactive = threading.Thread(target=request, args=('interactive',))
+    interactive.start()
+    wait_until(lambda: controller.stats()['queued'] == 2)
+
+    release.set()
+    bulk.join(5)
+    interactive.join(5)
+    assert order == ['interactive', 'bulk']
+
+
+def test_bulk_cannot_take_the_interactive_headroom():
+    controller = AdmissionController(4, 10, {'interactive': 1, 'bulk': 0.05}, bulk_share=0.5)
+    release = hold_slots(controller, 2, 'bulk')
+    assert controller.stats()['activeBulk'] == 2
+
+    with pytest.raises(AdmissionRejected):
+        with controller.slot('bulk'):
+            pass
+    with controller.slot('interactive'):
+        with controller.slot('interactive'):
+            assert controller.stats()['active'] == 4
+    release.set()
+
+
+def test_cancelled_async_waiter_returns_its_slot():
+    controller = AdmissionController(1, 5, {'interactive': 5})
+
+    async def scenario():
+        async with controller.slot_async():
+            waiter = asyncio.ensure_future(controller.acquire_async('interactive'))
+            await asyncio.sleep(0.01)
+            assert controller.stats()['queued'] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        async with controller.slot_async():
+            return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['active'] == 1
+    assert stats['queued'] == 0
+
+
+def test_rate_limiter_rejects_past_the_burst():
+    controller = AdmissionController(10, 10, {'interactive': 1},
+                                     limiter=RateLimiter({'interactive': (1, 2)}))
+    controller.check_rate('client-a', 'interactive')
+    controller.check_rate('client-a', 'interactive')
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check_rate('client-a', 'interactive')
+    assert rejected.value.reason == 'rate_limited'
+    # Buckets are per client
+    controller.check_rate('client-b', 'interactive')
+    assert controller.stats()['rejected'] == {'rate_limited': 1}
+
+
+class SlowUpstream:
+    """Fake upstream that answers every call after ``delay`` seconds (or once ``gate`` is set)"""
+
+    def __init__(self, delay=0.0, gate=None):
+        self.delay = delay
+        self.gate = gate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def post_json(self, payload, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        time.sleep(self.delay)
+        content = '{"questions": [{"type": "text", "text": "What should we improve?"}]}'
+        return {'choices': [{'message': {'content': content}, 'finish_reason': 'stop'}]}
+
+
+def survey(title, count=1):
+    return {'title': title, 'description': 'd', 'category': 'feedback', 'targetAudience': 'customers',
+            'numberOfQuestions': count, 'questionTypes': ['text']}
+
+
+def test_coalesced_callers_wait_without_holding_a_slot():
+    import app as service
+    from questionbank import QuestionBank
+
+    answer = threading.Event()
+    upstream = SlowUpstream(gate=answer)
+    ai = service.SurveyAIService(upstream=upstream, bank=QuestionBank())
+    controller = AdmissionController(2, 0, {'interactive': 0})
+    results = []
+
+    def call():
+        results.append(ai.generate_questions_cached(survey('Coalesced burst'), gate=lambda: controller.slot()))
+
+    threads = [threading.Thread(target=call, daemon=True) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: ai.inflight.stats()['deduplicated'] == 9)
+    assert controller.stats()['active'] == 1
+    # The second slot is still free for unrelated traffic
+    with controller.slot():
+        pass
+    answer.set()
+    for thread in threads:
+        thread.join(5)
+    assert upstream.calls == 1
+    assert len(results) == 10 and all(result['success'] for result in results)
+    assert controller.stats()['rejected'] == {}
+
+
+def test_idle_server_does_not_shed_its_own_batch(monkeypatch, request):
+    import app as service
+    from questionbank import QuestionBank
+
+    controller = AdmissionController(4, 100, {'interactive': 5, 'bulk': 0.05}, bulk_share=0.5)
+    monkeypatch.setattr(service, 'admission', controller)
+    monkeypatch.setattr(service, 'ai_service', service.SurveyAIService(upstream=SlowUpstream(0.1),
+                                                                        bank=QuestionBank()))
+    monkeypatch.setattr(service, 'use_demo_generation', lambda: False)
+    items = [dict(survey(f'{request.node.name} {i}'), retrievalFirst=False) for i in range(8)]
+
+    response = service.app.test_client().post('/generate-survey/batch', json={'requirements': items,
+                                                                              'concurrency': 8})
+    body = response.get_json()
+    assert body['failures'] == []
+    assert len(body['results']) == 8
+    assert service.batch_concurrency({'concurrency': 8}, 8) == controller.bulk_limit == 2
@@ -0,0 +1,120 @@
+import os
+import random
+
+import pytest
+
+import app as service
+from analytics import AnalyticsStore, IngestConflict, QuantileSketch, SurveyAggregate
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+def response(*answers, duration=120):
+    return {'answers': list(answers), 'metadata': {'duration': duration}, 'createdAt': '2025-01-02T10:00:00'}
+
+
+def test_quantile_sketch_stays_within_its_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(4, 1) for _ in range(20000))
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1e-9
+
+
+def test_aggregate_round_trips_through_a_checkpoint():
+    aggregate = SurveyAggregate()
+    aggregate.set_question_types([{'id': 'q1', 'type': 'rating-scale'}])
+    aggregate.add(response({'questionId': 'q1', 'value': 4}))
+    aggregate.add(response({'questionId': 'q1', 'value': '2'}, duration=60))
+    restored = SurveyAggregate.from_dict(aggregate.to_dict())
+    assert restored.snapshot('s') == aggregate.snapshot('s')
+    assert restored.snapshot('s')['questionAnalytics'][0]['averageRating'] == 3.0
+
+
+@pytest.mark.parametrize('bad', [
+    response('not an object'),
+    dict(response(), answers='q1=yes'),
+    dict(response(), metadata=['fast']),
+])
+def test_malformed_answers_are_rejected_before_anything_is_counted(client, bad, request):
+    survey_id = request.node.name
+    good = response({'questionId': 'q1', 'value': 'yes'})
+    assert client.post('/analytics/ingest', json={'surveyId': survey_id, 'responses': [good]}).status_code == 200
+
+    rejected = client.post('/analytics/ingest', json={'surveyId': survey_id, 'responses': [good, bad]})
+    assert rejected.status_code == 400
+    assert rejected.get_json()['success'] is False
+
+    analytics = client.get(f'/analytics/{survey_id}').get_json()['analytics']
+    assert analytics['totalResponses'] == 1
+    assert analytics['responsesByDay'] == {'2025-01-02': 1}
+
+
+def test_questions_must_be_objects(client):
+    body = {'surveyId': 'questions', 'responses': [response()], 'questions': 'q1'}
+    assert client.post('/analytics/ingest', json=body).status_code == 400
+    assert client.get('/analytics/questions').status_code == 404
+
+
+def test_workers_checkpoint_separately_and_reads_merge_them(tmp_path):
+    path = str(tmp_path / 'analytics.json')
+    first = AnalyticsStore(path, checkpoint_interval=3600, worker_id='a')
+    second = AnalyticsStore(path, checkpoint_interval=3600, worker_id='b')
+    first.ingest('s', [response({'questionId': 'q1', 'value': 4})], [{'id': 'q1', 'type': 'rating-scale'}])
+    second.ingest('s', [response({'questionId': 'q1', 'value': 2}, duration=60)] * 3)
+    assert first.checkpoint() and second.checkpoint()
+    assert sorted(os.listdir(tmp_path)) == ['analytics.json.worker-a', 'analytics.json.worker-b']
+
+    expected = SurveyAggregate()
+    expected.set_question_types([{'id': 'q1', 'type': 'rating-scale'}])
+    for value, duration in ((4, 120), (2, 60), (2, 60), (2, 60)):
+        expected.add(response({'questionId': 'q1', 'value': value}, duration=duration))
+    for store in (first, second, AnalyticsStore(path, worker_id='c')):
+        snapshot = store.snapshot('s')
+        assert snapshot['totalResponses'] == 4
+        assert snapshot['questionAnalytics'] == expected.snapshot('s')['questionAnalytics']
+        assert snapshot['averageDuration'] == 75
+
+
+def test_restarted_worker_resumes_from_its_own_checkpoint(tmp_path):
+    path = str(tmp_path / 'analytics.json')
+    store = AnalyticsStore(path, worker_id='a')
+    store.ingest('s', [response()] * 2)
+    store.checkpoint()
+
+    restarted = AnalyticsStore(path, worker_id='a')
+    assert restarted.ingest('s', [response()]) == (3, True)
+    restarted.checkpoint()
+    assert AnalyticsStore(path, worker_id='b').snapshot('s')['totalResponses'] == 3
+
+
+def test_retried_ingest_is_counted_once(client, request):
+    survey_id = request.node.name
+    body = {'surveyId': survey_id, 'responses': [response({'questionId': 'q1', 'value': 'yes'})] * 2}
+    headers = {service.IDEMPOTENCY_HEADER: 'batch-1'}
+    first = client.post('/analytics/ingest', json=body, headers=headers).get_json()
+    retry = client.post('/analytics/ingest', json=body, headers=headers).get_json()
+    assert (first['ingested'], first['deduplicated'], first['totalResponses']) == (2, False, 2)
+    assert (retry['ingested'], retry['deduplicated'], retry['totalResponses']) == (0, True, 2)
+
+    other = client.post('/analytics/ingest', json=body, headers={service.IDEMPOTENCY_HEADER: 'batch-2'})
+    assert other.get_json()['totalResponses'] == 4
+    conflict = client.post('/analytics/ingest', json=dict(body, responses=[response()]), headers=headers)
+    assert conflict.status_code == 422
+    assert conflict.get_json()['success'] is False
+
+
+def test_idempotency_keys_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'analytics.json')
+    first = AnalyticsStore(path, worker_id='a')
+    second = AnalyticsStore(path, worker_id='b')
+    assert first.ingest('s', [response()], idempotency_key='batch-1') == (1, True)
+    assert second.ingest('s', [response()], idempotency_key='batch-1')[1] is False
+    with pytest.raises(IngestConflict):
+        second.ingest('s', [response(), response()], idempotency_key='batch-1')
@@ -0,0 +1,37 @@
+import pytest
+
+import app as service
+
+
+SURVEY = {
+    'title': 'What do you like most about our service',
+    'description': 'Quarterly feedback',
+    'category': 'feedback',
+    'targetAudience': 'customers',
+    'numberOfQuestions': 3
+}
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+@pytest.mark.parametrize('concurrency', ['many', '4', -1, 0, 2.5, True, [2], service.BATCH_MAX_CONCURRENCY + 1])
+def test_invalid_concurrency_is_rejected(client, concurrency):
+    response = client.post('/generate-survey/batch', json={'requirements': [SURVEY], 'concurrency': concurrency})
+    assert response.status_code == 400
+    assert response.get_json() == {
+        'success': False,
+        'message': f'concurrency must be an integer between 1 and {service.BATCH_MAX_CONCURRENCY}'
+    }
+
+
+@pytest.mark.parametrize('concurrency', [None, 1, service.BATCH_MAX_CONCURRENCY])
+def test_valid_concurrency_runs_the_batch(client, concurrency):
+    body = {'requirements': [SURVEY, SURVEY]}
+    if concurrency is not None:
+        body['concurrency'] = concurrency
+    response = client.post('/generate-survey/batch', json=body)
+    assert response.status_code == 200
+    assert len(response.get_json()['results']) == 2
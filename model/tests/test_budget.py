@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+import app as service
+from questionbank import QuestionBank
+
+
+QUESTIONS = [{'type': 'text', 'text': 'What should we improve first?'},
+             {'type': 'text', 'text': 'How did you hear about us?'}]
+
+
+class StreamingUpstream:
+    """Fake upstream streaming QUESTIONS in small deltas, optionally ending with a usage chunk"""
+
+    def __init__(self, usage=None):
+        self.usage = usage
+        self.payloads = []
+
+    def stream_chat(self, payload, usage=None):
+        self.payloads.append(payload)
+        content = json.dumps({'questions': QUESTIONS})
+        for start in range(0, len(content), 16):
+            yield content[start:start + 16]
+        if self.usage is not None and usage is not None:
+            usage.update(self.usage)
+
+
+def requirements(title):
+    return {'title': title, 'description': 'd', 'category': 'feedback', 'targetAudience': 'customers',
+            'numberOfQuestions': 2, 'questionTypes': ['text']}
+
+
+def ai_service(upstream):
+    return service.SurveyAIService(upstream=upstream, bank=QuestionBank())
+
+
+def test_streamed_reply_is_charged_from_the_usage_chunk():
+    charged = []
+    ai = ai_service(StreamingUpstream({'prompt_tokens': 120, 'completion_tokens': 40, 'total_tokens': 160}))
+    events = list(ai.stream_questions(requirements('Usage chunk'), on_usage=charged.append))
+
+    assert [event for event, _ in events] == ['question', 'question', 'done']
+    assert len(charged) == 1
+    assert charged[0]['source'] == 'upstream'
+    assert (charged[0]['promptTokens'], charged[0]['completionTokens']) == (120, 40)
+    assert events[-1][1]['usage'] == charged[0]
+
+
+def test_streamed_reply_without_usage_is_estimated():
+    charged = []
+    ai = ai_service(StreamingUpstream())
+    list(ai.stream_questions(requirements('Estimated usage'), on_usage=charged.append))
+    assert charged[0]['source'] == 'estimate'
+    assert charged[0]['promptTokens'] > 0 and charged[0]['completionTokens'] > 0
+
+
+def test_abandoned_stream_is_still_charged():
+    charged = []
+    ai = ai_service(StreamingUpstream())
+    stream = ai.stream_questions(requirements('Client went away'), on_usage=charged.append)
+    assert next(stream)[0] == 'question'
+    stream.close()
+    assert len(charged) == 1 and charged[0]['completionTokens'] > 0
+
+
+def test_streamed_generation_is_recorded_for_the_tenant(monkeypatch):
+    usage = {'prompt_tokens': 90, 'completion_tokens': 30, 'total_tokens': 120}
+    monkeypatch.setattr(service, 'ai_service', ai_service(StreamingUpstream(usage)))
+    monkeypatch.setattr(service, 'use_demo_generation', lambda: False)
+    client = service.app.test_client()
+    headers = {service.TENANT_HEADER: 'streaming-tenant'}
+
+    response = client.post('/generate-survey?stream=ndjson', json=dict(requirements('Tenant stream'),
+                                                                        retrievalFirst=False), headers=headers)
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True).splitlines()[-1])['event'] == 'done'
+
+    report = client.get('/usage?tenant=streaming-tenant').get_json()
+    assert report['usage']['requests'] == 1
+    assert report['usage']['totalTokens'] == 120
+
+
+@pytest.mark.parametrize('count', ['abc', -3, 0, 2.5, True, service.MAX_SURVEY_QUESTIONS + 1, 10 ** 9, None])
+def test_question_count_is_validated_before_generation(count):
+    body = dict(requirements('Bad count'), numberOfQuestions=count)
+    response = service.app.test_client().post('/generate-survey', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {
+        'success': False,
+        'message': f'numberOfQuestions must be an integer between 1 and {service.MAX_SURVEY_QUESTIONS}'
+    }
+
+
+@pytest.mark.parametrize('count', [1, '8', service.MAX_SURVEY_QUESTIONS])
+def test_question_count_from_the_form_is_accepted(count):
+    body = dict(requirements('Form count'), numberOfQuestions=count, questionTypes=['text', 'multiple-choice'])
+    response = service.app.test_client().post('/generate-survey', json=body)
+    assert response.status_code == 200
+    assert response.get_json()['success']
+
+
+@pytest.mark.parametrize('question_types', ['text', [], [1], {'text': True}])
+def test_question_types_must_be_a_list_of_names(question_types):
+    body = dict(requirements('Bad types'), questionTypes=question_types)
+    assert service.app.test_client().post('/generate-survey', json=body).status_code == 400
+
+
+def test_batch_items_with_bad_counts_fail_individually():
+    items = [requirements('Batch ok'), dict(requirements('Batch bad'), numberOfQuestions=-1)]
+    body = service.app.test_client().post('/generate-survey/batch', json={'requirements': items}).get_json()
+    assert [result['index'] for result in body['results']] == [0]
+    assert [failure['index'] for failure in body['failures']] == [1]
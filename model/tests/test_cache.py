@@ -0,0 +1,94 @@
+import json
+
+import cache
+from app import SurveyAIService
+from cache import ResultCache, requirements_key
+from questionbank import QuestionBank
+
+
+SURVEY = {
+    'title': 'What do you like most about our service',
+    'description': 'Quarterly feedback',
+    'category': 'feedback',
+    'targetAudience': 'customers',
+    'numberOfQuestions': 4,
+    'questionTypes': ['text', 'multiple-choice']
+}
+
+
+class CountingUpstream:
+    """Fake upstream that answers every call with one question and counts the calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def post_json(self, payload, **kwargs):
+        self.calls += 1
+        content = json.dumps({'questions': [{'type': 'text', 'text': 'What would you change?'}]})
+        return {'choices': [{'message': {'content': content}, 'finish_reason': 'stop'}]}
+
+
+def test_key_ignores_formatting_and_type_order():
+    same = dict(SURVEY, title='  what do you LIKE most about   our service ', numberOfQuestions='4',
+                questionTypes=['multiple-choice', 'text', 'text'])
+    assert requirements_key(same) == requirements_key(SURVEY)
+    assert requirements_key(dict(SURVEY, numberOfQuestions=5)) != requirements_key(SURVEY)
+    assert requirements_key(dict(SURVEY, language='hi')) != requirements_key(SURVEY)
+
+
+def test_memory_tier_evicts_the_least_recently_used_entry():
+    results = ResultCache(max_entries=2, ttl=60)
+    results.set('a', 1)
+    results.set('b', 2)
+    assert results.get('a') == 1
+    results.set('c', 3)
+    assert (results.get('a'), results.get('b'), results.get('c')) == (1, None, 3)
+    assert results.stats() == {'entries': 2, 'hits': 3, 'misses': 1, 'persistent': False}
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    results = ResultCache(ttl=10)
+    results.set('a', 1)
+    now[0] += 9
+    assert results.get('a') == 1
+    now[0] += 2
+    assert results.get('a') is None
+    assert not results.contains('a')
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    ResultCache(ttl=60, db_path=path).set('a', {'questions': ['q']})
+    restarted = ResultCache(ttl=60, db_path=path)
+    assert restarted.stats()['entries'] == 0
+    assert restarted.get('a') == {'questions': ['q']}
+    assert restarted.contains('a')
+
+
+def test_disabled_cache_stores_nothing():
+    results = ResultCache(ttl=0)
+    results.set('a', 1)
+    assert results.get('a') is None
+
+
+def test_method_reports_hits_and_misses():
+    upstream = CountingUpstream()
+    service = SurveyAIService(upstream=upstream, cache=ResultCache(ttl=60), bank=QuestionBank())
+    first = service.generate_questions_cached(SURVEY)
+    again = service.generate_questions_cached(dict(SURVEY, title=SURVEY['title'].upper()))
+    assert (first['method'], again['method']) == ('ai_api_cache_miss', 'ai_api_cache_hit')
+    assert again['questions'] == first['questions']
+    assert again['usage']['completionTokens'] == 0
+    assert upstream.calls == 1
+
+
+def test_demo_fallbacks_are_not_cached():
+    class FailingUpstream:
+        def post_json(self, payload, **kwargs):
+            raise ValueError('upstream down')
+
+    service = SurveyAIService(upstream=FailingUpstream(), cache=ResultCache(ttl=60), bank=QuestionBank())
+    assert service.generate_questions_cached(SURVEY)['method'] == 'demo_template'
+    assert not service.has_cached(SURVEY)
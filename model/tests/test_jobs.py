@@ -0,0 +1,179 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import app as service
+from jobs import FAILED, RUNNING, JobConflict, JobRunner, JobStore, resolve_webhook, webhook_url_error
+
+
+SURVEY = {
+    'title': 'What do you like most about our service',
+    'description': 'Quarterly feedback',
+    'category': 'feedback',
+    'targetAudience': 'customers',
+    'numberOfQuestions': 4
+}
+PUBLIC_HOOK = 'http://93.184.216.34/hooks/survey'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # A runner that is never started: submissions are stored but nothing runs or calls webhooks
+    monkeypatch.setattr(service, '_job_runner', JobRunner(JobStore(), {}))
+    return service.app.test_client()
+
+
+def test_expired_lease_is_claimed_again():
+    store = JobStore(lease=0.05, max_attempts=3)
+    job_id, _ = store.submit('generate-survey', SURVEY)
+    assert store.claim()['attempts'] == 1
+    assert store.claim() is None
+
+    time.sleep(0.1)
+    job = store.claim()
+    assert (job['id'], job['status'], job['attempts']) == (job_id, RUNNING, 2)
+
+
+def test_job_fails_after_max_attempts():
+    store = JobStore(lease=0.05, max_attempts=2)
+    job_id, _ = store.submit('generate-survey', SURVEY)
+    for _ in range(2):
+        assert store.claim()['id'] == job_id
+        time.sleep(0.1)
+    assert store.claim() is None
+    assert store.get(job_id)['status'] == FAILED
+
+
+def test_same_survey_with_another_webhook_is_a_separate_job(client):
+    first = client.post('/jobs/generate-survey', json=dict(SURVEY, webhookUrl=PUBLIC_HOOK)).get_json()
+    again = client.post('/jobs/generate-survey', json=dict(SURVEY, webhookUrl=PUBLIC_HOOK)).get_json()
+    other = client.post('/jobs/generate-survey', json=dict(SURVEY, webhookUrl=PUBLIC_HOOK + '2')).get_json()
+    assert again['jobId'] == first['jobId'] and again['deduplicated']
+    assert other['jobId'] != first['jobId'] and not other['deduplicated']
+
+
+def test_idempotency_key_reused_for_another_request_conflicts(client):
+    headers = {service.IDEMPOTENCY_HEADER: 'order-42'}
+    first = client.post('/jobs/generate-survey', json=SURVEY, headers=headers)
+    assert first.status_code == 202
+    retry = client.post('/jobs/generate-survey', json=SURVEY, headers=headers)
+    assert retry.get_json()['jobId'] == first.get_json()['jobId']
+
+    for changed in (dict(SURVEY, numberOfQuestions=5), dict(SURVEY, webhookUrl=PUBLIC_HOOK)):
+        conflict = client.post('/jobs/generate-survey', json=changed, headers=headers)
+        assert conflict.status_code == 422
+        assert conflict.get_json()['success'] is False
+
+
+def test_store_raises_on_conflicting_idempotent_submit():
+    store = JobStore()
+    store.submit('generate-survey', SURVEY, dedupe_key='t:key:1', reuse_finished=True)
+    with pytest.raises(JobConflict):
+        store.submit('generate-survey', dict(SURVEY, title='Other'), dedupe_key='t:key:1', reuse_finished=True)
+
+
+@pytest.mark.parametrize('url', [
+    'http://localhost/hook',
+    'http://127.0.0.1:8080/hook',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://10.0.0.1/hook',
+    'http://192.168.1.5/hook',
+    'http://[::1]/hook',
+    'http://[::ffff:10.0.0.1]/hook',
+    'http://0.0.0.0/hook',
+])
+def test_webhooks_to_internal_addresses_are_rejected(client, url):
+    assert webhook_url_error(url) is not None
+    response = client.post('/jobs/generate-survey', json=dict(SURVEY, webhookUrl=url))
+    assert response.status_code == 400
+
+
+def test_webhook_to_public_address_is_accepted():
+    assert webhook_url_error(PUBLIC_HOOK) is None
+    assert webhook_url_error('http://10.0.0.1/hook', allowed_hosts={'10.0.0.1'}) is None
+    assert webhook_url_error(PUBLIC_HOOK, allowed_hosts={'hooks.example.com'}) is not None
+
+
+def test_delivery_rechecks_the_webhook_url():
+    store = JobStore()
+    job_id, _ = store.submit('generate-survey', SURVEY, webhook_url='http://10.0.0.1/hook')
+    store.finish(job_id, result={'success': True})
+    runner = JobRunner(store, {}, resolve_url=resolve_webhook)
+    runner._deliver(store.get(job_id))
+    assert store.get(job_id)['webhook_status'].startswith('rejected:')
+
+
+class RecordingServer:
+    """Local HTTP server that records each request's Host header and answers with ``status``"""
+
+    def __init__(self, status=200, location=None):
+        self.hosts = []
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                recorder.hosts.append(self.headers['Host'])
+                self.rfile.read(int(self.headers['Content-Length'] or 0))
+                self.send_response(status)
+                if location:
+                    self.send_header('Location', location)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def deliver(url, address):
+    store = JobStore()
+    job_id, _ = store.submit('generate-survey', SURVEY, webhook_url=url)
+    store.finish(job_id, result={'success': True})
+    # Stands in for DNS: the host was checked and resolved to ``address``
+    runner = JobRunner(store, {}, webhook_retries=1, resolve_url=lambda _: (address, None))
+    runner._deliver(store.get(job_id))
+    return store.get(job_id)['webhook_status']
+
+
+def test_delivery_connects_to_the_checked_address():
+    hook = RecordingServer()
+    try:
+        # hooks.invalid never resolves, so this only arrives if the checked address is used
+        assert deliver(f'http://hooks.invalid:{hook.port}/done', '127.0.0.1') == 'delivered'
+        assert hook.hosts == [f'hooks.invalid:{hook.port}']
+    finally:
+        hook.close()
+
+
+def test_delivery_does_not_follow_redirects():
+    internal = RecordingServer()
+    public = RecordingServer(status=302, location=f'http://127.0.0.1:{internal.port}/latest/meta-data/')
+    try:
+        status = deliver(f'http://hooks.invalid:{public.port}/done', '127.0.0.1')
+        assert status.startswith('failed: HTTP 302')
+        assert len(public.hosts) == 1
+        assert internal.hosts == []
+    finally:
+        public.close()
+        internal.close()
+
+
+def test_importing_the_app_starts_no_job_workers():
+    script = ('import threading, app\n'
+              'assert app.job_stats() is None\n'
+              'assert not [t for t in threading.enumerate() if t.name.startswith("job-worker")]\n')
+    model_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DEMO_MODE='true', JOBS_DB=':memory:')
+    subprocess.run([sys.executable, '-c', script], cwd=model_dir, env=env, check=True, timeout=60)
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import questionbank
+from app import SurveyAIService
+from cache import ResultCache
+from questionbank import QuestionBank, text_hash
+
+
+class RepeatingUpstream:
+    """Fake upstream that ignores existingQuestions and answers with the same questions every time"""
+
+    def __init__(self, questions):
+        self.questions = questions
+        self.calls = 0
+
+    def post_json(self, payload, **kwargs):
+        self.calls += 1
+        content = json.dumps({'questions': self.questions})
+        return {'choices': [{'message': {'content': content}, 'finish_reason': 'stop'}]}
+
+
+def requirements(**overrides):
+    return dict({
+        'title': 'What do you like most about our service',
+        'description': 'Quarterly feedback',
+        'category': 'feedback',
+        'targetAudience': 'customers',
+        'numberOfQuestions': 8,
+        'questionTypes': ['multiple-choice', 'text']
+    }, **overrides)
+
+
+@pytest.fixture(scope='module')
+def service():
+    return SurveyAIService(bank=QuestionBank())
+
+
+def assert_full_and_unique(result, count):
+    texts = [question['text'] for question in result['questions']]
+    assert len(texts) == count
+    assert len({text_hash(text) for text in texts}) == count
+    assert [question['order'] for question in result['questions']] == list(range(count))
+
+
+def test_demo_retrieval_always_fills_the_survey(service):
+    for seed in range(200):
+        result = service.generate_questions_retrieval(requirements(seed=seed), use_ai=False)
+        assert result['success']
+        assert_full_and_unique(result, 8)
+
+
+def test_generated_duplicates_are_dropped_and_refilled(service):
+    retrieved = service.retrieve_questions(requirements(numberOfQuestions=5))
+    assert retrieved
+    # Everything the model sends back is already in the survey, or repeated
+    repeats = [dict(question) for question in retrieved] + [dict(retrieved[0])]
+    ai_service = SurveyAIService(upstream=RepeatingUpstream(repeats), bank=QuestionBank())
+
+    result = ai_service.generate_questions_retrieval(requirements(numberOfQuestions=5))
+    assert result['success']
+    assert_full_and_unique(result, 5)
+    assert result['method'].endswith('+demo_template')
+
+
+def test_retrieval_stays_in_the_requested_language(service):
+    service.templates.preload('en')
+    english = {text_hash(hit['text']) for hit in service.bank.search('like most service', limit=50,
+                                                                      language='en')}
+    assert english
+    result = service.generate_questions_retrieval(requirements(language='hi', seed=1), use_ai=False)
+    assert result['retrieved'] == 0
+    assert not {text_hash(question['text']) for question in result['questions']} & english
+    assert_full_and_unique(result, 8)
+    for hit in service.bank.search('like most service', limit=50, language='hi'):
+        assert hit['language'] == 'hi'
+
+
+def test_retrieval_stays_in_the_requested_category(service):
+    title = 'Which marketing channel do you prefer'
+    retrieved = service.retrieve_questions(requirements(category='marketing', title=title))
+    assert [question['text'] for question in retrieved] == ['Which marketing channel do you prefer?']
+    assert not service.retrieve_questions(requirements(category='feedback', title=title))
+
+
+def test_saved_bank_keeps_languages(tmp_path):
+    path = str(tmp_path / 'bank.qb')
+    bank = QuestionBank(path)
+    bank.add('How satisfied are you with delivery?', 'text', 'feedback', language='en')
+    bank.add('How satisfied are you with delivery speed overall?', 'text', 'feedback', language='fr')
+    assert bank.save()
+
+    reloaded = QuestionBank(path)
+    hits = reloaded.search('satisfied delivery', language='fr')
+    assert [hit['language'] for hit in hits] == ['fr']
+    assert len(reloaded.search('satisfied delivery')) == 2
+
+
+def test_non_latin_questions_are_searchable(service):
+    text = 'हमारी सेवा में आपको सबसे अच्छा क्या लगता है?'
+    service.templates.preload('hi')
+    hits = service.bank.search('सेवा अच्छा लगता', language='hi')
+    assert hits and hits[0]['text'] == text
+
+    retrieved = service.retrieve_questions(requirements(language='hi', title='हमारी सेवा में सबसे अच्छा क्या लगता है',
+                                                        questionTypes=['text']))
+    assert retrieved and retrieved[0]['text'] == text
+
+
+def test_save_runs_off_the_request_path(tmp_path):
+    path = str(tmp_path / 'bank.qb')
+    bank = QuestionBank(path, save_interval=0)
+    assert bank.add_questions([{'text': 'How satisfied are you with checkout?', 'type': 'text'}]) == 1
+    deadline = time.monotonic() + 5
+    while bank.stats()['unsaved'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert bank.stats() == {'questions': 1, 'unsaved': 0, 'persistent': True}
+    assert len(QuestionBank(path)) == 1
+
+
+def test_questions_added_during_a_save_are_kept(tmp_path, monkeypatch):
+    path = str(tmp_path / 'bank.qb')
+    bank = QuestionBank(path)
+    bank.add('How satisfied are you with checkout?', 'text', 'feedback', language='en')
+    write = questionbank.BankSegment.write
+
+    def write_while_adding(*args):
+        # The bank lock is free while the segment is built and written
+        assert bank.add('How satisfied are you with delivery?', 'text', 'feedback', language='en')
+        write(*args)
+
+    monkeypatch.setattr(questionbank.BankSegment, 'write', staticmethod(write_while_adding))
+    assert bank.save()
+    assert bank.stats()['unsaved'] == 1
+    assert {hit['text'] for hit in bank.search('satisfied')} == {'How satisfied are you with checkout?',
+                                                                 'How satisfied are you with delivery?'}
+    assert not bank.add('How satisfied are you with checkout?', 'text')
+
+    monkeypatch.setattr(questionbank.BankSegment, 'write', staticmethod(write))
+    assert bank.save()
+    assert len(QuestionBank(path)) == 2
+
+
+def test_only_one_process_writes_a_bank_file(tmp_path):
+    path = str(tmp_path / 'bank.qb')
+    writer, other = QuestionBank(path), QuestionBank(path)
+    writer.add('How satisfied are you with checkout?', 'text')
+    assert writer.save()
+    other.add('How satisfied are you with delivery?', 'text')
+    assert not other.save()
+    assert other.search('satisfied delivery')
+    assert [hit['text'] for hit in QuestionBank(path).search('satisfied')] == ['How satisfied are you with checkout?']
+
+
+class SlowCache(ResultCache):
+    """Cache whose lookups block like a slow SQLite read"""
+
+    def get(self, key):
+        time.sleep(0.2)
+        return super().get(key)
+
+
+class AsyncRepeatingUpstream(RepeatingUpstream):
+    async def post_json(self, payload, **kwargs):
+        return RepeatingUpstream.post_json(self, payload, **kwargs)
+
+
+def test_async_generation_keeps_blocking_work_off_the_event_loop():
+    upstream = AsyncRepeatingUpstream([{'type': 'text', 'text': 'What would you change about checkout?'}])
+    service = SurveyAIService(cache=SlowCache(), bank=QuestionBank())
+
+    async def scenario():
+        gaps, last = [], time.perf_counter()
+        generation = asyncio.ensure_future(service.generate_questions_retrieval_async(requirements(), upstream))
+        while not generation.done():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+        return generation.result(), max(gaps)
+
+    result, longest_stall = asyncio.run(scenario())
+    assert result['success'] and upstream.calls == 1
+    assert longest_stall < 0.15
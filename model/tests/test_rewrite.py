@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import app as service
+from rewrite import RuleEngine, load_rules
+from streaming import iter_ndjson
+
+
+@pytest.fixture
+def engine():
+    return RuleEngine()
+
+
+@pytest.mark.parametrize('goals', ['clarity', ['clarity'], ' clarity ', 'clarity,engagement', ('clarity', 42)])
+def test_goal_names_are_normalized(engine, goals):
+    text, fired = engine.apply('How do we utilize feedback', goals)
+    assert text == 'How do we use feedback?'
+    assert [rule['name'] for rule in fired] == ['utilize-to-use', 'question-mark']
+
+
+@pytest.mark.parametrize('goals', [None, 7, {'clarity': True}, ['brevity'], [['clarity']], ''])
+def test_unknown_or_malformed_goals_fire_nothing(engine, goals):
+    assert engine.apply('Please utilize this', goals) == ('Please utilize this', [])
+
+
+def test_compiled_patterns_are_bounded_by_the_rule_goals(engine):
+    for i in range(1000):
+        engine.apply('text', ['clarity', f'made-up-{i}'])
+        engine.apply('text', [f'made-up-{i}'])
+    assert len(engine._compiled) == 2
+
+
+def test_improve_route_accepts_a_single_goal_string():
+    body = {'questions': [{'text': 'Please utilize the portal', 'type': 'text'}], 'improvementGoals': 'clarity'}
+    result = service.app.test_client().post('/improve-questions', json=body).get_json()
+    assert result['improvedQuestions'][0]['improved'] == 'Please use the portal?'
+
+
+def test_every_rule_kind_fires_in_one_pass(engine):
+    text, fired = engine.apply('Please utilize and utilize to facilitate', ['clarity', 'engagement'])
+    assert text == 'use and use to help?'
+    assert [rule['name'] for rule in fired] == ['strip-please', 'utilize-to-use', 'facilitate-to-help',
+                                                'question-mark']
+
+
+def test_suffix_rule_does_not_repeat_the_mark(engine):
+    assert engine.apply('Is it clear?', ['clarity']) == ('Is it clear?', [])
+
+
+def test_rules_load_from_a_file(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps([
+        {'name': 'kindly', 'goal': 'brevity', 'kind': 'prefix', 'match': 'Kindly ', 'replace': ''},
+        {'name': 'in-order-to', 'goal': 'brevity', 'kind': 'phrase', 'match': 'in order to', 'replace': 'to'}
+    ]))
+    engine = RuleEngine(load_rules(str(path)))
+    assert engine.apply('Kindly rate us in order to help', ['brevity'])[0] == 'rate us to help'
+    assert engine.apply('Kindly rate us', ['clarity']) == ('Kindly rate us', [])
+
+
+@pytest.mark.parametrize('rule', [
+    {'name': 'x', 'kind': 'regex', 'match': 'a'},
+    {'kind': 'phrase', 'match': 'a'},
+    {'name': 'x', 'kind': 'phrase'},
+])
+def test_invalid_rules_are_rejected(tmp_path, rule):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps([rule]))
+    with pytest.raises(ValueError):
+        load_rules(str(path))
+
+
+def test_ndjson_improvement_streams_each_question_and_a_summary():
+    lines = [json.dumps({'text': 'Please utilize the portal', 'type': 'text'}), 'not json',
+             json.dumps({'text': 'Rate us?', 'type': 'rating-scale'})]
+    response = service.app.test_client().post('/improve-questions?goals=clarity,engagement',
+                                              data='\n'.join(lines) + '\n',
+                                              content_type='application/x-ndjson')
+    events = [record for _, record in iter_ndjson(response.get_data().splitlines())]
+    assert [event['event'] for event in events] == ['question', 'error', 'question', 'done']
+    assert events[0]['question']['improved'] == 'use the portal?'
+    assert events[1]['index'] == 1
+    assert events[3]['count'] == 2 and events[3]['failed'] == 1
+    assert events[3]['rulesFired'] == {'strip-please': 1, 'utilize-to-use': 1, 'question-mark': 1}
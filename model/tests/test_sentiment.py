@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pytest
+
+import app as service
+from sentiment import SentimentAnalyzer, SentimentModel, load_lexicon
+from streaming import iter_ndjson
+
+
+ANSWERS = [
+    {'questionId': 'q1', 'text': 'The staff were friendly and helpful'},
+    {'questionId': 'q1', 'text': 'Terrible service, the office was dirty'},
+    {'questionId': 'q2', 'text': 'The bus comes at nine'},
+    'Not good at all',
+    {'questionId': 'q2', 'answer': 'Great, thanks!'}
+]
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+def test_answers_are_labelled_by_sign():
+    result = SentimentAnalyzer().analyze(ANSWERS)
+    assert [r['label'] for r in result['results']] == ['positive', 'negative', 'neutral', 'negative', 'positive']
+    assert all(-1 < r['score'] < 1 for r in result['results'])
+    assert result['errors'] == []
+
+
+def test_negation_flips_and_damps_the_following_words():
+    model = SentimentModel()
+    plain, negated, far = model.score(['good', 'not good', 'not one two three good'])
+    assert plain > 0 > negated
+    assert abs(negated) < plain
+    assert far == plain
+
+
+def test_results_are_aggregated_per_question():
+    questions = SentimentAnalyzer().analyze(ANSWERS)['questions']
+    assert set(questions) == {'q1', 'q2', 'unassigned'}
+    assert (questions['q1']['count'], questions['q1']['positive'], questions['q1']['negative']) == (2, 1, 1)
+    assert questions['unassigned']['negative'] == 1
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 100])
+def test_streamed_batches_match_the_whole_array(batch_size):
+    analyzer = SentimentAnalyzer()
+    whole = analyzer.analyze(ANSWERS)
+    events = list(analyzer.stream(enumerate(ANSWERS), batch_size))
+    assert [data for event, data in events if event == 'answer'] == whole['results']
+    event, summary = events[-1]
+    assert event == 'done' and summary['count'] == len(ANSWERS)
+    assert summary['questions'] == whole['questions']
+
+
+def test_lexicon_loads_from_a_file(tmp_path):
+    path = tmp_path / 'lexicon.tsv'
+    path.write_text('# word\tweight\nsplendid\t2.5\nMeh\t-0.9\n\n')
+    lexicon = load_lexicon(str(path))
+    assert lexicon == {'splendid': 2.5, 'meh': -0.9}
+    scores = SentimentModel(lexicon).score(['splendid', 'meh', 'good'])
+    assert scores[0] > 0 > scores[1] and scores[2] == 0
+
+
+def test_sentiment_route_scores_an_array(client):
+    result = client.post('/analyze/sentiment', json={'answers': ANSWERS + [42]}).get_json()
+    assert len(result['results']) == len(ANSWERS)
+    assert result['errors'] == [{'index': 5, 'message': 'Answer must be a string or an object with a text field'}]
+
+
+@pytest.mark.parametrize('body', [{'answers': []}, {'answers': 'good'}, {}])
+def test_sentiment_route_requires_answers(client, body):
+    response = client.post('/analyze/sentiment', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_sentiment_route_streams_ndjson(client):
+    body = '\n'.join(json.dumps(answer) for answer in ANSWERS) + '\nnot json\n'
+    response = client.post('/analyze/sentiment', data=body, content_type='application/x-ndjson')
+    events = [record for _, record in iter_ndjson(response.get_data().splitlines())]
+    assert [event['event'] for event in events] == ['answer'] * len(ANSWERS) + ['error', 'done']
+    assert [event['index'] for event in events[:-1]] == list(range(len(ANSWERS) + 1))
+    assert events[-1]['count'] == len(ANSWERS) + 1
+    np.testing.assert_allclose([event['score'] for event in events[:len(ANSWERS)]],
+                               [r['score'] for r in SentimentAnalyzer().analyze(ANSWERS)['results']])
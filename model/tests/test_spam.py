@@ -0,0 +1,82 @@
+import pytest
+
+import app as service
+
+
+QUESTIONS = [{'id': 'q1', 'type': 'rating-scale'}, {'id': 'q2', 'type': 'multiple-choice', 'options': ['a', 'b']}]
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+def response(*answers, duration=90):
+    return {'answers': list(answers), 'metadata': {'duration': duration}}
+
+
+def spam_request(**overrides):
+    body = {
+        'responses': [response({'questionId': 'q1', 'value': 4}, {'questionId': 'q2', 'value': 'a'})] * 3,
+        'questions': QUESTIONS
+    }
+    body.update(overrides)
+    return body
+
+
+@pytest.mark.parametrize('threshold', ['abc', '0.5', True, -0.1, 1.5, [0.5]])
+def test_invalid_threshold_is_rejected(client, threshold):
+    result = client.post('/analyze/spam', json=spam_request(threshold=threshold))
+    assert result.status_code == 400
+    assert result.get_json() == {'success': False, 'message': 'threshold must be a number between 0 and 1'}
+
+
+@pytest.mark.parametrize('body', [
+    spam_request(responses=[response('q1=4')]),
+    spam_request(responses=[dict(response(), answers={'q1': 4})]),
+    spam_request(responses=[dict(response(), metadata='fast')]),
+    spam_request(questions=[{'id': 'q2', 'options': 'a,b'}]),
+    spam_request(questions='q1'),
+])
+def test_malformed_responses_and_questions_are_rejected(client, body):
+    result = client.post('/analyze/spam', json=body)
+    assert result.status_code == 400
+    assert result.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('threshold', [None, 0, 1, 0.25])
+def test_valid_threshold_is_applied(client, threshold):
+    result = client.post('/analyze/spam', json=spam_request(threshold=threshold))
+    assert result.status_code == 200
+    assert result.get_json()['success']
+
+
+def submission(ip=None, user_agent=None, at='2025-01-02T10:00:00Z'):
+    metadata = {'duration': 90, 'submitTime': at}
+    if ip:
+        metadata['ip'] = ip
+    if user_agent:
+        metadata['userAgent'] = user_agent
+    return {'answers': [{'questionId': 'q1', 'value': 4}, {'questionId': 'q2', 'value': 'a'}], 'metadata': metadata}
+
+
+def duplicate_flags(*responses):
+    results = service.spam_detector.analyze(list(responses), QUESTIONS)['results']
+    return [result['duplicateOf'] for result in results]
+
+
+def test_identical_answers_alone_are_not_duplicates():
+    assert duplicate_flags(submission(), submission(), submission('10.0.0.1'), submission('10.0.0.2')) == \
+        [None, None, None, None]
+
+
+def test_identical_answers_from_the_same_source_are_duplicates():
+    assert duplicate_flags(submission('10.0.0.1'), submission('10.0.0.2'), submission('10.0.0.1')) == [None, None, 0]
+    assert duplicate_flags(submission(user_agent='bot/1.0'), submission('10.0.0.9', 'bot/1.0')) == [None, 0]
+
+
+def test_repeats_outside_the_window_are_not_duplicates():
+    later = submission('10.0.0.1', at='2025-01-02T12:00:00Z')
+    soon = submission('10.0.0.1', at='2025-01-02T10:20:00Z')
+    assert duplicate_flags(submission('10.0.0.1'), later) == [None, None]
+    assert duplicate_flags(submission('10.0.0.1'), soon) == [None, 0]
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import app as service
+from questionbank import QuestionBank
+from streaming import QuestionStreamParser, iter_ndjson
+
+
+QUESTIONS = [
+    {'type': 'text', 'text': 'What does "good service" {mean} to you?'},
+    {'type': 'multiple-choice', 'text': 'Which [channel] did you use?', 'options': ['Web', 'Phone \\ fax']},
+    {'type': 'rating-scale', 'text': 'How likely are you to return?'}
+]
+SURVEY = {
+    'title': 'What do you like most about our service',
+    'description': 'Quarterly feedback',
+    'category': 'feedback',
+    'targetAudience': 'customers',
+    'numberOfQuestions': 3
+}
+
+
+def feed_in_chunks(text, size):
+    parser = QuestionStreamParser()
+    found = []
+    for start in range(0, len(text), size):
+        found.extend(parser.feed(text[start:start + size]))
+    return found
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 1000])
+def test_questions_parse_the_same_however_the_reply_is_split(size):
+    assert feed_in_chunks(json.dumps({'questions': QUESTIONS}), size) == QUESTIONS
+
+
+@pytest.mark.parametrize('reply', [
+    json.dumps(QUESTIONS),
+    '```json\n' + json.dumps({'questions': QUESTIONS}, indent=2) + '\n```',
+    json.dumps({'title': 'ignored {', 'questions': QUESTIONS}),
+])
+def test_bare_arrays_fences_and_other_keys_are_handled(reply):
+    assert feed_in_chunks(reply, 5) == QUESTIONS
+
+
+def test_each_question_is_emitted_when_its_object_closes():
+    parser = QuestionStreamParser()
+    first = json.dumps(QUESTIONS[0])
+    assert parser.feed('{"questions": [' + first[:-1]) == []
+    assert parser.feed('}, {"type": "te') == [QUESTIONS[0]]
+    assert parser.feed('xt", "text": "Anything else?"}]}') == [{'type': 'text', 'text': 'Anything else?'}]
+
+
+def test_nested_objects_stay_inside_their_question():
+    question = {'type': 'text', 'text': 'Why?', 'validation': {'min': 1, 'rules': [{'max': 5}]}}
+    assert feed_in_chunks(json.dumps({'questions': [question]}), 4) == [question]
+
+
+class StreamingUpstream:
+    """Fake upstream streaming QUESTIONS in small deltas"""
+
+    def stream_chat(self, payload, usage=None):
+        content = json.dumps({'questions': QUESTIONS})
+        for start in range(0, len(content), 11):
+            yield content[start:start + 11]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(service, 'ai_service', service.SurveyAIService(upstream=StreamingUpstream(),
+                                                                       bank=QuestionBank()))
+    monkeypatch.setattr(service, 'use_demo_generation', lambda: False)
+    return service.app.test_client()
+
+
+def test_ndjson_stream_emits_questions_then_done(client):
+    response = client.post('/generate-survey?stream=ndjson', json=SURVEY)
+    assert response.mimetype == 'application/x-ndjson'
+    events = [record for _, record in iter_ndjson(response.get_data().splitlines())]
+    assert [event['event'] for event in events] == ['question'] * 3 + ['done']
+    assert [event['question']['text'] for event in events[:3]] == [question['text'] for question in QUESTIONS]
+    assert [event['question']['order'] for event in events[:3]] == [0, 1, 2]
+    assert events[-1]['method'] == 'ai_api_cache_miss' and events[-1]['count'] == 3
+
+
+def test_sse_stream_is_chosen_from_the_accept_header(client):
+    response = client.post('/generate-survey', json=SURVEY, headers={'Accept': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    frames = response.get_data(as_text=True).strip().split('\n\n')
+    assert [frame.split('\n')[0] for frame in frames] == ['event: question'] * 3 + ['event: done']
+    assert json.loads(frames[0].split('\n')[1][len('data: '):])['question'] == dict(QUESTIONS[0], order=0)
@@ -0,0 +1,68 @@
+import pytest
+
+import app as service
+from suggestions import SuggestionCatalog
+
+
+ENTRIES = [
+    {'category': 'feedback', 'audiences': ['customers'], 'title': 'Customer Satisfaction'},
+    {'category': 'feedback', 'audiences': ['employees'], 'title': 'Employee Feedback'},
+    {'category': 'feedback', 'title': 'General Feedback'},
+    {'category': 'research', 'title': 'Market Research'}
+]
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+def titles(suggestions):
+    return [suggestion['title'] for suggestion in suggestions]
+
+
+def test_lookup_filters_by_audience():
+    catalog = SuggestionCatalog(ENTRIES)
+    assert titles(catalog.lookup('feedback', 'customers')) == ['Customer Satisfaction', 'General Feedback']
+    assert titles(catalog.lookup('feedback', 'students')) == ['General Feedback']
+    assert titles(catalog.lookup('feedback')) == ['Customer Satisfaction', 'Employee Feedback', 'General Feedback']
+    assert titles(catalog.lookup('unknown')) == titles(catalog.lookup('feedback'))
+
+
+def test_etag_tracks_the_catalog_contents():
+    catalog = SuggestionCatalog(ENTRIES)
+    body, etag = catalog.response_for('feedback', 'customers')
+    assert catalog.response_for('feedback', 'customers') == (body, etag)
+    assert catalog.response_for('feedback', 'employees')[1] != etag
+    changed = SuggestionCatalog(ENTRIES[:1] + [dict(ENTRIES[1], title='Staff Pulse')] + ENTRIES[2:])
+    # Same body for this lookup, but any catalog change invalidates every ETag
+    changed_body, changed_etag = changed.response_for('feedback', 'customers')
+    assert changed_body == body and changed_etag != etag
+
+
+def test_response_carries_strong_etag_and_cache_control(client):
+    response = client.get('/suggestions?category=feedback&targetAudience=customers')
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.headers['Cache-Control'] == f'public, max-age={service.SUGGESTIONS_MAX_AGE}'
+    assert response.get_json()['success'] is True
+
+
+def test_unchanged_request_is_answered_with_304(client):
+    first = client.get('/suggestions?category=feedback&targetAudience=customers')
+    again = client.get('/suggestions?category=feedback&targetAudience=customers',
+                       headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+
+    other = client.get('/suggestions?category=feedback&targetAudience=employees',
+                       headers={'If-None-Match': first.headers['ETag']})
+    assert other.status_code == 200
+
+
+def test_category_is_required(client):
+    response = client.get('/suggestions')
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'message': 'Category parameter is required'}
@@ -0,0 +1,152 @@
+import json
+import os
+
+import pytest
+
+import templates
+from app import SurveyAIService, app
+from questionbank import QuestionBank
+from templates import TemplatePacks
+
+
+def write_pack(root, language, category, questions, options=None):
+    directory = os.path.join(root, language)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'{category}.json'), 'w', encoding='utf-8') as f:
+        json.dump({'questions': questions}, f, ensure_ascii=False)
+    if options is not None:
+        with open(os.path.join(directory, 'options.json'), 'w', encoding='utf-8') as f:
+            json.dump(options, f)
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def root(tmp_path):
+    write_pack(str(tmp_path), 'en', 'feedback', {'text': ['How was your visit?']},
+               {'agreement': ['Agree', 'Disagree']})
+    write_pack(str(tmp_path), 'en', 'marketing', {'text': ['Where did you hear about us?']})
+    return str(tmp_path)
+
+
+def test_service_start_loads_no_packs():
+    service = SurveyAIService(bank=QuestionBank())
+    assert service.templates.stats() == {'loaded': []}
+    assert len(service.bank) == 0
+
+    service.retrieve_questions({'title': 'Which marketing channel do you prefer', 'category': 'marketing'})
+    assert service.templates.stats() == {'loaded': ['en/marketing']}
+    assert service.bank.search('marketing channel', category='marketing')
+
+
+def test_reloaded_pack_is_indexed_again(root):
+    loads = []
+    bank = QuestionBank()
+
+    def index(language, category, entries):
+        loads.append((language, category))
+        for question_type, questions in entries.items():
+            for text, options in questions:
+                bank.add(text, question_type, category, language=language, source='template')
+
+    packs = TemplatePacks(root, reload_interval=0, on_load=index)
+    packs.preload('en', 'feedback')
+    packs.preload('en', 'feedback')
+    assert loads == [('en', 'feedback')]
+
+    path = os.path.join(root, 'en', 'feedback.json')
+    write_pack(root, 'en', 'feedback', {'text': ['How was your visit?', 'How friendly was our staff?']})
+    bump_mtime(path)
+    packs.preload('en', 'feedback')
+    assert loads == [('en', 'feedback')] * 2
+    assert [hit['text'] for hit in bank.search('friendly staff', language='en')] == ['How friendly was our staff?']
+
+
+def test_preload_without_category_loads_the_whole_language(root):
+    packs = TemplatePacks(root)
+    packs.preload('en')
+    assert packs.stats() == {'loaded': ['en/feedback', 'en/marketing']}
+    packs.preload('../etc')
+    packs.preload(['en'])
+    assert packs.stats() == {'loaded': ['en/feedback', 'en/marketing']}
+
+
+def test_options_resolve_from_named_sets_inline_lists_and_keywords(root):
+    write_pack(root, 'en', 'feedback', {'multiple-choice': [
+        {'text': 'Do you agree?', 'options': 'agreement'},
+        {'text': 'Pick one', 'options': ['Red', 'Blue']},
+        'How would you rate the visit?'
+    ]}, {'agreement': ['Agree', 'Disagree'], 'satisfaction': ['Happy', 'Unhappy']})
+    entries = TemplatePacks(root).entries('en', 'feedback')
+    assert entries['multiple-choice'] == (('Do you agree?', ('Agree', 'Disagree')), ('Pick one', ('Red', 'Blue')),
+                                          ('How would you rate the visit?', ('Happy', 'Unhappy')))
+
+
+def test_lookups_fall_back_to_the_default_language_then_category(root):
+    write_pack(root, 'hi', 'feedback', {'text': ['आपकी यात्रा कैसी रही?']})
+    packs = TemplatePacks(root)
+    assert packs.entries('hi', 'marketing') == packs.entries('en', 'marketing')
+    assert packs.entries('ta', 'feedback') == packs.entries('en', 'feedback')
+    assert packs.entries('hi', 'unknown') == {'text': (('आपकी यात्रा कैसी रही?', None),)}
+    assert packs.entries('../en', 'feedback') == packs.entries('en', 'feedback')
+    assert packs.stats() == {'loaded': ['en/feedback', 'en/marketing', 'hi/feedback']}
+
+
+def test_packs_are_rechecked_only_after_the_reload_interval(root, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(templates.time, 'monotonic', lambda: now[0])
+    packs = TemplatePacks(root, reload_interval=5)
+    assert packs.entries('en', 'marketing') == {'text': (('Where did you hear about us?', None),)}
+
+    path = os.path.join(root, 'en', 'marketing.json')
+    write_pack(root, 'en', 'marketing', {'text': ['Which ad did you see?']})
+    bump_mtime(path)
+    now[0] += 4
+    assert packs.entries('en', 'marketing') == {'text': (('Where did you hear about us?', None),)}
+    now[0] += 2
+    assert packs.entries('en', 'marketing') == {'text': (('Which ad did you see?', None),)}
+
+
+def test_changed_option_sets_recompile_the_pack(root):
+    write_pack(root, 'en', 'feedback', {'multiple-choice': [{'text': 'Do you agree?', 'options': 'agreement'}]})
+    packs = TemplatePacks(root, reload_interval=0)
+    assert packs.entries('en', 'feedback')['multiple-choice'][0][1] == ('Agree', 'Disagree')
+
+    options = os.path.join(root, 'en', 'options.json')
+    with open(options, 'w', encoding='utf-8') as f:
+        json.dump({'agreement': ['Yes', 'No', 'Unsure']}, f)
+    bump_mtime(options)
+    assert packs.entries('en', 'feedback')['multiple-choice'][0][1] == ('Yes', 'No', 'Unsure')
+
+
+def test_demo_generation_uses_the_requested_language():
+    service = SurveyAIService(bank=QuestionBank())
+    hindi = TemplatePacks().entries('hi', 'feedback')
+    texts = {text for entries in hindi.values() for text, _ in entries}
+    result = service.generate_questions_demo({'category': 'feedback', 'language': 'hi', 'numberOfQuestions': 6})
+    assert result['success'] and len(result['questions']) == 6
+    assert all(question['text'] in texts for question in result['questions'])
+
+def test_seeded_bulk_generation_is_reproducible():
+    service = SurveyAIService(bank=QuestionBank())
+    requirements = {'category': 'feedback', 'numberOfQuestions': 4, 'seed': 'launch-week'}
+    first = service.generate_surveys_demo(requirements, 3)
+    again = service.generate_surveys_demo(requirements, 3)
+    assert first['success'] and len(first['surveys']) == 3
+    assert first['surveys'] == again['surveys']
+    assert all(len(survey) == 4 for survey in first['surveys'])
+
+
+@pytest.mark.parametrize('seed', [{'a': 1}, [1, 2], 1.5, True, 'x' * 65])
+def test_non_scalar_seed_is_rejected(seed):
+    body = {'title': 'Seeded', 'description': 'Quarterly feedback', 'category': 'feedback',
+            'targetAudience': 'customers', 'seed': seed}
+    response = app.test_client().post('/generate-survey', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {
+        'success': False,
+        'message': 'seed must be an integer or a string of at most 64 characters'
+    }
@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import pytest
+
+import app as service
+from templates import TemplatePacks
+from translation import LLMTranslator, SurveyTranslator, TranslationError, TranslationMemory
+
+
+SURVEY = [
+    {'type': 'multiple-choice', 'text': 'Which service did you use?', 'options': ['Water', 'Power']},
+    {'type': 'text', 'text': 'Anything else?'}
+]
+OTHER = [
+    {'type': 'multiple-choice', 'text': 'Which service was slowest?', 'options': ['Water', 'Power', 'Roads']}
+]
+
+
+class FakeBackend:
+    """Translator backend that upper-cases strings and records each batch it is sent"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def translate(self, texts, source, target):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise TranslationError('backend down')
+        return [text.upper() for text in texts]
+
+    async def translate_async(self, texts, source, target, upstream):
+        return self.translate(texts, source, target)
+
+
+def test_strings_are_deduplicated_and_sent_in_one_batch():
+    backend = FakeBackend()
+    translator = SurveyTranslator(TranslationMemory(), backend)
+    result = translator.translate([SURVEY, OTHER], 'en', 'hi')
+    assert backend.batches == [['Which service did you use?', 'Water', 'Power', 'Anything else?',
+                                'Which service was slowest?', 'Roads']]
+    assert result['surveys'][1][0] == dict(OTHER[0], text='WHICH SERVICE WAS SLOWEST?',
+                                           options=['WATER', 'POWER', 'ROADS'])
+    assert result['stats'] == {'strings': 8, 'uniqueStrings': 6, 'fromMemory': 0, 'translated': 6,
+                               'untranslated': 0}
+
+
+def test_repeat_requests_are_served_from_memory():
+    backend = FakeBackend()
+    translator = SurveyTranslator(TranslationMemory(), backend)
+    translator.translate([SURVEY], 'en', 'hi')
+    result = translator.translate([OTHER], 'en', 'hi')
+    assert backend.batches[1] == ['Which service was slowest?', 'Roads']
+    assert result['stats']['fromMemory'] == 2
+    assert translator.translate([SURVEY], 'en', 'ta')['stats']['fromMemory'] == 0
+
+
+def test_misses_are_split_into_max_batch_calls():
+    backend = FakeBackend()
+    translator = SurveyTranslator(TranslationMemory(), backend, max_batch=2)
+    translator.translate([SURVEY, OTHER], 'en', 'hi')
+    assert [len(batch) for batch in backend.batches] == [2, 2, 2]
+
+
+def test_failed_batches_come_back_untranslated_and_are_not_remembered():
+    translator = SurveyTranslator(TranslationMemory(), FakeBackend(fail=True))
+    result = translator.translate([SURVEY], 'en', 'hi')
+    assert result['surveys'] == [SURVEY]
+    assert result['untranslated'] == ['Which service did you use?', 'Water', 'Power', 'Anything else?']
+    assert translator.memory.get_many('en', 'hi', ['Water']) == {}
+
+
+def test_template_vocabulary_needs_no_backend_call():
+    packs = TemplatePacks()
+    english = packs.entries('en', 'feedback')['multiple-choice'][0]
+    hindi = packs.entries('hi', 'feedback')['multiple-choice'][0]
+    backend = FakeBackend()
+    translator = SurveyTranslator(TranslationMemory(), backend, packs)
+    question = {'type': 'multiple-choice', 'text': english[0], 'options': list(english[1])}
+    result = translator.translate([[question]], 'en', 'hi')
+    assert backend.batches == []
+    assert result['surveys'][0][0] == dict(question, text=hindi[0], options=list(hindi[1]))
+    assert translator.stats()['seededPairs'] == ['en-hi']
+
+
+def test_backend_translations_persist_across_restarts(tmp_path):
+    path = str(tmp_path / 'memory.db')
+    SurveyTranslator(TranslationMemory(db_path=path), FakeBackend()).translate([SURVEY], 'en', 'hi')
+    backend = FakeBackend()
+    result = SurveyTranslator(TranslationMemory(db_path=path), backend).translate([SURVEY], 'en', 'hi')
+    assert backend.batches == []
+    assert result['stats']['fromMemory'] == 4
+
+
+def test_async_translation_matches_the_sync_path():
+    sync = SurveyTranslator(TranslationMemory(), FakeBackend()).translate([SURVEY, OTHER], 'en', 'hi')
+    backend = FakeBackend()
+    translator = SurveyTranslator(TranslationMemory(), backend)
+    result = asyncio.run(translator.translate_async([SURVEY, OTHER], 'en', 'hi', upstream=None))
+    assert result == sync
+    assert len(backend.batches) == 1
+
+
+class ReplyUpstream:
+    def __init__(self, translations):
+        self.translations = translations
+        self.payloads = []
+
+    def post_json(self, payload, **kwargs):
+        self.payloads.append(payload)
+        content = json.dumps({'translations': self.translations})
+        return {'choices': [{'message': {'content': content}}]}
+
+
+def test_llm_translator_sends_one_call_and_checks_the_reply():
+    upstream = ReplyUpstream(['पानी', 'बिजली'])
+    assert LLMTranslator(upstream).translate(['Water', 'Power'], 'en', 'hi') == ['पानी', 'बिजली']
+    assert json.loads(upstream.payloads[0]['messages'][1]['content'])['strings'] == ['Water', 'Power']
+    with pytest.raises(TranslationError):
+        LLMTranslator(ReplyUpstream(['पानी'])).translate(['Water', 'Power'], 'en', 'hi')
+
+
+@pytest.mark.parametrize('body', [
+    {'questions': SURVEY},
+    {'questions': SURVEY, 'targetLanguage': 'en'},
+    {'questions': SURVEY, 'targetLanguage': 'hindi!'},
+    {'surveys': [], 'targetLanguage': 'hi'},
+])
+def test_translate_route_validates_the_request(body):
+    response = service.app.test_client().post('/translate-survey', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_translate_route_returns_surveys_in_request_shape(monkeypatch):
+    translator = SurveyTranslator(TranslationMemory(), FakeBackend())
+    monkeypatch.setattr(service.ai_service, 'translator', translator)
+    monkeypatch.setattr(service, 'TRANSLATOR', 'llm')
+    monkeypatch.setattr(service, 'use_demo_generation', lambda: False)
+    body = {'surveys': [{'id': 's1', 'questions': SURVEY}], 'targetLanguage': 'hi'}
+    result = service.app.test_client().post('/translate-survey', json=body).get_json()
+    assert result['surveys'][0]['id'] == 's1'
+    assert result['surveys'][0]['questions'][1]['text'] == 'ANYTHING ELSE?'
+    assert (result['sourceLanguage'], result['targetLanguage'], result['untranslated']) == ('en', 'hi', [])
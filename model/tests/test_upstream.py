@@ -0,0 +1,196 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import valid_survey_reply
+from hedging import AsyncHedgedUpstream, Backend
+from translation import valid_translation_reply
+from upstream import AsyncUpstreamClient, CircuitBreaker, UpstreamClient, UpstreamError
+
+
+REPLY = {'choices': [{'message': {'content': '{"questions": []}'}}]}
+
+
+def half_open_breaker():
+    """A breaker that has tripped and whose next allow() is the half-open probe"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    return breaker
+
+
+def async_client(delay, breaker=None, reply=REPLY):
+    async def handler(request):
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json=reply)
+
+    client = AsyncUpstreamClient('http://upstream.test/v1/chat/completions', 'key', max_retries=0, breaker=breaker)
+    client.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_breaker_allows_a_single_half_open_probe():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_is_released():
+    breaker = half_open_breaker()
+    client = async_client(5, breaker)
+
+    async def scenario():
+        task = asyncio.ensure_future(client.post_json({}))
+        await asyncio.sleep(0.05)
+        assert not breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert breaker.allow()
+
+
+def test_hedge_loser_holding_the_probe_does_not_wedge_its_breaker():
+    slow_breaker = half_open_breaker()
+    slow = Backend('slow', async_client(5, slow_breaker))
+    fast = Backend('fast', async_client(0))
+    upstream = AsyncHedgedUpstream([slow, fast], initial_delay=0.05, min_delay=0.01)
+    # The slow backend is always the primary, so it takes the probe and loses the race
+    upstream.candidates = lambda: [slow, fast]
+
+    async def scenario():
+        body = await upstream.post_json({})
+        await asyncio.sleep(0)
+        await upstream.aclose()
+        return body
+
+    assert asyncio.run(scenario()) == REPLY
+    assert slow_breaker.allow()
+
+
+def test_unexpected_error_settles_the_probe_as_a_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker._opened_at -= 60
+    client = UpstreamClient('http://upstream.test/v1/chat/completions', 'key', max_retries=0, breaker=breaker)
+
+    def broken_post(*args, **kwargs):
+        raise ValueError('malformed request')
+
+    client.session.post = broken_post
+    with pytest.raises(ValueError):
+        client.post_json({})
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+
+def chat_reply(content):
+    return {'choices': [{'message': {'content': content}}]}
+
+
+def test_reply_validators_are_specific_to_the_call():
+    assert valid_survey_reply(chat_reply('{"questions": []}'))
+    assert not valid_survey_reply(chat_reply('{}'))
+    assert not valid_survey_reply(chat_reply('{"questions": "x"}'))
+    assert not valid_survey_reply(chat_reply('{"translations": []}'))
+    assert valid_translation_reply(chat_reply('{"translations": ["a"]}'))
+    assert not valid_translation_reply(chat_reply('{"questions": []}'))
+    assert not valid_translation_reply(chat_reply('not json'))
+
+
+def test_unusable_reply_loses_the_hedge():
+    empty = Backend('empty', async_client(0, reply=chat_reply('{}')))
+    good = Backend('good', async_client(0.05))
+    upstream = AsyncHedgedUpstream([empty, good], initial_delay=1, min_delay=0.01)
+    upstream.candidates = lambda: [empty, good]
+
+    async def scenario():
+        try:
+            return await upstream.post_json({}, validate=valid_survey_reply)
+        finally:
+            await upstream.aclose()
+
+    assert asyncio.run(scenario()) == REPLY
+    assert upstream.hedge_wins == 1
+
+
+def test_unusable_reply_from_a_single_backend_is_an_upstream_error():
+    client = async_client(0)
+
+    async def scenario():
+        try:
+            return await client.post_json({}, validate=valid_translation_reply)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(scenario())
+    assert error.value.reason == 'invalid_reply'
+
+
+def test_stream_asks_for_and_collects_the_usage_chunk():
+    sent = []
+
+    async def handler(request):
+        sent.append(json.loads(request.content))
+        body = ('data: {"choices": [{"delta": {"content": "{\\"questions\\": []}"}}]}\n\n'
+                'data: {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 4}}\n\n'
+                'data: [DONE]\n\n')
+        return httpx.Response(200, text=body, headers={'Content-Type': 'text/event-stream'})
+
+    client = AsyncUpstreamClient('http://upstream.test/v1/chat/completions', 'key', max_retries=0)
+    client.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    usage = {}
+
+    async def scenario():
+        try:
+            return [delta async for delta in client.stream_chat({'messages': []}, usage=usage)]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == ['{"questions": []}']
+    assert sent[0]['stream_options'] == {'include_usage': True}
+    assert usage == {'prompt_tokens': 10, 'completion_tokens': 4}
+
+
+def test_cancelled_hedge_loser_is_neither_a_success_nor_a_failure():
+    slow = Backend('slow', async_client(5))
+    fast = Backend('fast', async_client(0))
+    upstream = AsyncHedgedUpstream([slow, fast], initial_delay=0.05, min_delay=0.01)
+    upstream.candidates = lambda: [slow, fast]
+
+    async def scenario():
+        try:
+            return await upstream.post_json({})
+        finally:
+            await asyncio.sleep(0)
+            await upstream.aclose()
+
+    assert asyncio.run(scenario()) == REPLY
+    stats = slow.stats.snapshot()
+    assert (stats['requests'], stats['failures'], stats['cancelled']) == (0, 0, 1)
+    assert fast.stats.snapshot()['requests'] == 1
+
+
+def test_hedges_fan_out_to_max_hedges_backends():
+    backends = [Backend(name, async_client(delay)) for name, delay in (('a', 5), ('b', 5), ('c', 0), ('d', 0))]
+
+    async def race(max_hedges):
+        upstream = AsyncHedgedUpstream(backends, initial_delay=0.05, min_delay=0.01, max_hedges=max_hedges)
+        upstream.candidates = lambda: list(backends)
+        try:
+            return await asyncio.wait_for(upstream.post_json({}), timeout=1), upstream.hedges
+        finally:
+            await asyncio.sleep(0)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(race(1))
+    assert asyncio.run(race(2)) == (REPLY, 2)
+    assert backends[2].stats.snapshot()['requests'] == 1
+    assert backends[3].stats.snapshot()['requests'] == 0
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from budget import NON_ENGLISH_FACTOR, estimate_tokens
+
+
+TRANSLATE_SYSTEM_PROMPT = (
+    'You translate survey questions and answer options. The user sends a JSON object '
+    '{"source": "<language code>", "target": "<language code>", "strings": [...]}. Reply with ONLY '
+    '{"translations": [...]}: one translation per input string, in the same order, keeping the '
+    'wording plain and neutral, as a survey for the general public would be written.'
+)
+
+
+class TranslationError(Exception):
+    pass
+
+
+def valid_translation_reply(ai_response):
+    """Whether a chat completion body's content is a JSON object with a translations list"""
+    try:
+        reply = json.loads(ai_response['choices'][0]['message']['content'])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+    return isinstance(reply, dict) and isinstance(reply.get('translations'), list)
+
+
+class TranslationMemory:
+    """(source, target, text) -> translation: an in-process LRU over an optional SQLite file"""
+
+    def __init__(self, max_entries=50000, db_path=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS translation_memory '
+                '(source TEXT NOT NULL, target TEXT NOT NULL, text TEXT NOT NULL, translation TEXT NOT NULL, '
+                'origin TEXT, created_at REAL NOT NULL, PRIMARY KEY (source, target, text))'
+            )
+            self._db.commit()
+
+    def get_many(self, source, target, texts):
+        """Return {text: translation} for the texts already in memory"""
+        found = {}
+        missing = []
+        with self._lock:
+            for text in texts:
+                translation = self._entries.get((source, target, text))
+                if translation is not None:
+                    self._entries.move_to_end((source, target, text))
+                    found[text] = translation
+                else:
+                    missing.append(text)
+
+            if self._db is not None:
+                # Bounded IN lists keep well under SQLite's bound-parameter limit
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._db.execute(
+                        'SELECT text, translation FROM translation_memory WHERE source = ? AND target = ? '
+                        f'AND text IN ({",".join("?" * len(chunk))})',
+                        (source, target, *chunk)
+                    ).fetchall()
+                    for text, translation in rows:
+                        found[text] = translation
+                        self._store_memory((source, target, text), translation)
+
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, source, target, translations, origin=None, persist=True):
+        with self._lock:
+            for text, translation in translations.items():
+                self._store_memory((source, target, text), translation)
+            if persist and self._db is not None and translations:
+                now = time.time()
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO translation_memory (source, target, text, translation, origin, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(source, target, text, translation, origin, now) for text, translation in translations.items()]
+                )
+                self._db.commit()
+
+    def _store_memory(self, key, translation):
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'persistent': self._db is not None
+        }
+
+
+class LLMTranslator:
+    """Translator backend that sends a whole batch of strings as one chat completion"""
+
+    def __init__(self, upstream, model='gpt-3.5-turbo', max_tokens_cap=4096):
+        self.upstream = upstream
+        self.model = model
+        self.max_tokens_cap = max_tokens_cap
+
+    def _payload(self, texts, source, target):
+        expected = sum(estimate_tokens(text) for text in texts) * NON_ENGLISH_FACTOR
+        return {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': TRANSLATE_SYSTEM_PROMPT},
+                {'role': 'user', 'content': json.dumps({'source': source, 'target': target, 'strings': texts},
+                                                       ensure_ascii=False)}
+            ],
+            'max_tokens': min(self.max_tokens_cap, int(expected * 1.5) + 4 * len(texts) + 16),
+            'temperature': 0
+        }
+
+    def _parse(self, ai_response, texts):
+        try:
+            translations = json.loads(ai_response['choices'][0]['message']['content'])['translations']
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise TranslationError(f'Unparseable translation reply: {e}')
+        if not isinstance(translations, list) or len(translations) != len(texts) \
+                or not all(isinstance(translation, str) and translation for translation in translations):
+            raise TranslationError('Translation reply does not match the requested strings')
+        return translations
+
+    def translate(self, texts, source, target):
+        payload = self._payload(texts, source, target)
+        return self._parse(self.upstream.post_json(payload, validate=valid_translation_reply), texts)
+
+    async def translate_async(self, texts, source, target, upstream):
+        payload = self._payload(texts, source, target)
+        return self._parse(await upstream.post_json(payload, validate=valid_translation_reply), texts)
+
+
+def survey_strings(questions):
+    """Yield every translatable string of a question list: texts, then options"""
+    for question in questions:
+        yield question['text']
+        for option in question.get('options') or ():
+            yield option
+
+
+def translate_question(question, translations):
+    translated = dict(question, text=translations.get(question['text'], question['text']))
+    if question.get('options'):
+        translated['options'] = [translations.get(option, option) for option in question['options']]
+    return translated
+
+
+class SurveyTranslator:
+    """Translates question lists through a translation memory, batching only the misses.
+
+    Strings are deduplicated across every survey in a request, looked up in
+    the memory (seeded per language pair with the template packs' aligned
+    translations), and the remainder is sent to ``backend`` in batches of up
+    to ``max_batch`` strings — normally a single call. Strings the backend
+    could not translate are returned unchanged and listed as untranslated.
+    """
+
+    def __init__(self, memory, backend=None, packs=None, max_batch=200):
+        self.memory = memory
+        self.backend = backend
+        self.packs = packs
+        self.max_batch = max_batch
+        self._seeded = set()
+        self._lock = threading.Lock()
+        self.backend_calls = 0
+
+    def _seed(self, source, target):
+        """Load the template vocabulary for a language pair into memory once per process"""
+        if self.packs is None or (source, target) in self._seeded:
+            return
+        with self._lock:
+            if (source, target) in self._seeded:
+                return
+            pairs = dict(self.packs.aligned_pairs(source, target))
+            self.memory.put_many(source, target, pairs, origin='template', persist=False)
+            self._seeded.add((source, target))
+
+    def _prepare(self, surveys, source, target):
+        self._seed(source, target)
+        unique = list(dict.fromkeys(text for questions in surveys for text in survey_strings(questions)))
+        found = self.memory.get_many(source, target, unique)
+        return unique, found, [text for text in unique if text not in found]
+
+    def _batches(self, misses):
+        for start in range(0, len(misses), self.max_batch):
+            yield misses[start:start + self.max_batch]
+
+    def _store(self, source, target, batch, translations, translated):
+        self.backend_calls += 1
+        batch_translations = dict(zip(batch, translations))
+        self.memory.put_many(source, target, batch_translations, origin='backend')
+        translated.update(batch_translations)
+
+    def _result(self, surveys, unique, found, translated, misses):
+        translations = dict(found, **translated)
+        untranslated = [text for text in misses if text not in translated]
+        return {
+            'surveys': [[translate_question(question, translations) for question in questions]
+                        for questions in surveys],
+            'untranslated': untranslated,
+            'stats': {
+                'strings': sum(len(list(survey_strings(questions))) for questions in surveys),
+                'uniqueStrings': len(unique),
+                'fromMemory': len(found),
+                'translated': len(translated),
+                'untranslated': len(untranslated)
+            }
+        }
+
+    def translate(self, surveys, source, target, use_backend=True):
+        unique, found, misses = self._prepare(surveys, source, target)
+        translated = {}
+        if misses and use_backend and self.backend is not None:
+            for batch in self._batches(misses):
+                try:
+                    self._store(source, target, batch, self.backend.translate(batch, source, target), translated)
+                except Exception as e:
+                    print(f"Translation backend error: {str(e)}")
+        return self._result(surveys, unique, found, translated, misses)
+
+    async def translate_async(self, surveys, source, target, upstream, use_backend=True):
+        """Async variant of translate used by the ASGI serving mode; memory lookups and writes run in a thread"""
+        unique, found, misses = await asyncio.to_thread(self._prepare, surveys, source, target)
+        translated = {}
+        if misses and use_backend and self.backend is not None:
+            for batch in self._batches(misses):
+                try:
+                    translations = await self.backend.translate_async(batch, source, target, upstream)
+                    await asyncio.to_thread(self._store, source, target, batch, translations, translated)
+                except Exception as e:
+                    print(f"Translation backend error: {str(e)}")
+        return self._result(surveys, unique, found, translated, misses)
+
+    def stats(self):
+        return dict(self.memory.stats(), backendCalls=self.backend_calls,
+                    seededPairs=sorted(f'{source}-{target}' for source, target in self._seeded))
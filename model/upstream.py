@@ -0,0 +1,455 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+except ImportError:  # only needed for the ASGI serving mode
+    httpx = None
+
+from metrics import UPSTREAM_CONNECT, UPSTREAM_LATENCY
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Raised when the upstream API call fails after all retries.
+
+    ``reason`` is a short machine-readable cause (``timeout``, ``connection``,
+    ``http_503``, ...) used to label fallback metrics.
+    """
+
+    def __init__(self, message, status_code=None, reason=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason or (f'http_{status_code}' if status_code else 'upstream_error')
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised when the circuit breaker is rejecting upstream calls"""
+
+    def __init__(self, message):
+        super().__init__(message, reason='circuit_open')
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Return True if a call may go upstream right now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: let exactly one probe through
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release(self):
+        """Give back a half-open probe that ended without an outcome (the call was cancelled)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'consecutiveFailures': self._failures
+        }
+
+
+def check_reply(body, validate):
+    """Return ``body``, raising when ``validate`` finds it unusable"""
+    if validate is not None and not validate(body):
+        raise UpstreamError('Upstream reply is not usable for this request', reason='invalid_reply')
+    return body
+
+
+def stream_payload(payload):
+    """Chat payload for a streamed reply that ends with a usage chunk"""
+    return dict(payload, stream=True, stream_options={'include_usage': True})
+
+
+def collect_usage(chunk, usage):
+    if usage is not None and isinstance(chunk.get('usage'), dict):
+        usage.update(chunk['usage'])
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _TimedConnectMixin:
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        UPSTREAM_CONNECT.observe(time.perf_counter() - started)
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that records how long each new pooled connection takes to open"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+def _connect_tracer():
+    """httpx trace hook timing connection setup up to the first request headers"""
+    started = []
+
+    async def trace(event_name, info):
+        if event_name == 'connection.connect_tcp.started':
+            started.append(time.perf_counter())
+        elif started and event_name.endswith('.send_request_headers.started'):
+            UPSTREAM_CONNECT.observe(time.perf_counter() - started.pop())
+
+    return trace
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client for an OpenAI-compatible chat completions endpoint.
+
+    Calls share one pooled ``requests.Session``, are retried with full-jitter
+    exponential backoff (honouring ``Retry-After``) within an overall deadline,
+    and are short-circuited by a ``CircuitBreaker`` while the upstream is down.
+    """
+
+    def __init__(self, url, api_key, timeout=30, connect_timeout=3.05, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=20, breaker=None):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post_json(self, payload, cancel=None, validate=None):
+        """POST ``payload`` upstream and return the decoded JSON body.
+
+        Setting the ``cancel`` event stops further retries (used by hedged calls).
+        A body that ``validate`` rejects raises ``UpstreamError`` (``invalid_reply``).
+        """
+        return check_reply(self._send(payload, cancel=cancel).json(), validate)
+
+    def stream_chat(self, payload, usage=None):
+        """POST a streaming chat completion and yield content deltas as they arrive.
+
+        Retries only cover establishing the stream; once the first byte has been
+        read a broken stream is surfaced to the caller as ``UpstreamError``.
+        The final ``usage`` chunk, when the upstream sends one, is copied into
+        the ``usage`` dict.
+        """
+        response = self._send(stream_payload(payload), stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                collect_usage(chunk, usage)
+                choices = chunk.get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f'Upstream stream interrupted: {e}', reason='stream_interrupted')
+        finally:
+            response.close()
+
+    def _send(self, payload, stream=False, cancel=None):
+        if not self.breaker.allow():
+            raise CircuitOpenError('Upstream circuit is open')
+        try:
+            return self._send_with_retries(payload, stream, cancel)
+        except UpstreamError:
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Interrupted mid-call: free a half-open probe so the breaker can close again
+            self.breaker.release()
+            raise
+
+    def _send_with_retries(self, payload, stream, cancel):
+        deadline = time.monotonic() + self.timeout
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt and cancel is not None and cancel.is_set():
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = self.session.post(
+                    self.url,
+                    json=payload,
+                    timeout=(min(self.connect_timeout, remaining), remaining),
+                    stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                reason = 'timeout' if isinstance(e, requests.Timeout) else 'connection'
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, outcome=reason)
+                last_error = UpstreamError(f'Upstream request failed: {e}', reason=reason)
+            else:
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, outcome=f'http_{response.status_code}')
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response
+
+                last_error = UpstreamError(
+                    f'Upstream returned {response.status_code}: {response.text[:200]}',
+                    status_code=response.status_code
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # Client errors are our fault, not the upstream's; don't trip the breaker
+                    self.breaker.record_success()
+                    raise last_error
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt == self.max_retries:
+                break
+
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error or UpstreamError('Upstream deadline exceeded', reason='deadline')
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncUpstreamClient:
+    """asyncio counterpart of ``UpstreamClient`` built on a pooled ``httpx.AsyncClient``.
+
+    Retry, ``Retry-After`` and circuit-breaker behaviour are identical; only the
+    transport differs, so an ASGI worker can keep thousands of calls in flight.
+    Create and ``aclose`` it inside the serving event loop.
+    """
+
+    def __init__(self, url, api_key, timeout=30, connect_timeout=3.05, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=100, breaker=None):
+        if httpx is None:
+            raise RuntimeError('httpx is required for AsyncUpstreamClient')
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json'
+            }
+        )
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def post_json(self, payload, validate=None):
+        """POST ``payload`` upstream and return the decoded JSON body"""
+        response = await self._send(payload)
+        return check_reply(response.json(), validate)
+
+    async def stream_chat(self, payload, usage=None):
+        """POST a streaming chat completion and yield content deltas as they arrive"""
+        response = await self._send(stream_payload(payload), stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                collect_usage(chunk, usage)
+                choices = chunk.get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+        except httpx.TransportError as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f'Upstream stream interrupted: {e}', reason='stream_interrupted')
+        finally:
+            await response.aclose()
+
+    async def _send(self, payload, stream=False):
+        if not self.breaker.allow():
+            raise CircuitOpenError('Upstream circuit is open')
+        try:
+            return await self._send_with_retries(payload, stream)
+        except UpstreamError:
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (a hedge that lost, a client that disconnected): without this a
+            # half-open probe would stay claimed and the breaker would never close again
+            self.breaker.release()
+            raise
+
+    async def _send_with_retries(self, payload, stream):
+        deadline = time.monotonic() + self.timeout
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                request = self.session.build_request(
+                    'POST',
+                    self.url,
+                    json=payload,
+                    timeout=httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining)),
+                    extensions={'trace': _connect_tracer()}
+                )
+                response = await self.session.send(request, stream=stream)
+            except httpx.TransportError as e:
+                reason = 'timeout' if isinstance(e, httpx.TimeoutException) else 'connection'
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, outcome=reason)
+                last_error = UpstreamError(f'Upstream request failed: {e}', reason=reason)
+            else:
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, outcome=f'http_{response.status_code}')
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response
+
+                await response.aread()
+                await response.aclose()
+                last_error = UpstreamError(
+                    f'Upstream returned {response.status_code}: {response.text[:200]}',
+                    status_code=response.status_code
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.breaker.record_success()
+                    raise last_error
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt == self.max_retries:
+                break
+
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            if time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error or UpstreamError('Upstream deadline exceeded', reason='deadline')
+
+    async def aclose(self):
+        await self.session.aclose()